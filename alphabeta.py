@@ -4,17 +4,27 @@ import json
 from cortex import Cortex
 import time
 import numpy as np
-from scipy.signal import butter, lfilter
+from filter_bank import StreamingFilterBank, channel_indexes
 
 class LiveEEGMetrics():
-    def __init__(self, app_client_id, app_client_secret, **kwargs):
-        self.c = Cortex(app_client_id, app_client_secret, debug_mode=True, **kwargs)
+    def __init__(self, app_client_id='', app_client_secret='', cortex=None, **kwargs):
+        # cortex: a Cortex-like object to use instead, e.g. a ReplayCortex of replay.py
+        if cortex is not None:
+            self.c = cortex
+        else:
+            self.c = Cortex(app_client_id, app_client_secret, debug_mode=True, **kwargs)
         self.c.bind(create_session_done=self.on_create_session_done)
         self.c.bind(query_profile_done=self.on_query_profile_done)
         self.c.bind(load_unload_profile_done=self.on_load_unload_profile_done)
-        self.c.bind(new_eeg_data=self.on_new_eeg_data)
+        self.c.bind(new_data_labels=self.on_new_data_labels)
+        # the filters keep their state between blocks, so every sample must be filtered in order
+        self.c.set_eeg_block_mode(block_size=16)
+        self.c.bind(new_eeg_block=self.on_new_eeg_block)
         self.c.bind(inform_error=self.on_inform_error)
+        self.filter_bank = None
+        self.channels = None
         self.ws_connection = None  # WebSocket connection
+        self.ws_loop = None  # event loop of the WebSocket connection
 
     def start(self, profile_name, headsetId=''):
         if profile_name == '':
@@ -53,17 +63,14 @@ class LiveEEGMetrics():
         else:
             print(f"Failed to load profile '{self.profile_name}'.")
 
-    def butter_bandpass(self, lowcut, highcut, fs, order=5):
-        nyquist = 0.5 * fs
-        low = lowcut / nyquist
-        high = highcut / nyquist
-        b, a = butter(order, [low, high], btype='band')
-        return b, a
-
-    def bandpass_filter(self, data, lowcut, highcut, fs, order=5):
-        b, a = self.butter_bandpass(lowcut, highcut, fs, order=order)
-        y = lfilter(b, a, data)
-        return y
+    def on_new_data_labels(self, *args, **kwargs):
+        data = kwargs.get('data')
+        if data['streamName'] == 'eeg':
+            self.channels = channel_indexes(data['labels'])
+            # sampled at 128 Hz if the headset does not tell
+            fs = getattr(self.c, 'headset_settings', {}).get('eegRate', 128)
+            # Alpha band (8-13 Hz), Beta band (13-30 Hz)
+            self.filter_bank = StreamingFilterBank(fs, len(self.channels), {'alpha': (8.0, 13.0), 'beta': (13.0, 30.0)})
 
     async def send_data(self, alpha, beta):
         if self.ws_connection:
@@ -73,30 +80,23 @@ class LiveEEGMetrics():
             })
             await self.ws_connection.send(data)
 
-    def on_new_eeg_data(self, *args, **kwargs):
+    def on_new_eeg_block(self, *args, **kwargs):
         data = kwargs.get('data')
-        if data and 'eeg' in data:
-            eeg_signals = np.array(data['eeg'])
-
-            # Assuming data is sampled at 128 Hz
-            fs = 128
-
-            # Alpha band (8-13 Hz)
-            alpha_band = self.bandpass_filter(eeg_signals, 8.0, 13.0, fs)
-
-            # Beta band (13-30 Hz)
-            beta_band = self.bandpass_filter(eeg_signals, 13.0, 30.0, fs)
+        if data and 'eeg' in data and self.filter_bank is not None:
+            eeg_signals = data['eeg'][:, self.channels]
 
-            # Compute band powers
-            alpha_power = np.mean(alpha_band ** 2)
-            beta_power = np.mean(beta_band ** 2)
+            # Compute band powers of the block, averaged over the channels
+            powers = self.filter_bank.band_power(eeg_signals)
+            alpha_power = float(np.mean(powers['alpha']))
+            beta_power = float(np.mean(powers['beta']))
 
             # Print to console for debugging
             print(f"Alpha Band Power: {alpha_power}")
             print(f"Beta Band Power: {beta_power}")
 
-            # Send data to front end via WebSocket
-            asyncio.run(self.send_data(alpha_power, beta_power))
+            # Send data to front end via WebSocket, on the event loop which owns the connection
+            if self.ws_loop is not None:
+                asyncio.run_coroutine_threadsafe(self.send_data(alpha_power, beta_power), self.ws_loop)
 
     def on_inform_error(self, *args, **kwargs):
         error_data = kwargs.get('error_data')
@@ -106,6 +106,7 @@ class LiveEEGMetrics():
 
 async def websocket_handler(websocket, path):
     live_metrics.ws_connection = websocket  # Assign WebSocket connection
+    live_metrics.ws_loop = asyncio.get_running_loop()
     await websocket.recv()  # Keep connection alive
 
 def run_live_eeg_metrics():
@@ -0,0 +1,559 @@
+import asyncio
+import itertools
+import json
+import ssl
+import warnings
+
+import websockets #'pip install websockets' for install
+
+from cortex import (CortexError, get_data_labels, json_loads, parse_stream_data,
+                    ACCESS_RIGHT_GRANTED, CORTEX_STOP_ALL_STREAMS,
+                    HEADSET_CONNECTED, HEADSET_SCANNING_FINISHED)
+
+CORTEX_URL = "wss://localhost:6868"
+
+class AsyncCortex():
+    """
+    An asyncio client for the Emotiv Cortex API.
+
+    Every request is a coroutine which resolves with the result of the request or
+    raises CortexError if Cortex responds with an error. Stream data is consumed
+    with 'async for' over stream().
+
+    Attributes
+    ----------
+    session_id : str
+        id of the session created by create_session()
+    headset_id : str
+        id of the wanted headset
+    data_labels : dict
+        labels of each subscribed stream, keyed by stream name
+
+    Methods
+    -------
+    open():
+        To open the websocket and start reading messages from Cortex
+    close():
+        To close the websocket
+    call(method, params):
+        To send a request and wait for its result
+    do_prepare_steps():
+        check access right -> authorize -> connect headset -> create session
+    stream(*streams):
+        To iterate over data of one or more subscribed streams
+    wait_for_warning(*codes):
+        To wait for a warning from Cortex
+    """
+    def __init__(self, client_id, client_secret, debug_mode=False, **kwargs):
+        self.session_id = ''
+        self.headset_id = ''
+        self.record_id = ''
+        self.auth = ''
+        self.debug = debug_mode
+        self.debit = 10
+        self.license = ''
+        self.url = CORTEX_URL
+        self.data_labels = {}
+        self.ws = None
+
+        if client_id == '':
+            raise ValueError('Empty your_app_client_id. Please fill in your_app_client_id before running the example.')
+        self.client_id = client_id
+
+        if client_secret == '':
+            raise ValueError('Empty your_app_client_secret. Please fill in your_app_client_secret before running the example.')
+        self.client_secret = client_secret
+
+        for key, value in kwargs.items():
+            if key == 'license':
+                self.license = value
+            elif key == 'debit':
+                self.debit = value
+            elif key == 'headset_id':
+                self.headset_id = value
+            elif key == 'url':
+                self.url = value
+
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._streams = []
+        self._warning_waiters = []
+        self._reader_task = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self, ssl_context=None):
+        """
+        To open the websocket to Cortex and start reading messages
+
+        Parameters
+        ----------
+        ssl_context : ssl.SSLContext, optional
+            As default, the Emotiv self-signed certificate at ../certificates/rootCA.pem is required.
+        """
+        if ssl_context is None and self.url.startswith('wss://'):
+            ssl_context = ssl.create_default_context(cafile="../certificates/rootCA.pem")
+
+        self.ws = await websockets.connect(self.url, ssl=ssl_context, max_size=None)
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_messages())
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self._reader_task is not None:
+            await self._reader_task
+
+    async def call(self, method, params=None):
+        """
+        To send a JSON-RPC request to Cortex
+
+        Returns
+        -------
+        result: the result of the response
+
+        Raises
+        ------
+        CortexError
+            if Cortex responds with an error
+        """
+        req_id = next(self._ids)
+        request = {"jsonrpc": "2.0", "id": req_id, "method": method}
+        if params is not None:
+            request['params'] = params
+
+        if self.debug:
+            print(method + ' request \n', json.dumps(request, indent=4))
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[req_id] = future
+        try:
+            await self.ws.send(json.dumps(request))
+            return await future
+        finally:
+            self._pending.pop(req_id, None)
+
+    def stream(self, *streams, maxsize=0):
+        """
+        To iterate over the data of subscribed streams
+
+            async for stream_name, data in c.stream('eeg', 'met'):
+                ...
+
+        The data has the same format as the data emitted by Cortex, for example
+        {'eeg': [...], 'time': 1627457774.5166}. If no stream is given, all streams are delivered.
+
+        Parameters
+        ----------
+        streams : str
+            names of streams, for example 'eeg', 'mot'
+        maxsize : int, optional
+            maximum number of undelivered frames. When it is reached the oldest frame is dropped
+            so that a slow consumer never stalls the reading of the websocket. 0 means unbounded.
+        """
+        data_stream = CortexStream(self, streams, maxsize)
+        self._streams.append(data_stream)
+        return data_stream
+
+    async def wait_for_warning(self, *codes):
+        """
+        To wait for the next warning whose code is in codes, or any warning if no code is given
+
+        Returns
+        -------
+        warning: dict
+            the warning object, for example {'code': 30, 'message': {...}}
+        """
+        future = asyncio.get_running_loop().create_future()
+        waiter = (codes, future)
+        self._warning_waiters.append(waiter)
+        try:
+            return await future
+        finally:
+            if waiter in self._warning_waiters:
+                self._warning_waiters.remove(waiter)
+
+    async def _read_messages(self):
+        try:
+            async for message in self.ws:
+                recv_dic = json_loads(message)
+                if 'sid' in recv_dic:
+                    self._handle_stream_data(recv_dic)
+                elif 'result' in recv_dic or 'error' in recv_dic:
+                    self._handle_response(recv_dic)
+                elif 'warning' in recv_dic:
+                    self._handle_warning(recv_dic['warning'])
+                elif self.debug:
+                    print(recv_dic)
+        except websockets.exceptions.ConnectionClosed as e:
+            print('on_close')
+            print(e)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('Cortex connection closed'))
+            for data_stream in self._streams:
+                data_stream._put(None)
+
+    def _handle_response(self, recv_dic):
+        if self.debug:
+            print(recv_dic)
+
+        future = self._pending.get(recv_dic.get('id'))
+        if future is None or future.done():
+            print('No handling for response of request ' + str(recv_dic.get('id')))
+        elif 'error' in recv_dic:
+            future.set_exception(CortexError(recv_dic['error']))
+        else:
+            future.set_result(recv_dic['result'])
+
+    def _handle_warning(self, warning_dic):
+        if self.debug:
+            print(warning_dic)
+
+        warning_code = warning_dic['code']
+        if warning_code == CORTEX_STOP_ALL_STREAMS:
+            if warning_dic['message']['sessionId'] == self.session_id:
+                self.session_id = ''
+
+        for codes, future in list(self._warning_waiters):
+            if (len(codes) == 0 or warning_code in codes) and not future.done():
+                future.set_result(warning_dic)
+
+    def _handle_stream_data(self, recv_dic):
+        stream_name, data = parse_stream_data(recv_dic)
+        if stream_name is None:
+            print(recv_dic)
+            return
+        for data_stream in self._streams:
+            if len(data_stream.streams) == 0 or stream_name in data_stream.streams:
+                data_stream._put((stream_name, data))
+
+    """
+        Prepare steps include:
+        Step 1: check access right. If user has not granted for the application, requestAccess will be called
+        Step 2: authorize: to generate a Cortex access token which is required parameter of many APIs
+        Step 3: Connect a headset. If no wanted headet is set, the first headset in the list will be connected.
+        Step 4: Create a working session with the connected headset
+        Returns
+        -------
+        session_id: str
+        """
+
+    async def do_prepare_steps(self):
+        result = await self.has_access_right()
+        if result['accessGranted'] != True:
+            result = await self.request_access()
+            if result['accessGranted'] != True:
+                # wait approve from Emotiv Launcher
+                warnings.warn(result['message'])
+                await self.wait_for_warning(ACCESS_RIGHT_GRANTED)
+
+        await self.authorize()
+        # After successful authorization, the app will call the API refresh headset list for the first time
+        await self.refresh_headset_list()
+        await self.wait_headset_connected()
+        await self.create_session()
+        return self.session_id
+
+    async def wait_headset_connected(self, retry_interval=3):
+        """
+        To connect the wanted headset, or the first headset in the list if no headset is wanted,
+        and wait until its status is 'connected'
+        """
+        while True:
+            headset_list = await self.query_headset()
+            for ele in headset_list:
+                print('headsetId: {0}, status: {1}, connected_by: {2}'.format(ele['id'], ele['status'], ele['connectedBy']))
+
+            if len(headset_list) == 0:
+                warnings.warn("No headset available. Please turn on a headset.")
+            else:
+                if self.headset_id == '':
+                    # set first headset is default headset
+                    self.headset_id = headset_list[0]['id']
+
+                status = ''
+                for ele in headset_list:
+                    if ele['id'] == self.headset_id:
+                        status = ele['status']
+
+                if status == 'connected':
+                    return
+                elif status == 'discovered':
+                    await self.connect_headset(self.headset_id)
+                elif status == '':
+                    warnings.warn("Can not found the headset " + self.headset_id + ". Please make sure the id is correct.")
+                elif status != 'connecting':
+                    warnings.warn('query_headset resp: Invalid connection status ' + status)
+
+            # wait for the headset to connect or a scanning to finish before querying again
+            try:
+                warning = await asyncio.wait_for(
+                    self.wait_for_warning(HEADSET_CONNECTED, HEADSET_SCANNING_FINISHED), retry_interval)
+                if warning['code'] == HEADSET_SCANNING_FINISHED:
+                    await self.refresh_headset_list()
+            except asyncio.TimeoutError:
+                pass
+
+    async def has_access_right(self):
+        return await self.call("hasAccessRight", {
+            "clientId": self.client_id,
+            "clientSecret": self.client_secret
+        })
+
+    async def request_access(self):
+        return await self.call("requestAccess", {
+            "clientId": self.client_id,
+            "clientSecret": self.client_secret
+        })
+
+    async def authorize(self):
+        result = await self.call("authorize", {
+            "clientId": self.client_id,
+            "clientSecret": self.client_secret,
+            "license": self.license,
+            "debit": self.debit
+        })
+        print("Authorize successfully.")
+        self.auth = result['cortexToken']
+        return result
+
+    async def get_cortex_info(self):
+        return await self.call("getCortexInfo")
+
+    async def query_headset(self):
+        return await self.call("queryHeadsets", {})
+
+    async def connect_headset(self, headset_id):
+        return await self.call("controlDevice", {
+            "command": "connect",
+            "headset": headset_id
+        })
+
+    async def disconnect_headset(self):
+        result = await self.call("controlDevice", {
+            "command": "disconnect",
+            "headset": self.headset_id
+        })
+        print("Disconnect headset " + self.headset_id)
+        self.headset_id = ''
+        return result
+
+    async def refresh_headset_list(self):
+        return await self.call("controlDevice", {"command": "refresh"})
+
+    async def create_session(self):
+        if self.session_id != '':
+            warnings.warn("There is existed session " + self.session_id)
+            return None
+
+        result = await self.call("createSession", {
+            "cortexToken": self.auth,
+            "headset": self.headset_id,
+            "status": "active"
+        })
+        self.session_id = result['id']
+        print("The session " + self.session_id + " is created successfully.")
+        return result
+
+    async def close_session(self):
+        result = await self.call("updateSession", {
+            "cortexToken": self.auth,
+            "session": self.session_id,
+            "status": "close"
+        })
+        self.session_id = ''
+        return result
+
+    async def sub_request(self, streams):
+        """
+        To subscribe to one or more data streams. The labels of subscribed streams are stored in data_labels.
+
+        Returns
+        -------
+        result: dict
+            with 'success' and 'failure' lists of streams
+        """
+        result = await self.call("subscribe", {
+            "cortexToken": self.auth,
+            "session": self.session_id,
+            "streams": streams
+        })
+        for stream in result['success']:
+            stream_name = stream['streamName']
+            print('The data stream '+ stream_name + ' is subscribed successfully.')
+            # com and fac data carry their own field names
+            if stream_name != 'com' and stream_name != 'fac':
+                self.data_labels[stream_name] = get_data_labels(stream_name, stream['cols'])
+
+        for stream in result['failure']:
+            print('The data stream '+ stream['streamName'] + ' is subscribed unsuccessfully. Because: ' + stream['message'])
+        return result
+
+    async def unsub_request(self, streams):
+        return await self.call("unsubscribe", {
+            "cortexToken": self.auth,
+            "session": self.session_id,
+            "streams": streams
+        })
+
+    async def query_profile(self):
+        return await self.call("queryProfile", {"cortexToken": self.auth})
+
+    async def get_current_profile(self):
+        return await self.call("getCurrentProfile", {
+            "cortexToken": self.auth,
+            "headset": self.headset_id
+        })
+
+    async def setup_profile(self, profile_name, status):
+        return await self.call("setupProfile", {
+            "cortexToken": self.auth,
+            "headset": self.headset_id,
+            "profile": profile_name,
+            "status": status
+        })
+
+    async def train_request(self, detection, action, status):
+        return await self.call("training", {
+            "cortexToken": self.auth,
+            "detection": detection,
+            "session": self.session_id,
+            "action": action,
+            "status": status
+        })
+
+    async def create_record(self, title, **kwargs):
+        if len(title) == 0:
+            raise ValueError('Empty record_title. Please fill the record_title before running script.')
+
+        params_val = {"cortexToken": self.auth, "session": self.session_id, "title": title}
+        params_val.update(kwargs)
+        result = await self.call("createRecord", params_val)
+        self.record_id = result['record']['uuid']
+        return result['record']
+
+    async def stop_record(self):
+        result = await self.call("stopRecord", {
+            "cortexToken": self.auth,
+            "session": self.session_id
+        })
+        return result['record']
+
+    async def export_record(self, folder, stream_types, export_format, record_ids, version, **kwargs):
+        if len(folder) == 0:
+            raise ValueError('Invalid folder parameter. Please set a writable destination folder for exporting data.')
+
+        params_val = {"cortexToken": self.auth,
+                      "folder": folder,
+                      "format": export_format,
+                      "streamTypes": stream_types,
+                      "recordIds": record_ids}
+        if export_format == 'CSV':
+            params_val.update({'version': version})
+        params_val.update(kwargs)
+
+        result = await self.call("exportRecord", params_val)
+        for record in result['failure']:
+            print('export_record resp failure cases: '+ record['recordId'] + ":" + record['message'])
+        return result
+
+    async def inject_marker_request(self, time, value, label, **kwargs):
+        params_val = {"cortexToken": self.auth,
+                      "session": self.session_id,
+                      "time": time,
+                      "value": value,
+                      "label": label}
+        params_val.update(kwargs)
+        result = await self.call("injectMarker", params_val)
+        return result['marker']
+
+    async def update_marker_request(self, markerId, time, **kwargs):
+        params_val = {"cortexToken": self.auth,
+                      "session": self.session_id,
+                      "markerId": markerId,
+                      "time": time}
+        params_val.update(kwargs)
+        result = await self.call("updateMarker", params_val)
+        return result['marker']
+
+    async def get_mental_command_action_sensitivity(self, profile_name):
+        return await self.call("mentalCommandActionSensitivity", {
+            "cortexToken": self.auth,
+            "profile": profile_name,
+            "status": "get"
+        })
+
+    async def set_mental_command_action_sensitivity(self, profile_name, values):
+        return await self.call("mentalCommandActionSensitivity", {
+            "cortexToken": self.auth,
+            "profile": profile_name,
+            "session": self.session_id,
+            "status": "set",
+            "values": values
+        })
+
+    async def get_mental_command_active_action(self, profile_name):
+        return await self.call("mentalCommandActiveAction", {
+            "cortexToken": self.auth,
+            "profile": profile_name,
+            "status": "get"
+        })
+
+    async def set_mental_command_active_action(self, actions):
+        return await self.call("mentalCommandActiveAction", {
+            "cortexToken": self.auth,
+            "session": self.session_id,
+            "status": "set",
+            "actions": actions
+        })
+
+    async def get_mental_command_brain_map(self, profile_name):
+        return await self.call("mentalCommandBrainMap", {
+            "cortexToken": self.auth,
+            "profile": profile_name,
+            "session": self.session_id
+        })
+
+    async def get_mental_command_training_threshold(self, profile_name):
+        return await self.call("mentalCommandTrainingThreshold", {
+            "cortexToken": self.auth,
+            "session": self.session_id
+        })
+
+class CortexStream():
+    """
+    An async iterator over (stream_name, data) tuples of subscribed streams, created by AsyncCortex.stream().
+    The iteration stops when the websocket is closed or aclose() is called.
+    """
+    def __init__(self, cortex, streams, maxsize=0):
+        self.cortex = cortex
+        self.streams = streams
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self._queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    async def aclose(self):
+        if self in self.cortex._streams:
+            self.cortex._streams.remove(self)
+        self._put(None)
+
+    def _put(self, item):
+        if self._queue.full():
+            # drop the oldest frame instead of blocking the websocket reader
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(item)
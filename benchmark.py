@@ -0,0 +1,235 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import cortex
+from cortex import Cortex
+from cortex_simulator import CortexSimulator, SimulatedSession
+
+STREAMS = ['eeg', 'mot', 'pow', 'met', 'com', 'fac', 'dev']
+
+CHANNEL_COUNTS = [5, 14, 32]
+
+DEFAULT_BASELINE_PATH = 'benchmark_baseline.json'
+
+def make_frames(stream_name, n_channels, n_frames, seed=0):
+    """
+    To make Cortex stream frames as the JSON text received by Cortex.on_message,
+    with the synthetic data of the simulator
+
+    Returns
+    -------
+    (cols, frames): tuple
+        the cols of the subscribe response and the frames
+    """
+    simulator = CortexSimulator(eeg_channels=n_channels, seed=seed)
+    session = SimulatedSession('benchmark-session', 'EPOCX-BENCHMARK', 1627457774.5166)
+    frames = [json.dumps(simulator.make_frame(session, stream_name, i)) for i in range(n_frames)]
+    return simulator.stream_cols(stream_name), frames
+
+def load_frames(path, stream_name, n_frames):
+    """
+    To read frames recorded from Cortex, one JSON frame per line. The file may also hold the
+    subscribe response, which gives the cols of the streams.
+
+    Returns
+    -------
+    (cols, frames): tuple
+        the cols of the stream, from the subscribe response or else from the width of the frames,
+        and up to n_frames frames of the stream, repeated if the file has fewer
+    """
+    frames = []
+    cols = None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('{"' + stream_name + '"'):
+                frames.append(line)
+            elif cols is None and '"cols"' in line:
+                for stream in json.loads(line).get('result', {}).get('success', []):
+                    if stream.get('streamName') == stream_name:
+                        cols = stream['cols']
+    if len(frames) == 0:
+        return cols, frames
+    if cols is None:
+        cols = frame_cols(stream_name, json.loads(frames[0])[stream_name])
+    return cols, (frames * (n_frames // len(frames) + 1))[:n_frames]
+
+def frame_cols(stream_name, values):
+    """
+    Returns
+    -------
+    cols: list
+        the cols of the simulator for a headset with the number of channels of the frame values
+    """
+    n_channels = CortexSimulator().eeg_channels
+    if stream_name == 'eeg':
+        # COUNTER, INTERPOLATED, the channels, RAW_CQ, MARKER_HARDWARE and MARKERS
+        n_channels = len(values) - 5
+    elif stream_name == 'pow':
+        n_channels = len(values) // 5
+    elif stream_name == 'dev':
+        n_channels = len(values[2]) - 1
+    return CortexSimulator(eeg_channels=n_channels).stream_cols(stream_name)
+
+class FrameCounter():
+    def __init__(self):
+        self.count = 0
+
+    def on_data(self, *args, **kwargs):
+        self.count += 1
+
+def subscribed_cortex(stream_name, cols):
+    """
+    To create a Cortex which handles frames of the stream as after a successful subscription, without a socket
+    """
+    c = Cortex('benchmark', 'benchmark')
+    c.register_stream_decoder(stream_name)
+    if stream_name != 'com' and stream_name != 'fac':
+        labels = cortex.get_data_labels(stream_name, cols)
+        if stream_name == 'eeg':
+            c.eeg_labels = labels
+        if stream_name in cortex.COUNTER_COLUMNS:
+            c.start_integrity_monitor(stream_name, labels)
+    return c
+
+def bench_on_message(stream_name, cols, frames, repeat=3):
+    """
+    To measure Cortex.on_message for frames of one stream, from the JSON text to the bound handler
+
+    Returns
+    -------
+    us_per_frame: float
+        best of repeat runs
+    """
+    best = None
+    for _ in range(repeat):
+        c = subscribed_cortex(stream_name, cols)
+        counter = FrameCounter()
+        c.bind(**{cortex.STREAM_EVENTS[stream_name]: counter.on_data})
+
+        start = time.perf_counter()
+        for frame in frames:
+            c.on_message(None, frame)
+        elapsed = time.perf_counter() - start
+
+        assert counter.count == len(frames)
+        us_per_frame = elapsed * 1e6 / len(frames)
+        if best is None or us_per_frame < best:
+            best = us_per_frame
+    return best
+
+def measure_allocations(stream_name, cols, frames, n_frames=500):
+    """
+    To measure the memory used while handling one frame. These are not counts of the allocations made:
+    memory allocated and freed again within a frame only shows in the peak.
+
+    Returns
+    -------
+    (peak_bytes_per_frame, retained_blocks_per_frame): tuple
+        peak traced memory above the level before each frame, averaged per frame, and memory
+        blocks still allocated after all the frames, divided by the number of frames
+    """
+    frames = frames[:n_frames]
+    c = subscribed_cortex(stream_name, cols)
+    counter = FrameCounter()
+    c.bind(**{cortex.STREAM_EVENTS[stream_name]: counter.on_data})
+    # the first frames fill the caches of the decoders and monitors
+    for frame in frames[:10]:
+        c.on_message(None, frame)
+
+    tracemalloc.start()
+    try:
+        total_peak = 0
+        blocks_before = sys.getallocatedblocks()
+        for frame in frames:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            c.on_message(None, frame)
+            total_peak += tracemalloc.get_traced_memory()[1] - current
+        blocks_after = sys.getallocatedblocks()
+    finally:
+        tracemalloc.stop()
+    return total_peak / len(frames), (blocks_after - blocks_before) / len(frames)
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark of the Cortex stream frame path')
+    parser.add_argument('--frames', type=int, default=20000, help='number of frames per stream')
+    parser.add_argument('--channels', type=int, action='append',
+                        help='number of EEG channels of the synthetic frames, can be repeated. Default: 5, 14 and 32')
+    parser.add_argument('--streams', nargs='+', default=STREAMS, choices=STREAMS)
+    parser.add_argument('--frames-file', help='frames recorded from Cortex, one JSON frame per line, instead of synthetic frames. '
+                                               'They are measured once, with the cols of the file, under the key <stream>/file/<json>')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='baseline file of us/frame')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='flag a regression when us/frame is this percent above the baseline')
+    args = parser.parse_args()
+    channel_counts = args.channels or CHANNEL_COUNTS
+    if args.frames_file:
+        channel_counts = ['file']
+
+    backends = [('json', cortex.json.loads)]
+    if cortex.json_loads is not cortex.json.loads:
+        backends.append((cortex.json_loads.__module__, cortex.json_loads))
+
+    baseline = {} if args.save_baseline else load_baseline(args.baseline)
+    results = {}
+    regressions = []
+
+    default_loads = cortex.json_loads
+    print('{:<6} {:>4} {:<8} {:>12} {:>9} {:>16} {:>22} {:>9}'.format(
+        'stream', 'ch', 'json', 'frames/s', 'us/frame', 'peak bytes/frame', 'retained blocks/frame', 'vs base'))
+    try:
+        for n_channels in channel_counts:
+            for stream_name in args.streams:
+                if args.frames_file:
+                    cols, frames = load_frames(args.frames_file, stream_name, args.frames)
+                    if len(frames) == 0:
+                        continue
+                else:
+                    cols, frames = make_frames(stream_name, n_channels, args.frames)
+
+                for backend_name, loads in backends:
+                    cortex.json_loads = loads
+                    us_per_frame = bench_on_message(stream_name, cols, frames)
+                    peak_bytes_per_frame, retained_blocks_per_frame = measure_allocations(stream_name, cols, frames)
+
+                    key = '{0}/{1}/{2}'.format(stream_name, n_channels, backend_name)
+                    results[key] = us_per_frame
+                    change = ''
+                    if key in baseline:
+                        percent = (us_per_frame / baseline[key] - 1) * 100
+                        change = '{:+.1f}%'.format(percent)
+                        if percent > args.threshold:
+                            change += ' !'
+                            regressions.append((key, baseline[key], us_per_frame, percent))
+
+                    print('{:<6} {:>4} {:<8} {:>12,.0f} {:>9.2f} {:>16.0f} {:>22.2f} {:>9}'.format(
+                        stream_name, n_channels, backend_name, 1e6 / us_per_frame, us_per_frame,
+                        peak_bytes_per_frame, retained_blocks_per_frame, change))
+    finally:
+        cortex.json_loads = default_loads
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+        print('baseline saved to ' + args.baseline)
+
+    if len(regressions) > 0:
+        print('{} regression(s) above {:.0f}%:'.format(len(regressions), args.threshold))
+        for key, base_us, us, percent in regressions:
+            print('  {0}: {1:.2f} -> {2:.2f} us/frame ({3:+.1f}%)'.format(key, base_us, us, percent))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
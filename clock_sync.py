@@ -0,0 +1,166 @@
+import threading
+import time
+
+import numpy as np
+
+from cortex import STREAM_EVENTS
+
+# streams whose frames can be used to follow the Cortex clock. pow and met are computed over a
+# window of eeg, so they come later after their time than the raw eeg and mot samples.
+SYNC_STREAMS = ('eeg', 'mot', 'dev', 'pow', 'met')
+
+class ClockSync():
+    """
+    Estimates the offset and drift between the host clock and the 'time' of the Cortex stream samples.
+
+    Each frame gives a pair (host receive time, Cortex sample time). Their difference is the clock
+    offset plus the transport delay, which is never negative and is at its minimum for some frames.
+    So the pairs are grouped in bins of bin_s seconds, the minimum difference of each bin is kept,
+    and a Theil-Sen line, robust to bins without a fast frame, is fitted over the last window_s seconds.
+    The slope is the drift, and the uncertainty is the robust spread of the bins around the line.
+    The offset includes the minimum transport delay, below a millisecond for a local Cortex.
+
+    The host time is the epoch time of time.time() read once, then followed on the monotonic clock,
+    so a change of the wall clock does not break the estimate.
+
+    Attributes
+    ----------
+    window_s : float
+        duration of the pairs used in the estimate
+    bin_s : float
+        duration of a bin
+    min_bins : int
+        number of bins needed for an estimate
+    """
+    def __init__(self, window_s=60.0, bin_s=1.0, min_bins=5):
+        if bin_s <= 0 or window_s < bin_s * min_bins:
+            raise ValueError('window_s must hold at least min_bins bins of bin_s seconds.')
+        self.window_s = window_s
+        self.bin_s = bin_s
+        self.min_bins = min_bins
+        self.start_epoch = time.time()
+        self.start_monotonic = time.monotonic()
+        # bin number -> (host time, host time - cortex time) of the smallest difference
+        self.bins = {}
+        self.pairs = 0
+        self.source = None
+        self._estimate = None
+        self._lock = threading.Lock()
+
+    def host_time(self, monotonic_time=None):
+        """
+        Returns
+        -------
+        host_time: float
+            epoch seconds of the host at a time of time.monotonic(), now by default
+        """
+        if monotonic_time is None:
+            monotonic_time = time.monotonic()
+        return self.start_epoch + (monotonic_time - self.start_monotonic)
+
+    def add(self, cortex_time, host_time=None):
+        """
+        To add a sample time received at host_time, now by default
+        """
+        if host_time is None:
+            host_time = self.host_time()
+        difference = host_time - cortex_time
+        key = int(host_time // self.bin_s)
+        with self._lock:
+            self.pairs += 1
+            current = self.bins.get(key)
+            if current is None or difference < current[1]:
+                self.bins[key] = (host_time, difference)
+                self._estimate = None
+            if current is None:
+                oldest = key - int(self.window_s / self.bin_s)
+                for old_key in [k for k in self.bins if k < oldest]:
+                    del self.bins[old_key]
+
+    def estimate(self):
+        """
+        Returns
+        -------
+        estimate: dict or None
+            offset_s: host time - Cortex time now, drift_ppm: change of the offset in microseconds per second,
+            uncertainty_s: robust standard deviation of the bins around the fitted line, bins: number of bins.
+            None until min_bins bins are filled.
+        """
+        with self._lock:
+            if self._estimate is not None:
+                return self._estimate
+            # the last bin may still get a smaller difference
+            points = sorted(self.bins.values())[:-1]
+            if len(points) < self.min_bins:
+                return None
+            hosts = np.array([point[0] for point in points])
+            differences = np.array([point[1] for point in points])
+            reference = float(hosts[-1])
+
+            # Theil-Sen: median of the slopes between all pairs of bins
+            i, j = np.triu_indices(len(points), k=1)
+            slopes = (differences[j] - differences[i]) / (hosts[j] - hosts[i])
+            slope = float(np.median(slopes))
+            intercept = float(np.median(differences - slope * (hosts - reference)))
+            residuals = differences - (intercept + slope * (hosts - reference))
+            uncertainty = 1.4826 * float(np.median(np.abs(residuals - np.median(residuals))))
+
+            self._estimate = {'offset_s': intercept, 'drift_ppm': slope * 1e6, 'uncertainty_s': uncertainty,
+                              'bins': len(points), 'reference_host_time': reference, 'slope': slope}
+            return self._estimate
+
+    def offset_at(self, host_time):
+        estimate = self.estimate()
+        if estimate is None:
+            raise ValueError('The clock offset is not estimated yet, {} bins are needed.'.format(self.min_bins))
+        return estimate['offset_s'] + estimate['slope'] * (host_time - estimate['reference_host_time'])
+
+    def to_cortex_time(self, host_time=None):
+        """
+        Returns
+        -------
+        cortex_time: float
+            time of the Cortex stream samples at host_time in epoch seconds, now by default,
+            e.g. the time of a marker to inject
+        """
+        if host_time is None:
+            host_time = self.host_time()
+        return host_time - self.offset_at(host_time)
+
+    def to_host_time(self, cortex_time):
+        """
+        Returns
+        -------
+        host_time: float
+            host epoch seconds at the Cortex time of a sample
+        """
+        estimate = self.estimate()
+        if estimate is None:
+            raise ValueError('The clock offset is not estimated yet, {} bins are needed.'.format(self.min_bins))
+        slope = estimate['slope']
+        # host = cortex + offset + slope * (host - reference)
+        return (cortex_time + estimate['offset_s'] - slope * estimate['reference_host_time']) / (1 - slope)
+
+    def attach(self, source, streams=('eeg', 'mot')):
+        """
+        To follow the sample times of the streams of a Cortex. The handlers are bound directly,
+        so the receive time is read on the websocket thread right after decoding the frame.
+        """
+        self.source = source
+        self.sync_streams = [stream_name for stream_name in streams if stream_name in SYNC_STREAMS]
+        for stream_name in self.sync_streams:
+            source.bind(**{STREAM_EVENTS[stream_name]: self.on_new_data})
+        if 'eeg' in self.sync_streams:
+            source.bind(new_eeg_block=self.on_new_eeg_block)
+
+    def detach(self):
+        if self.source is not None:
+            self.source.unbind(self.on_new_data, self.on_new_eeg_block)
+            self.source = None
+
+    def on_new_data(self, *args, **kwargs):
+        self.add(kwargs.get('data')['time'])
+
+    def on_new_eeg_block(self, *args, **kwargs):
+        # the block is emitted at the receipt of its last sample
+        self.add(float(kwargs.get('data')['time'][-1]))
@@ -5,36 +5,20 @@ import ssl
 import time
 import sys
 from pydispatch import Dispatcher
+from cortex_cache import CortexCache
+from stream_integrity import COUNTER_COLUMNS, StreamIntegrityMonitor, count_lost_samples
 import warnings
 import threading
+import itertools
+from collections import namedtuple
+from concurrent.futures import Future
 
-
-# define request id
-QUERY_HEADSET_ID                    =   1
-CONNECT_HEADSET_ID                  =   2
-REQUEST_ACCESS_ID                   =   3
-AUTHORIZE_ID                        =   4
-CREATE_SESSION_ID                   =   5
-SUB_REQUEST_ID                      =   6
-SETUP_PROFILE_ID                    =   7
-QUERY_PROFILE_ID                    =   8
-TRAINING_ID                         =   9
-DISCONNECT_HEADSET_ID               =   10
-CREATE_RECORD_REQUEST_ID            =   11
-STOP_RECORD_REQUEST_ID              =   12
-EXPORT_RECORD_ID                    =   13
-INJECT_MARKER_REQUEST_ID            =   14
-SENSITIVITY_REQUEST_ID              =   15
-MENTAL_COMMAND_ACTIVE_ACTION_ID     =   16
-MENTAL_COMMAND_BRAIN_MAP_ID         =   17
-MENTAL_COMMAND_TRAINING_THRESHOLD   =   18
-SET_MENTAL_COMMAND_ACTIVE_ACTION_ID =   19
-HAS_ACCESS_RIGHT_ID                 =   20
-GET_CURRENT_PROFILE_ID              =   21
-GET_CORTEX_INFO_ID                  =   22
-UPDATE_MARKER_REQUEST_ID            =   23
-UNSUB_REQUEST_ID                    =   24
-REFRESH_HEADSET_LIST_ID             =   25
+try:
+    # faster parser for the stream frames, 'pip install orjson' for install
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 #define error_code
 ERR_PROFILE_ACCESS_DENIED = -32046
@@ -60,6 +44,138 @@ HEADSET_CANNOT_WORK_WITH_BTLE = 112
 HEADSET_CANNOT_CONNECT_DISABLE_MOTION = 113
 HEADSET_SCANNING_FINISHED = 142
 
+# event emitted for each data stream
+STREAM_EVENTS = {
+    'com': 'new_com_data',
+    'fac': 'new_fe_data',
+    'eeg': 'new_eeg_data',
+    'mot': 'new_mot_data',
+    'dev': 'new_dev_data',
+    'met': 'new_met_data',
+    'pow': 'new_pow_data',
+    'sys': 'new_sys_data',
+}
+
+class CortexError(Exception):
+    """
+    An error response returned by the Cortex service for a request.
+
+    Attributes
+    ----------
+    code : int
+        error code, for example ERR_PROFILE_ACCESS_DENIED
+    message : str
+        error message from Cortex
+    data : dict
+        the whole error object of the response
+    """
+    def __init__(self, error_data):
+        self.code = error_data.get('code')
+        self.message = error_data.get('message')
+        self.data = error_data
+        super().__init__('{0}: {1}'.format(self.code, self.message))
+
+def get_data_labels(stream_name, stream_cols):
+    if stream_name == 'eeg':
+        # remove MARKERS
+        return stream_cols[:-1]
+    elif stream_name == 'dev':
+        # get cq header column except battery, signal and battery percent
+        return stream_cols[2]
+    return stream_cols
+
+def decode_com(result_dic):
+    com_data = {}
+    com_data['action'] = result_dic['com'][0]
+    com_data['power'] = result_dic['com'][1]
+    com_data['time'] = result_dic['time']
+    return com_data
+
+def decode_fac(result_dic):
+    fe_data = {}
+    fe_data['eyeAct'] = result_dic['fac'][0]    #eye action
+    fe_data['uAct'] = result_dic['fac'][1]      #upper action
+    fe_data['uPow'] = result_dic['fac'][2]      #upper action power
+    fe_data['lAct'] = result_dic['fac'][3]      #lower action
+    fe_data['lPow'] = result_dic['fac'][4]      #lower action power
+    fe_data['time'] = result_dic['time']
+    return fe_data
+
+def decode_eeg(result_dic):
+    eeg_data = {}
+    eeg_data['eeg'] = result_dic['eeg']
+    eeg_data['eeg'].pop() # remove markers
+    eeg_data['time'] = result_dic['time']
+    return eeg_data
+
+def decode_mot(result_dic):
+    return {'mot': result_dic['mot'], 'time': result_dic['time']}
+
+def decode_dev(result_dic):
+    dev_data = {}
+    dev_data['signal'] = result_dic['dev'][1]
+    dev_data['dev'] = result_dic['dev'][2]
+    dev_data['batteryPercent'] = result_dic['dev'][3]
+    dev_data['time'] = result_dic['time']
+    return dev_data
+
+def decode_met(result_dic):
+    return {'met': result_dic['met'], 'time': result_dic['time']}
+
+def decode_pow(result_dic):
+    return {'pow': result_dic['pow'], 'time': result_dic['time']}
+
+def decode_sys(result_dic):
+    return result_dic['sys']
+
+# decoder of each data stream, it converts a stream frame to the data emitted for the stream
+STREAM_DECODERS = {
+    'com': decode_com,
+    'fac': decode_fac,
+    'eeg': decode_eeg,
+    'mot': decode_mot,
+    'dev': decode_dev,
+    'met': decode_met,
+    'pow': decode_pow,
+    'sys': decode_sys,
+}
+
+def parse_stream_data(result_dic):
+    """
+    Convert a stream data frame from Cortex to the data emitted for its stream.
+
+    Returns
+    -------
+    (stream_name, data): tuple
+        stream_name is None if the frame does not belong to a known stream
+    """
+    for key in result_dic:
+        decoder = STREAM_DECODERS.get(key)
+        if decoder is not None:
+            return key, decoder(result_dic)
+    return None, None
+
+# a request waiting for its response, see Cortex.send_request
+PendingRequest = namedtuple('PendingRequest', ['method', 'result_handler', 'future'])
+
+class Backoff():
+    """
+    Exponential backoff delays: initial, initial * factor, ... capped at maximum
+    """
+    def __init__(self, initial=1.0, maximum=30.0, factor=2.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.attempts = 0
+
+    def next_delay(self):
+        delay = min(self.initial * (self.factor ** self.attempts), self.maximum)
+        self.attempts += 1
+        return delay
+
+    def reset(self):
+        self.attempts = 0
+
 class Cortex(Dispatcher):
 
     _events_ = ['inform_error','create_session_done', 'query_profile_done', 'load_unload_profile_done', 
@@ -67,7 +183,8 @@ class Cortex(Dispatcher):
                 'mc_training_threshold_done', 'create_record_done', 'stop_record_done','warn_cortex_stop_all_sub', 'warn_record_post_processing_done',
                 'inject_marker_done', 'update_marker_done', 'export_record_done', 'new_data_labels', 
                 'new_com_data', 'new_fe_data', 'new_eeg_data', 'new_mot_data', 'new_dev_data', 
-                'new_met_data', 'new_pow_data', 'new_sys_data']
+                'new_met_data', 'new_pow_data', 'new_sys_data', 'new_eeg_block',
+                'connection_lost', 'session_resumed', 'stream_gap', 'authorize_done', 'stream_loss_rate']
     def __init__(self, client_id, client_secret, debug_mode=False, **kwargs):
         
         self.session_id = ''
@@ -76,6 +193,43 @@ class Cortex(Dispatcher):
         self.debit = 10
         self.license = ''
         self.isHeadsetConnected = False
+        self.eeg_block = None
+        self.eeg_block_lock = threading.RLock()
+        self.eeg_block_timer = None
+        self.eeg_labels = None
+        self.stream_decoders = {}
+        self.queued_handlers = []
+        self.auto_reconnect = False
+        self.reconnect_delay = 1
+        self.max_reconnect_delay = 30
+        self.closing = False
+        self.active_streams = []
+        self.headset_settings = {}
+        self.disconnected_at = None
+        self.resume_authorized = False
+        self.headset_retry_delay = 0.5
+        self.max_headset_retry_delay = 5
+        self.headset_timer = None
+        self.started_at = None
+        self.startup_metrics = {}
+        self.waiting_first_sample = False
+        self.prepare_session = True
+        self.session_routes = {}
+        self.cache = None
+        self.cached_start = False
+        self.headset_from_cache = False
+        self.last_frames = {}
+        self.frames_before_gap = {}
+        self.integrity_monitors = {}
+        self.loss_rate_threshold = 0.01
+        self.integrity_window_s = 5
+        self.latency_stats = None
+        self.latency_dump_interval_s = None
+        self.latency_dump_timer = None
+        self.url = "wss://localhost:6868"
+        self._request_ids = itertools.count(1)
+        self._pending_requests = {}
+        self._pending_lock = threading.Lock()
 
         if client_id == '':
             raise ValueError('Empty your_app_client_id. Please fill in your_app_client_id before running the example.')
@@ -95,26 +249,66 @@ class Cortex(Dispatcher):
                 self.debit == value
             elif  key == 'headset_id':
                 self.headset_id = value
+            elif key == 'auto_reconnect':
+                self.auto_reconnect = value
+            elif key == 'reconnect_delay':
+                self.reconnect_delay = value
+            elif key == 'max_reconnect_delay':
+                self.max_reconnect_delay = value
+            elif key == 'headset_retry_delay':
+                self.headset_retry_delay = value
+            elif key == 'max_headset_retry_delay':
+                self.max_headset_retry_delay = value
+            elif key == 'cache_path':
+                self.cache = CortexCache(value)
+            elif key == 'url':
+                self.url = value
+            elif key == 'loss_rate_threshold':
+                self.loss_rate_threshold = value
+            elif key == 'integrity_window_s':
+                self.integrity_window_s = value
+
+        self.reconnect_backoff = Backoff(self.reconnect_delay, self.max_reconnect_delay)
+        self.headset_backoff = Backoff(self.headset_retry_delay, self.max_headset_retry_delay)
 
     def open(self):
-        url = "wss://localhost:6868"
-        # websocket.enableTrace(True)
-        self.ws = websocket.WebSocketApp(url, 
-                                        on_message=self.on_message,
-                                        on_open = self.on_open,
-                                        on_error=self.on_error,
-                                        on_close=self.on_close)
+        self.closing = False
+        self.started_at = time.monotonic()
+        self.startup_metrics = {}
+        self.waiting_first_sample = True
         threadName = "WebsockThread:-{:%Y%m%d%H%M%S}".format(datetime.utcnow())
-        
+        self.websock_thread  = threading.Thread(target=self.run_forever, name=threadName)
+        self.websock_thread .start()
+        self.websock_thread.join()
+
+    def run_forever(self):
         # As default, a Emotiv self-signed certificate is required.
         # If you don't want to use the certificate, please replace by the below line  by sslopt={"cert_reqs": ssl.CERT_NONE}
         sslopt = {'ca_certs': "../certificates/rootCA.pem", "cert_reqs": ssl.CERT_REQUIRED}
-
-        self.websock_thread  = threading.Thread(target=self.ws.run_forever, args=(None, sslopt), name=threadName)
-        self.websock_thread .start()
-        self.websock_thread.join()
+        if self.url.startswith('ws://'):
+            # e.g. the local simulator of cortex_simulator.py
+            sslopt = None
+
+        while True:
+            # websocket.enableTrace(True)
+            self.ws = websocket.WebSocketApp(self.url, 
+                                            on_message=self.on_message,
+                                            on_open = self.on_open,
+                                            on_error=self.on_error,
+                                            on_close=self.on_close)
+            self.ws.run_forever(None, sslopt)
+
+            if self.closing or not self.auto_reconnect:
+                break
+            delay = self.reconnect_backoff.next_delay()
+            print('reconnect in {:.1f} seconds --------------------------------'.format(delay))
+            time.sleep(delay)
 
     def close(self):
+        self.closing = True
+        self.flush_eeg_block()
+        self.cancel_headset_retry()
+        self.cancel_latency_dump()
         self.ws.close()
 
     def set_wanted_headset(self, headsetId):
@@ -123,9 +317,128 @@ class Cortex(Dispatcher):
     def set_wanted_profile(self, profileName):
         self.profile_name = profileName
 
+    def bind_queued(self, policy='block', maxsize=256, **kwargs):
+        """
+        To bind handlers which run on their own worker thread instead of the websocket thread.
+        Each handler gets a bounded queue, so a slow handler does not delay the other handlers
+        nor the reading of the websocket.
+        For example: c.bind_queued(policy='drop_oldest', new_eeg_data=self.on_new_eeg_data)
+
+        Parameters
+        ----------
+        policy : str, optional
+            what to do when the queue of a handler is full
+            'block': wait for the handler, 'drop_oldest': drop the oldest event,
+            'coalesce_latest': only keep the latest event
+        maxsize : int, optional
+            size of the queue of each handler
+        kwargs : event name = handler
+
+        Returns
+        -------
+        handlers: list of QueuedHandler
+        """
+        from dispatch_queue import QueuedHandler
+
+        handlers = []
+        for event, handler in kwargs.items():
+            name = event + ':' + getattr(handler, '__qualname__', repr(handler))
+            queued_handler = QueuedHandler(handler, maxsize, policy, name)
+            # the Dispatcher only keeps weak references to its listeners
+            self.queued_handlers.append(queued_handler)
+            self.bind(**{event: queued_handler.dispatch})
+            handlers.append(queued_handler)
+        return handlers
+
+    def unbind_queued(self, *handlers):
+        """
+        To unbind handlers bound with bind_queued and stop their workers
+        """
+        for queued_handler in handlers:
+            self.unbind(queued_handler.dispatch)
+            queued_handler.close(wait=False)
+            if queued_handler in self.queued_handlers:
+                self.queued_handlers.remove(queued_handler)
+
+    def get_dispatch_stats(self):
+        """
+        Returns
+        -------
+        stats: list of dict
+            queue depth, max depth, handled and dropped counters of each handler bound with bind_queued
+        """
+        return [queued_handler.stats() for queued_handler in self.queued_handlers]
+
+    def set_eeg_block_mode(self, block_size=32, max_latency_ms=None):
+        """
+        To deliver eeg data in blocks at new_eeg_block instead of one new_eeg_data per sample.
+        It requires numpy.
+
+        Parameters
+        ----------
+        block_size : int, optional
+            number of samples per block. Set None to go back to new_eeg_data per sample.
+        max_latency_ms : float, optional
+            emit a block earlier once it spans this many milliseconds, or this many milliseconds
+            after its first sample was received if the stream pauses
+
+        Returns
+        -------
+        None
+        """
+        with self.eeg_block_lock:
+            # the samples of the previous mode are delivered first
+            self.flush_eeg_block()
+            if block_size is None:
+                self.eeg_block = None
+            else:
+                from eeg_block import EEGBlockBuffer
+                self.eeg_block = EEGBlockBuffer(block_size, max_latency_ms)
+                if self.eeg_labels is not None:
+                    self.eeg_block.set_labels(self.eeg_labels)
+
+            if self.eeg_block is not None or 'eeg' in self.stream_decoders:
+                self.register_stream_decoder('eeg')
+
+    def flush_eeg_block(self):
+        """
+        To emit the partial eeg block at new_eeg_block, e.g. when the stream stops.
+        Called on unsubscribe, at the stop of all streams, at close and when the connection drops.
+        """
+        with self.eeg_block_lock:
+            self.cancel_eeg_block_timer()
+            if self.eeg_block is None:
+                return
+            block = self.eeg_block.flush()
+            if block is not None:
+                self.emit('new_eeg_block', data=block)
+
+    def start_eeg_block_timer(self):
+        # flushes the block if it is still the same one after max_latency_ms
+        self.cancel_eeg_block_timer()
+        eeg_block = self.eeg_block
+        self.eeg_block_timer = threading.Timer(eeg_block.max_latency_ms / 1000.0, self.on_eeg_block_timer,
+                                               args=(eeg_block, eeg_block.blocks))
+        self.eeg_block_timer.daemon = True
+        self.eeg_block_timer.start()
+
+    def cancel_eeg_block_timer(self):
+        if self.eeg_block_timer is not None:
+            self.eeg_block_timer.cancel()
+            self.eeg_block_timer = None
+
+    def on_eeg_block_timer(self, eeg_block, blocks):
+        with self.eeg_block_lock:
+            if self.eeg_block is eeg_block and eeg_block.blocks == blocks:
+                self.flush_eeg_block()
+
     def on_open(self, *args, **kwargs):
         print("websocket opened")
-        self.do_prepare_steps()
+        self.reconnect_backoff.reset()
+        if self.disconnected_at is not None and self.auth != '':
+            self.resume_session()
+        else:
+            self.do_prepare_steps()
 
     def on_error(self, *args):
         if len(args) == 2:
@@ -134,187 +447,385 @@ class Cortex(Dispatcher):
     def on_close(self, *args, **kwargs):
         print("on_close")
         print(args[1])
+        # the samples before a drop are not mixed with the samples after a reconnection
+        self.flush_eeg_block()
+        # no response will come for the requests sent on this connection
+        with self._pending_lock:
+            pending_requests = list(self._pending_requests.values())
+            self._pending_requests.clear()
+        for pending in pending_requests:
+            pending.future.set_exception(ConnectionError('Cortex connection closed before the response of ' + pending.method))
+
+        if self.auto_reconnect and not self.closing and self.session_id != '':
+            # the session is closed with the connection, keep what is needed to resume it
+            self.emit('connection_lost', data={'sessionId': self.session_id, 'streams': list(self.active_streams)})
+            self.disconnected_at = time.time()
+            self.frames_before_gap = {name: frame for name, frame in self.last_frames.items()
+                                      if name in self.active_streams}
+            self.last_frames = {}
+            self.session_id = ''
+            self.isHeadsetConnected = False
+
+    """
+        Resume steps after a reconnection:
+        Step 1: query headset with the cached cortexToken and create a session with the same headset
+        Step 2: subscribe the streams which were active before the connection was lost
+        If the session can not be created with the cached cortexToken, authorize is called again.
+        """
+
+    def resume_session(self):
+        print('resume session --------------------------------')
+        self.resume_authorized = False
+        self.query_headset()
+
+    def on_resume_create_session_done(self, future):
+        if isinstance(future.exception(), CortexError) and not self.resume_authorized:
+            # the cached cortexToken may be expired
+            self.resume_authorized = True
+            self.authorize()
+
+    def resume_streams(self):
+        downtime_s = time.time() - self.disconnected_at
+        streams = list(self.active_streams)
+        print('The session {0} is resumed after {1:.3f} seconds.'.format(self.session_id, downtime_s))
+        self.disconnected_at = None
+        if len(streams) > 0:
+            self.sub_request(streams)
+        self.emit('session_resumed', data={'sessionId': self.session_id, 'downtime_s': downtime_s, 'streams': streams})
+
+    def report_stream_gap(self, stream_name, prev_frame, result_dic, lost_samples=None):
+        """
+        To emit the gap of a stream between its last sample before the connection was lost
+        and its first sample after the session is resumed
+
+        Parameters
+        ----------
+        lost_samples : int, optional
+            samples lost in the gap as counted by the integrity monitor of the stream,
+            so that stream_gap and get_integrity_stats() agree
+        """
+        gap_s = result_dic['time'] - prev_frame['time']
+        srate = self.headset_settings.get('eegRate' if stream_name == 'eeg' else 'memsRate')
+        if lost_samples is None and (stream_name == 'eeg' or stream_name == 'mot') and srate:
+            # no monitor: the first column is COUNTER, it cycles once per second
+            lost_samples = count_lost_samples(prev_frame[stream_name][0], result_dic[stream_name][0],
+                                              gap_s, srate, srate)
+
+        print('The data stream {0} has a gap of {1:.3f} seconds, lost samples: {2}'.format(stream_name, gap_s, lost_samples))
+        self.emit('stream_gap', data={'streamName': stream_name, 'gap_s': gap_s, 'lost_samples': lost_samples})
+
+    def send_request(self, method, params=None, result_handler=None):
+        """
+        To send a JSON-RPC request with a new unique id
+
+        Parameters
+        ----------
+        method : str, required
+            name of the Cortex API method
+        params : dict, optional
+            params of the request
+        result_handler : function, optional
+            decoder called with the result of the response on the websocket thread.
+            Its return value becomes the result of the returned future.
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            resolved with the decoded result, or failed with CortexError if Cortex responds with an error.
+            Do not wait for it on the websocket thread, i.e. inside a bound callback.
+        """
+        future = Future()
+        with self._pending_lock:
+            req_id = next(self._request_ids)
+            self._pending_requests[req_id] = PendingRequest(method, result_handler, future)
+
+        request = {
+            "jsonrpc": "2.0",
+            "id": req_id,
+            "method": method
+        }
+        if params is not None:
+            request['params'] = params
+
+        if self.debug:
+            print(method + ' request \n', json.dumps(request, indent=4))
+
+        try:
+            self.ws.send(json.dumps(request))
+        except Exception:
+            with self._pending_lock:
+                self._pending_requests.pop(req_id, None)
+            raise
+        return future
 
     def handle_result(self, recv_dic):
         if self.debug:
             print(recv_dic)
 
         req_id = recv_dic['id']
+        with self._pending_lock:
+            pending = self._pending_requests.pop(req_id, None)
+
+        if pending is None:
+            print('No handling for response of request ' + str(req_id))
+            return
+
         result_dic = recv_dic['result']
+        try:
+            if pending.result_handler is not None:
+                result_dic = pending.result_handler(result_dic)
+        except Exception as e:
+            pending.future.set_exception(e)
+            raise
+        pending.future.set_result(result_dic)
 
-        if req_id == HAS_ACCESS_RIGHT_ID:
-            access_granted = result_dic['accessGranted']
-            if access_granted == True:
-                # authorize
-                self.authorize()
-            else:
-                # request access
-                self.request_access()
-        elif req_id == REQUEST_ACCESS_ID:
-            access_granted = result_dic['accessGranted']
-
-            if access_granted == True:
-                # authorize
-                self.authorize()
-            else:
-                # wait approve from Emotiv Launcher
-                msg = result_dic['message']
-                warnings.warn(msg)
-        elif req_id == AUTHORIZE_ID:
-            print("Authorize successfully.")
-            self.auth = result_dic['cortexToken']
-            #After successful authorization, the app will call the API refresh headset list for the first time
-            self.refresh_headset_list()
+    def handle_error(self, recv_dic):
+        req_id = recv_dic['id']
+        print('handle_error: request Id ' + str(req_id))
+        with self._pending_lock:
+            pending = self._pending_requests.pop(req_id, None)
+        if pending is not None:
+            pending.future.set_exception(CortexError(recv_dic['error']))
+        self.emit('inform_error', error_data=recv_dic['error'])
+
+    def handle_has_access_right_result(self, result_dic):
+        access_granted = result_dic['accessGranted']
+        if access_granted == True:
+            # authorize
+            self.authorize()
+        else:
+            # request access
+            self.request_access()
+        return result_dic
+
+    def handle_request_access_result(self, result_dic):
+        access_granted = result_dic['accessGranted']
+
+        if access_granted == True:
+            # authorize
+            self.authorize()
+        else:
+            # wait approve from Emotiv Launcher
+            msg = result_dic['message']
+            warnings.warn(msg)
+        return result_dic
+
+    def handle_authorize_result(self, result_dic):
+        print("Authorize successfully.")
+        self.auth = result_dic['cortexToken']
+        if self.cache is not None:
+            self.cache.save_token(self.cache_key(), self.auth)
+        self.emit('authorize_done', data=self.auth)
+        #After successful authorization, the app will call the API refresh headset list for the first time
+        self.refresh_headset_list()
+        if self.prepare_session:
             # query headsets
             self.query_headset()
-        elif req_id == QUERY_HEADSET_ID:
-            self.headset_list = result_dic
-            found_headset = False
-            headset_status = ''
-            for ele in self.headset_list:
-                hs_id = ele['id']
-                status = ele['status']
-                connected_by = ele['connectedBy']
-                print('headsetId: {0}, status: {1}, connected_by: {2}'.format(hs_id, status, connected_by))
-                if self.headset_id != '' and self.headset_id == hs_id:
-                    found_headset = True
-                    headset_status = status
-
-            if len(self.headset_list) == 0:
-                self.isHeadsetConnected = False
-                warnings.warn("No headset available. Please turn on a headset.")
-            elif self.headset_id == '':
-                # set first headset is default headset
-                self.headset_id = self.headset_list[0]['id']
-                # call query headet again
-                self.query_headset()
-            elif found_headset == False:
-                warnings.warn("Can not found the headset " + self.headset_id + ". Please make sure the id is correct.")
-            elif found_headset == True:
-                if headset_status == 'connected':
-                    self.isHeadsetConnected = True
-                    # create session with the headset
-                    self.create_session()
-                elif headset_status == 'discovered':
-                    self.connect_headset(self.headset_id)
-                elif headset_status == 'connecting':
-                    # wait 3 seconds and query headset again
-                    time.sleep(3)
-                    self.query_headset()
-                else:
-                    warnings.warn('query_headset resp: Invalid connection status ' + headset_status)
-        elif req_id == CREATE_SESSION_ID:
-            self.session_id = result_dic['id']
-            print("The session " + self.session_id + " is created successfully.")
+        return result_dic
+
+    def handle_query_headset_result(self, result_dic):
+        self.headset_list = result_dic
+        found_headset = False
+        headset_status = ''
+        for ele in self.headset_list:
+            hs_id = ele['id']
+            status = ele['status']
+            connected_by = ele['connectedBy']
+            print('headsetId: {0}, status: {1}, connected_by: {2}'.format(hs_id, status, connected_by))
+            if self.headset_id != '' and self.headset_id == hs_id:
+                found_headset = True
+                headset_status = status
+                self.headset_settings = ele.get('settings', {})
+
+        if self.cached_start and (len(self.headset_list) == 0 or (self.headset_id != '' and found_headset == False)):
+            # no scan has been done, the headset may just not be discovered yet
+            self.fall_back_from_cache('the headset ' + self.headset_id + ' is not available')
+            return result_dic
+
+        if found_headset and self.cache is not None:
+            self.cache.save_headset(self.cache_key(), self.headset_id, headset_status)
+
+        if len(self.headset_list) == 0:
+            self.isHeadsetConnected = False
+            warnings.warn("No headset available. Please turn on a headset.")
+            self.schedule_query_headset()
+        elif self.headset_id == '':
+            # set first headset is default headset
+            self.headset_id = self.headset_list[0]['id']
+            # call query headet again
+            self.query_headset()
+        elif found_headset == False:
+            warnings.warn("Can not found the headset " + self.headset_id + ". Please make sure the id is correct.")
+        elif found_headset == True:
+            if headset_status == 'connected':
+                self.isHeadsetConnected = True
+                self.headset_backoff.reset()
+                self.record_startup_metric('time_to_connected')
+                # create session with the headset
+                self.create_session()
+            elif headset_status == 'discovered':
+                self.connect_headset(self.headset_id)
+                # HEADSET_CONNECTED warning should come first, query again in case it does not
+                self.schedule_query_headset()
+            elif headset_status == 'connecting':
+                # query headset again later without blocking the websocket thread
+                self.schedule_query_headset()
+            else:
+                warnings.warn('query_headset resp: Invalid connection status ' + headset_status)
+        return result_dic
+
+    def handle_create_session_result(self, result_dic):
+        self.session_id = result_dic['id']
+        self.cached_start = False
+        print("The session " + self.session_id + " is created successfully.")
+        if self.disconnected_at is not None:
+            self.resume_streams()
+        else:
             self.emit('create_session_done', data=self.session_id)
-        elif req_id == SUB_REQUEST_ID:
-            # handle data label
-            for stream in result_dic['success']:
-                stream_name = stream['streamName']
-                stream_labels = stream['cols']
-                print('The data stream '+ stream_name + ' is subscribed successfully.')
-                # ignore com, fac and sys data label because they are handled in on_new_data
-                if stream_name != 'com' and stream_name != 'fac':
-                    self.extract_data_labels(stream_name, stream_labels)
-
-            for stream in result_dic['failure']:
-                stream_name = stream['streamName']
-                stream_msg = stream['message']
-                print('The data stream '+ stream_name + ' is subscribed unsuccessfully. Because: ' + stream_msg)
-        elif req_id == UNSUB_REQUEST_ID:
-            for stream in result_dic['success']:
-                stream_name = stream['streamName']
-                print('The data stream '+ stream_name + ' is unsubscribed successfully.')
-
-            for stream in result_dic['failure']:
-                stream_name = stream['streamName']
-                stream_msg = stream['message']
-                print('The data stream '+ stream_name + ' is unsubscribed unsuccessfully. Because: ' + stream_msg)
-
-        elif req_id == QUERY_PROFILE_ID:
-            profile_list = []
-            for ele in result_dic:
-                if 'name' in ele:
-                    profile_name = str(ele['name'])
-                    read_only = ele['readOnly']
-                    print('profile name :', profile_name, " readonly :", read_only)
-                    profile_list.append(profile_name)
-                else:
-                    print('Result does not contain name field.')
-
-            self.emit('query_profile_done', data=profile_list)
-        elif req_id == SETUP_PROFILE_ID:
-            action = result_dic['action']
-            if action == 'create':
-                profile_name = result_dic['name']
-                if profile_name == self.profile_name:
-                    # load profile
-                    self.setup_profile(profile_name, 'load')
-            elif action == 'load':
-                print('load profile successfully')
-                self.emit('load_unload_profile_done', isLoaded=True)
-            elif action == 'unload':
-                self.emit('load_unload_profile_done', isLoaded=False)
-            elif action == 'save':
-                self.emit('save_profile_done')
-        elif req_id == GET_CURRENT_PROFILE_ID:
-            print(result_dic)
-            name = result_dic['name']
-            if name is None:
-                # no profile loaded with the headset
-                print('get_current_profile: no profile loaded with the headset ' + self.headset_id)
-                self.setup_profile(self.profile_name, 'load')
+        return result_dic
+
+    def handle_close_session_result(self, result_dic):
+        print("The session " + self.session_id + " is closed.")
+        self.session_id = ''
+        return result_dic
+
+    def handle_sub_request_result(self, result_dic):
+        # handle data label
+        for stream in result_dic['success']:
+            stream_name = stream['streamName']
+            stream_labels = stream['cols']
+            print('The data stream '+ stream_name + ' is subscribed successfully.')
+            self.register_stream_decoder(stream_name)
+            if stream_name not in self.active_streams:
+                self.active_streams.append(stream_name)
+            # ignore com, fac and sys data label because they are handled in on_new_data
+            if stream_name != 'com' and stream_name != 'fac':
+                self.extract_data_labels(stream_name, stream_labels)
+
+        for stream in result_dic['failure']:
+            stream_name = stream['streamName']
+            stream_msg = stream['message']
+            print('The data stream '+ stream_name + ' is subscribed unsuccessfully. Because: ' + stream_msg)
+        return result_dic
+
+    def handle_unsub_request_result(self, result_dic):
+        for stream in result_dic['success']:
+            stream_name = stream['streamName']
+            print('The data stream '+ stream_name + ' is unsubscribed successfully.')
+            if stream_name == 'eeg':
+                self.flush_eeg_block()
+            self.stream_decoders.pop(stream_name, None)
+            if stream_name in self.active_streams:
+                self.active_streams.remove(stream_name)
+
+        for stream in result_dic['failure']:
+            stream_name = stream['streamName']
+            stream_msg = stream['message']
+            print('The data stream '+ stream_name + ' is unsubscribed unsuccessfully. Because: ' + stream_msg)
+        return result_dic
+
+    def handle_query_profile_result(self, result_dic):
+        profile_list = []
+        for ele in result_dic:
+            if 'name' in ele:
+                profile_name = str(ele['name'])
+                read_only = ele['readOnly']
+                print('profile name :', profile_name, " readonly :", read_only)
+                profile_list.append(profile_name)
             else:
-                loaded_by_this_app = result_dic['loadedByThisApp']
-                print('get current profile rsp: ' + name + ", loadedByThisApp: " + str(loaded_by_this_app))
-                if name != self.profile_name:
-                    warnings.warn("There is profile " + name + " is loaded for headset " + self.headset_id)
-                elif loaded_by_this_app == True:
-                    self.emit('load_unload_profile_done', isLoaded=True)
-                else:
-                    self.setup_profile(self.profile_name, 'unload')
-                    # warnings.warn("The profile " + name + " is loaded by other applications")
-        elif req_id == DISCONNECT_HEADSET_ID:
-            print("Disconnect headset " + self.headset_id)
-            self.headset_id = ''
-        elif req_id == MENTAL_COMMAND_ACTIVE_ACTION_ID:
-            self.emit('get_mc_active_action_done', data=result_dic)
-        elif req_id == MENTAL_COMMAND_TRAINING_THRESHOLD:
-            self.emit('mc_training_threshold_done', data=result_dic)
-        elif req_id == MENTAL_COMMAND_BRAIN_MAP_ID:
-            self.emit('mc_brainmap_done', data=result_dic)
-        elif req_id == SENSITIVITY_REQUEST_ID:
-            self.emit('mc_action_sensitivity_done', data=result_dic)
-        elif req_id == CREATE_RECORD_REQUEST_ID:
-            self.record_id = result_dic['record']['uuid']
-            self.emit('create_record_done', data=result_dic['record'])
-        elif req_id == STOP_RECORD_REQUEST_ID:
-            self.emit('stop_record_done', data=result_dic['record'])
-        elif req_id == EXPORT_RECORD_ID:
-            # handle data lable
-            success_export = []
-            for record in result_dic['success']:
-                record_id = record['recordId']
-                success_export.append(record_id)
-
-            for record in result_dic['failure']:
-                record_id = record['recordId']
-                failure_msg = record['message']
-                print('export_record resp failure cases: '+ record_id + ":" + failure_msg)
-
-            self.emit('export_record_done', data=success_export)
-        elif req_id == INJECT_MARKER_REQUEST_ID:
-            self.emit('inject_marker_done', data=result_dic['marker'])
-        elif req_id == INJECT_MARKER_REQUEST_ID:
-            self.emit('update_marker_done', data=result_dic['marker'])
+                print('Result does not contain name field.')
+
+        self.emit('query_profile_done', data=profile_list)
+        return profile_list
+
+    def handle_setup_profile_result(self, result_dic):
+        action = result_dic['action']
+        if action == 'create':
+            profile_name = result_dic['name']
+            if profile_name == self.profile_name:
+                # load profile
+                self.setup_profile(profile_name, 'load')
+        elif action == 'load':
+            print('load profile successfully')
+            self.emit('load_unload_profile_done', isLoaded=True)
+        elif action == 'unload':
+            self.emit('load_unload_profile_done', isLoaded=False)
+        elif action == 'save':
+            self.emit('save_profile_done')
+        return result_dic
+
+    def handle_get_current_profile_result(self, result_dic):
+        print(result_dic)
+        name = result_dic['name']
+        if name is None:
+            # no profile loaded with the headset
+            print('get_current_profile: no profile loaded with the headset ' + self.headset_id)
+            self.setup_profile(self.profile_name, 'load')
         else:
-            print('No handling for response of request ' + str(req_id))
+            loaded_by_this_app = result_dic['loadedByThisApp']
+            print('get current profile rsp: ' + name + ", loadedByThisApp: " + str(loaded_by_this_app))
+            if name != self.profile_name:
+                warnings.warn("There is profile " + name + " is loaded for headset " + self.headset_id)
+            elif loaded_by_this_app == True:
+                self.emit('load_unload_profile_done', isLoaded=True)
+            else:
+                self.setup_profile(self.profile_name, 'unload')
+                # warnings.warn("The profile " + name + " is loaded by other applications")
+        return result_dic
+
+    def handle_disconnect_headset_result(self, result_dic):
+        print("Disconnect headset " + self.headset_id)
+        self.headset_id = ''
+        return result_dic
+
+    def handle_mc_active_action_result(self, result_dic):
+        self.emit('get_mc_active_action_done', data=result_dic)
+        return result_dic
+
+    def handle_mc_training_threshold_result(self, result_dic):
+        self.emit('mc_training_threshold_done', data=result_dic)
+        return result_dic
+
+    def handle_mc_brain_map_result(self, result_dic):
+        self.emit('mc_brainmap_done', data=result_dic)
+        return result_dic
+
+    def handle_mc_action_sensitivity_result(self, result_dic):
+        # both get and set responses are emitted, get returns a list of values
+        self.emit('mc_action_sensitivity_done', data=result_dic)
+        return result_dic
+
+    def handle_create_record_result(self, result_dic):
+        self.record_id = result_dic['record']['uuid']
+        self.emit('create_record_done', data=result_dic['record'])
+        return result_dic['record']
+
+    def handle_stop_record_result(self, result_dic):
+        self.emit('stop_record_done', data=result_dic['record'])
+        return result_dic['record']
+
+    def handle_export_record_result(self, result_dic):
+        success_export = []
+        for record in result_dic['success']:
+            record_id = record['recordId']
+            success_export.append(record_id)
+
+        for record in result_dic['failure']:
+            record_id = record['recordId']
+            failure_msg = record['message']
+            print('export_record resp failure cases: '+ record_id + ":" + failure_msg)
+
+        self.emit('export_record_done', data=success_export)
+        return result_dic
+
+    def handle_inject_marker_result(self, result_dic):
+        self.emit('inject_marker_done', data=result_dic['marker'])
+        return result_dic['marker']
+
+    def handle_update_marker_result(self, result_dic):
+        self.emit('update_marker_done', data=result_dic['marker'])
+        return result_dic['marker']
 
-    def handle_error(self, recv_dic):
-        req_id = recv_dic['id']
-        print('handle_error: request Id ' + str(req_id))
-        self.emit('inform_error', error_data=recv_dic['error'])
-    
     def handle_warning(self, warning_dic):
 
         if self.debug:
@@ -326,15 +837,20 @@ class Cortex(Dispatcher):
             self.authorize()
         elif warning_code == HEADSET_CONNECTED:
             # query headset again then create session
-            self.query_headset()
+            if self.prepare_session:
+                self.query_headset()
         elif warning_code == CORTEX_AUTO_UNLOAD_PROFILE:
             self.profile_name = ''
         elif  warning_code == CORTEX_STOP_ALL_STREAMS:
             # print(warning_msg['behavior'])
             session_id = warning_msg['sessionId']
-            if session_id == self.session_id:
+            if session_id in self.session_routes:
+                self.session_routes[session_id].handle_stop_all_streams()
+            elif session_id == self.session_id:
+                self.flush_eeg_block()
                 self.emit('warn_cortex_stop_all_sub', data=session_id)
                 self.session_id = ''
+                self.active_streams = []
         elif warning_code == CORTEX_RECORD_POST_PROCESSING_DONE:
                 record_id = warning_msg['recordId']
                 self.emit('warn_record_post_processing_done', data=record_id)
@@ -345,59 +861,87 @@ class Cortex(Dispatcher):
                 self.refresh_headset_list()
 
     def handle_stream_data(self, result_dic):
-        if result_dic.get('com') != None:
-            com_data = {}
-            com_data['action'] = result_dic['com'][0]
-            com_data['power'] = result_dic['com'][1]
-            com_data['time'] = result_dic['time']
-            self.emit('new_com_data', data=com_data)
-        elif result_dic.get('fac') != None:
-            fe_data = {}
-            fe_data['eyeAct'] = result_dic['fac'][0]    #eye action
-            fe_data['uAct'] = result_dic['fac'][1]      #upper action
-            fe_data['uPow'] = result_dic['fac'][2]      #upper action power
-            fe_data['lAct'] = result_dic['fac'][3]      #lower action
-            fe_data['lPow'] = result_dic['fac'][4]      #lower action power
-            fe_data['time'] = result_dic['time']
-            self.emit('new_fe_data', data=fe_data)
-        elif result_dic.get('eeg') != None:
-            eeg_data = {}
-            eeg_data['eeg'] = result_dic['eeg']
-            eeg_data['eeg'].pop() # remove markers
-            eeg_data['time'] = result_dic['time']
-            self.emit('new_eeg_data', data=eeg_data)
-        elif result_dic.get('mot') != None:
-            mot_data = {}
-            mot_data['mot'] = result_dic['mot']
-            mot_data['time'] = result_dic['time']
-            self.emit('new_mot_data', data=mot_data)
-        elif result_dic.get('dev') != None:
-            dev_data = {}
-            dev_data['signal'] = result_dic['dev'][1]
-            dev_data['dev'] = result_dic['dev'][2]
-            dev_data['batteryPercent'] = result_dic['dev'][3]
-            dev_data['time'] = result_dic['time']
-            self.emit('new_dev_data', data=dev_data)
-        elif result_dic.get('met') != None:
-            met_data = {}
-            met_data['met'] = result_dic['met']
-            met_data['time'] = result_dic['time']
-            self.emit('new_met_data', data=met_data)
-        elif result_dic.get('pow') != None:
-            pow_data = {}
-            pow_data['pow'] = result_dic['pow']
-            pow_data['time'] = result_dic['time']
-            self.emit('new_pow_data', data=pow_data)
-        elif result_dic.get('sys') != None:
-            sys_data = result_dic['sys']
-            self.emit('new_sys_data', data=sys_data)
-        else :
+        # the stream name is the first key of a frame, e.g. {"eeg": [...], "sid": "...", "time": ...}
+        for key in result_dic:
+            decoder = self.stream_decoders.get(key)
+            if decoder is not None:
+                prev_frame = self.frames_before_gap.pop(key, None) if self.frames_before_gap else None
+                self.last_frames[key] = result_dic
+                monitor = self.integrity_monitors.get(key)
+                if monitor is not None:
+                    lost_before = monitor.lost
+                    loss_event = monitor.update(result_dic[key], result_dic['time'])
+                    if prev_frame is not None:
+                        self.report_stream_gap(key, prev_frame, result_dic, monitor.lost - lost_before)
+                        prev_frame = None
+                    if loss_event is not None:
+                        print('The loss rate of data stream {0} is {1:.2%}'.format(key, loss_event['loss_rate']))
+                        self.emit('stream_loss_rate', data=loss_event)
+                if prev_frame is not None:
+                    self.report_stream_gap(key, prev_frame, result_dic)
+                if self.waiting_first_sample:
+                    self.waiting_first_sample = False
+                    self.record_startup_metric('time_to_first_sample')
+                event, decode = decoder
+                if event == 'new_eeg_block':
+                    # the latency timer flushes blocks from its own thread, the blocks stay in order
+                    with self.eeg_block_lock:
+                        self.emit_stream_data(key, result_dic, event, decode)
+                else:
+                    self.emit_stream_data(key, result_dic, event, decode)
+                return
+
+        # a stream which was not subscribed by this object
+        stream_name, data = parse_stream_data(result_dic)
+        if stream_name is None:
             print(result_dic)
+            return
+        self.emit(STREAM_EVENTS[stream_name], data=data)
+
+    def emit_stream_data(self, stream_name, result_dic, event, decode):
+        data = decode(result_dic)
+        if self.latency_stats is None:
+            if data is not None:
+                self.emit(event, data=data)
+            return
+
+        self.latency_stats.decoded(stream_name, result_dic['time'])
+        if data is not None:
+            self.emit(event, data=data)
+        self.latency_stats.handled(stream_name)
+
+    def register_stream_decoder(self, stream_name):
+        """
+        To select the decoder and event of a subscribed stream, so that handle_stream_data
+        finds them with one lookup by stream name.
+        """
+        if stream_name == 'eeg' and self.eeg_block is not None:
+            self.stream_decoders['eeg'] = ('new_eeg_block', self.decode_eeg_block)
+        elif stream_name in STREAM_DECODERS:
+            self.stream_decoders[stream_name] = (STREAM_EVENTS[stream_name], STREAM_DECODERS[stream_name])
+
+    def decode_eeg_block(self, result_dic):
+        # called with eeg_block_lock held
+        if self.eeg_block is None:
+            return None
+        block = self.eeg_block.append(result_dic['eeg'], result_dic['time'])
+        if block is not None:
+            self.cancel_eeg_block_timer()
+        elif self.eeg_block.max_latency_ms is not None and len(self.eeg_block) == 1:
+            self.start_eeg_block_timer()
+        return block
 
     def on_message(self, *args):
-        recv_dic = json.loads(args[1])
+        if self.latency_stats is not None:
+            self.latency_stats.receive()
+        recv_dic = json_loads(args[1])
         if 'sid' in recv_dic:
-            self.handle_stream_data(recv_dic)
+            session = self.session_routes.get(recv_dic['sid'])
+            if session is not None:
+                # a session opened by a SessionManager
+                session.handle_stream_data(recv_dic)
+            else:
+                self.handle_stream_data(recv_dic)
         elif 'result' in recv_dic:
             self.handle_result(recv_dic)
         elif 'error' in recv_dic:
@@ -407,80 +951,154 @@ class Cortex(Dispatcher):
         else:
             raise KeyError
 
+    def schedule_query_headset(self):
+        """
+        To query headset again after a delay which doubles at each retry, up to max_headset_retry_delay.
+        The delay is reset once the headset is connected.
+        """
+        self.cancel_headset_retry()
+        delay = self.headset_backoff.next_delay()
+        print('query headset again in {:.1f} seconds'.format(delay))
+        self.headset_timer = threading.Timer(delay, self.query_headset)
+        self.headset_timer.daemon = True
+        self.headset_timer.start()
+
+    def cancel_headset_retry(self):
+        if self.headset_timer is not None:
+            self.headset_timer.cancel()
+            self.headset_timer = None
+
+    def record_startup_metric(self, name):
+        if self.started_at is None or name in self.startup_metrics:
+            return
+        self.startup_metrics[name] = time.monotonic() - self.started_at
+        print('{0}: {1:.3f} seconds'.format(name, self.startup_metrics[name]))
+
+    def get_startup_metrics(self):
+        """
+        Returns
+        -------
+        metrics: dict
+            seconds from open() to the headset being connected ('time_to_connected')
+            and to the first stream sample ('time_to_first_sample')
+        """
+        return dict(self.startup_metrics)
+
+    def start_integrity_monitor(self, stream_name, labels):
+        monitor = self.integrity_monitors.get(stream_name)
+        srate = self.headset_settings.get('eegRate' if stream_name == 'eeg' else 'memsRate')
+        if monitor is not None and monitor.labels == list(labels):
+            # subscribed again after a reconnection, keep counting across the gap
+            if monitor.srate is None:
+                monitor.srate = srate
+            return
+        if COUNTER_COLUMNS[stream_name][0] not in labels:
+            # e.g. a replayed recording without the COUNTER column
+            return
+        self.integrity_monitors[stream_name] = StreamIntegrityMonitor(
+            stream_name, labels, srate, None, self.loss_rate_threshold, self.integrity_window_s)
+
+    def get_integrity_stats(self):
+        """
+        Returns
+        -------
+        stats: dict
+            received, lost and interpolated samples and loss rates of each stream with a COUNTER column,
+            see StreamIntegrityMonitor.stats
+        """
+        return {stream_name: monitor.stats() for stream_name, monitor in self.integrity_monitors.items()}
+
+    def set_latency_stats(self, enabled=True, dump_interval_s=None):
+        """
+        To measure per stream latency histograms: receive lag from the 'time' of a frame to on_message,
+        decode time and handler time of the bound handlers, see latency_stats.py
+
+        Parameters
+        ----------
+        enabled : bool, optional
+            set False to stop measuring
+        dump_interval_s : float, optional
+            print the stats every dump_interval_s seconds
+
+        Returns
+        -------
+        None
+        """
+        self.cancel_latency_dump()
+        if not enabled:
+            self.latency_stats = None
+            return
+
+        from latency_stats import LatencyStats
+        self.latency_stats = LatencyStats()
+        self.latency_dump_interval_s = dump_interval_s
+        if dump_interval_s is not None:
+            self.schedule_latency_dump()
+
+    def get_latency_stats(self):
+        """
+        Returns
+        -------
+        stats: dict
+            count, mean, min, max, p50, p90 and p99 in milliseconds of each metric of each stream,
+            e.g. stats['eeg']['handler']['p99_ms']. Empty if set_latency_stats is not called.
+        """
+        if self.latency_stats is None:
+            return {}
+        return self.latency_stats.stats()
+
+    def schedule_latency_dump(self):
+        self.latency_dump_timer = threading.Timer(self.latency_dump_interval_s, self.dump_latency_stats)
+        self.latency_dump_timer.daemon = True
+        self.latency_dump_timer.start()
+
+    def dump_latency_stats(self):
+        if self.latency_stats is None:
+            return
+        print('latency stats --------------------------------')
+        print(self.latency_stats.format())
+        self.schedule_latency_dump()
+
+    def cancel_latency_dump(self):
+        if self.latency_dump_timer is not None:
+            self.latency_dump_timer.cancel()
+            self.latency_dump_timer = None
+
     def query_headset(self):
         print('query headset --------------------------------')
-        query_headset_request = {
-            "jsonrpc": "2.0", 
-            "id": QUERY_HEADSET_ID,
-            "method": "queryHeadsets",
-            "params": {}
-        }
-        if self.debug:
-            print('queryHeadsets request \n', json.dumps(query_headset_request, indent=4))
-
-        self.ws.send(json.dumps(query_headset_request, indent=4))
+        # a query requested now replaces a scheduled one
+        self.cancel_headset_retry()
+        return self.send_request("queryHeadsets", {}, self.handle_query_headset_result)
 
     def connect_headset(self, headset_id):
         print('connect headset --------------------------------')
-        connect_headset_request = {
-            "jsonrpc": "2.0", 
-            "id": CONNECT_HEADSET_ID,
-            "method": "controlDevice",
-            "params": {
-                "command": "connect",
-                "headset": headset_id
-            }
-        }
-        if self.debug:
-            print('controlDevice request \n', json.dumps(connect_headset_request, indent=4))
-
-        self.ws.send(json.dumps(connect_headset_request, indent=4))
+        return self.send_request("controlDevice", {
+            "command": "connect",
+            "headset": headset_id
+        })
 
     def request_access(self):
         print('request access --------------------------------')
-        request_access_request = {
-            "jsonrpc": "2.0", 
-            "method": "requestAccess",
-            "params": {
-                "clientId": self.client_id, 
-                "clientSecret": self.client_secret
-            },
-            "id": REQUEST_ACCESS_ID
-        }
-
-        self.ws.send(json.dumps(request_access_request, indent=4))
+        return self.send_request("requestAccess", {
+            "clientId": self.client_id,
+            "clientSecret": self.client_secret
+        }, self.handle_request_access_result)
 
     def has_access_right(self):
         print('check has access right --------------------------------')
-        has_access_request = {
-            "jsonrpc": "2.0", 
-            "method": "hasAccessRight",
-            "params": {
-                "clientId": self.client_id, 
-                "clientSecret": self.client_secret
-            },
-            "id": HAS_ACCESS_RIGHT_ID
-        }
-        self.ws.send(json.dumps(has_access_request, indent=4))
+        return self.send_request("hasAccessRight", {
+            "clientId": self.client_id,
+            "clientSecret": self.client_secret
+        }, self.handle_has_access_right_result)
 
     def authorize(self):
         print('authorize --------------------------------')
-        authorize_request = {
-            "jsonrpc": "2.0",
-            "method": "authorize", 
-            "params": { 
-                "clientId": self.client_id, 
-                "clientSecret": self.client_secret, 
-                "license": self.license,
-                "debit": self.debit
-            },
-            "id": AUTHORIZE_ID
-        }
-
-        if self.debug:
-            print('auth request \n', json.dumps(authorize_request, indent=4))
-
-        self.ws.send(json.dumps(authorize_request))
+        return self.send_request("authorize", {
+            "clientId": self.client_id,
+            "clientSecret": self.client_secret,
+            "license": self.license,
+            "debit": self.debit
+        }, self.handle_authorize_result)
 
     def create_session(self):
         if self.session_id != '':
@@ -488,46 +1106,28 @@ class Cortex(Dispatcher):
             return
 
         print('create session --------------------------------')
-        create_session_request = { 
-            "jsonrpc": "2.0",
-            "id": CREATE_SESSION_ID,
-            "method": "createSession",
-            "params": {
-                "cortexToken": self.auth,
-                "headset": self.headset_id,
-                "status": "active"
-            }
-        }
-        
-        if self.debug:
-            print('create session request \n', json.dumps(create_session_request, indent=4))
-
-        self.ws.send(json.dumps(create_session_request))
+        future = self.send_request("createSession", {
+            "cortexToken": self.auth,
+            "headset": self.headset_id,
+            "status": "active"
+        }, self.handle_create_session_result)
+        if self.disconnected_at is not None:
+            future.add_done_callback(self.on_resume_create_session_done)
+        elif self.cached_start:
+            future.add_done_callback(self.on_cached_create_session_done)
+        return future
 
     def close_session(self):
         print('close session --------------------------------')
-        close_session_request = { 
-            "jsonrpc": "2.0",
-            "id": CREATE_SESSION_ID,
-            "method": "updateSession",
-            "params": {
-                "cortexToken": self.auth,
-                "session": self.session_id,
-                "status": "close"
-            }
-        }
-
-        self.ws.send(json.dumps(close_session_request))
+        return self.send_request("updateSession", {
+            "cortexToken": self.auth,
+            "session": self.session_id,
+            "status": "close"
+        }, self.handle_close_session_result)
 
     def get_cortex_info(self):
         print('get cortex version --------------------------------')
-        get_cortex_info_request = {
-            "jsonrpc": "2.0",
-            "method": "getCortexInfo",
-            "id":GET_CORTEX_INFO_ID
-        }
-
-        self.ws.send(json.dumps(get_cortex_info_request))
+        return self.send_request("getCortexInfo")
 
     """
         Prepare steps include:
@@ -536,6 +1136,7 @@ class Cortex(Dispatcher):
         Step 3: Connect a headset. If no wanted headet is set, the first headset in the list will be connected.
                 If you use EPOC Flex headset, you should connect the headset with a proper mappings via EMOTIV Launcher first 
         Step 4: Create a working session with the connected headset
+        If prepare_session is False, the steps stop after authorize and sessions are opened by a SessionManager
         Returns
         -------
         None
@@ -543,149 +1144,116 @@ class Cortex(Dispatcher):
 
     def do_prepare_steps(self):
         print('do_prepare_steps--------------------------------')
+        if self.prepare_session and self.cache is not None and self.start_from_cache():
+            return
         # check access right
         self.has_access_right()
 
+    """
+        Fast start with the cache given by cache_path:
+        reuse the cached cortexToken and query the last used headset directly, then create a session.
+        If the token is rejected or the headset is not available, fall back to the prepare steps.
+        """
+
+    def start_from_cache(self):
+        token = self.cache.get_token(self.cache_key())
+        if token is None:
+            return False
+
+        print('start from cache --------------------------------')
+        self.auth = token
+        self.cached_start = True
+        if self.headset_id == '':
+            self.headset_id, _ = self.cache.get_headset(self.cache_key())
+            self.headset_from_cache = self.headset_id != ''
+        self.query_headset()
+        return True
+
+    def fall_back_from_cache(self, reason):
+        print('start from cache failed: ' + reason + '. Do the prepare steps.')
+        self.cached_start = False
+        if self.headset_from_cache:
+            # the cached headset is not available, do not try it first at the next start
+            self.cache.clear_headset(self.cache_key())
+            self.headset_id = ''
+            self.headset_from_cache = False
+        self.has_access_right()
+
+    def on_cached_create_session_done(self, future):
+        if isinstance(future.exception(), CortexError):
+            self.cache.clear_token(self.cache_key())
+            self.fall_back_from_cache('the cached cortexToken is rejected')
+
+    def cache_key(self):
+        return self.client_id + ':' + self.license
+
     def disconnect_headset(self):
         print('disconnect headset --------------------------------')
-        disconnect_headset_request = {
-            "jsonrpc": "2.0", 
-            "id": DISCONNECT_HEADSET_ID,
-            "method": "controlDevice",
-            "params": {
-                "command": "disconnect",
-                "headset": self.headset_id
-            }
-        }
-
-        self.ws.send(json.dumps(disconnect_headset_request))
+        return self.send_request("controlDevice", {
+            "command": "disconnect",
+            "headset": self.headset_id
+        }, self.handle_disconnect_headset_result)
 
     def sub_request(self, stream):
         print('subscribe request --------------------------------')
-        sub_request_json = {
-            "jsonrpc": "2.0", 
-            "method": "subscribe", 
-            "params": { 
-                "cortexToken": self.auth,
-                "session": self.session_id,
-                "streams": stream
-            }, 
-            "id": SUB_REQUEST_ID
-        }
-        if self.debug:
-            print('subscribe request \n', json.dumps(sub_request_json, indent=4))
-
-        self.ws.send(json.dumps(sub_request_json))
+        return self.send_request("subscribe", {
+            "cortexToken": self.auth,
+            "session": self.session_id,
+            "streams": stream
+        }, self.handle_sub_request_result)
 
     def unsub_request(self, stream):
         print('unsubscribe request --------------------------------')
-        unsub_request_json = {
-            "jsonrpc": "2.0", 
-            "method": "unsubscribe", 
-            "params": { 
-                "cortexToken": self.auth,
-                "session": self.session_id,
-                "streams": stream
-            }, 
-            "id": UNSUB_REQUEST_ID
-        }
-        if self.debug:
-            print('unsubscribe request \n', json.dumps(unsub_request_json, indent=4))
-
-        self.ws.send(json.dumps(unsub_request_json))
+        return self.send_request("unsubscribe", {
+            "cortexToken": self.auth,
+            "session": self.session_id,
+            "streams": stream
+        }, self.handle_unsub_request_result)
 
     def extract_data_labels(self, stream_name, stream_cols):
         labels = {}
         labels['streamName'] = stream_name
-
-        data_labels = []
+        labels['labels'] = get_data_labels(stream_name, stream_cols)
         if stream_name == 'eeg':
-            # remove MARKERS
-            data_labels = stream_cols[:-1]
-        elif stream_name == 'dev':
-            # get cq header column except battery, signal and battery percent
-            data_labels = stream_cols[2]
-        else:
-            data_labels = stream_cols
-
-        labels['labels'] = data_labels
+            self.eeg_labels = labels['labels']
+            if self.eeg_block is not None:
+                self.eeg_block.set_labels(self.eeg_labels)
+        if stream_name in COUNTER_COLUMNS:
+            self.start_integrity_monitor(stream_name, labels['labels'])
         print(labels)
         self.emit('new_data_labels', data=labels)
 
     def query_profile(self):
         print('query profile --------------------------------')
-        query_profile_json = {
-            "jsonrpc": "2.0",
-            "method": "queryProfile",
-            "params": {
-              "cortexToken": self.auth,
-            },
-            "id": QUERY_PROFILE_ID
-        }
-
-        if self.debug:
-            print('query profile request \n', json.dumps(query_profile_json, indent=4))
-            print('\n')
-
-        self.ws.send(json.dumps(query_profile_json))
+        return self.send_request("queryProfile", {
+            "cortexToken": self.auth,
+        }, self.handle_query_profile_result)
 
     def get_current_profile(self):
         print('get current profile:')
-        get_profile_json = {
-            "jsonrpc": "2.0",
-            "method": "getCurrentProfile",
-            "params": {
-              "cortexToken": self.auth,
-              "headset": self.headset_id,
-            },
-            "id": GET_CURRENT_PROFILE_ID
-        }
-        
-        if self.debug:
-            print('get current profile json:\n', json.dumps(get_profile_json, indent=4))
-            print('\n')
-
-        self.ws.send(json.dumps(get_profile_json))
+        return self.send_request("getCurrentProfile", {
+            "cortexToken": self.auth,
+            "headset": self.headset_id,
+        }, self.handle_get_current_profile_result)
 
     def setup_profile(self, profile_name, status):
         print('setup profile: ' + status + ' -------------------------------- ')
-        setup_profile_json = {
-            "jsonrpc": "2.0",
-            "method": "setupProfile",
-            "params": {
-              "cortexToken": self.auth,
-              "headset": self.headset_id,
-              "profile": profile_name,
-              "status": status
-            },
-            "id": SETUP_PROFILE_ID
-        }
-        
-        if self.debug:
-            print('setup profile json:\n', json.dumps(setup_profile_json, indent=4))
-            print('\n')
-
-        self.ws.send(json.dumps(setup_profile_json))
+        return self.send_request("setupProfile", {
+            "cortexToken": self.auth,
+            "headset": self.headset_id,
+            "profile": profile_name,
+            "status": status
+        }, self.handle_setup_profile_result)
 
     def train_request(self, detection, action, status):
         print('train request --------------------------------')
-        train_request_json = {
-            "jsonrpc": "2.0", 
-            "method": "training", 
-            "params": {
-              "cortexToken": self.auth,
-              "detection": detection,
-              "session": self.session_id,
-              "action": action,
-              "status": status
-            }, 
-            "id": TRAINING_ID
-        }
-        if self.debug:
-            print('training request:\n', json.dumps(train_request_json, indent=4))
-            print('\n')
-
-        self.ws.send(json.dumps(train_request_json))
+        return self.send_request("training", {
+            "cortexToken": self.auth,
+            "detection": detection,
+            "session": self.session_id,
+            "action": action,
+            "status": status
+        })
 
     def create_record(self, title, **kwargs):
         print('create record --------------------------------')
@@ -701,32 +1269,14 @@ class Cortex(Dispatcher):
         for key, value in kwargs.items():
             params_val.update({key: value})
 
-        create_record_request = {
-            "jsonrpc": "2.0", 
-            "method": "createRecord",
-            "params": params_val, 
-            "id": CREATE_RECORD_REQUEST_ID
-        }
-        if self.debug:
-            print('create record request:\n', json.dumps(create_record_request, indent=4))
-
-        self.ws.send(json.dumps(create_record_request))
+        return self.send_request("createRecord", params_val, self.handle_create_record_result)
 
     def stop_record(self):
         print('stop record --------------------------------')
-        stop_record_request = {
-            "jsonrpc": "2.0", 
-            "method": "stopRecord",
-            "params": {
-                "cortexToken": self.auth,
-                "session": self.session_id
-            }, 
-
-            "id": STOP_RECORD_REQUEST_ID
-        }
-        if self.debug:
-            print('stop record request:\n', json.dumps(stop_record_request, indent=4))
-        self.ws.send(json.dumps(stop_record_request))
+        return self.send_request("stopRecord", {
+            "cortexToken": self.auth,
+            "session": self.session_id
+        }, self.handle_stop_record_result)
 
     def export_record(self, folder, stream_types, export_format, record_ids,
                       version, **kwargs):
@@ -750,18 +1300,7 @@ class Cortex(Dispatcher):
         for key, value in kwargs.items():
             params_val.update({key: value})
 
-        export_record_request = {
-            "jsonrpc": "2.0",
-            "id":EXPORT_RECORD_ID,
-            "method": "exportRecord", 
-            "params": params_val
-        }
-
-        if self.debug:
-            print('export record request \n',
-                json.dumps(export_record_request, indent=4))
-        
-        self.ws.send(json.dumps(export_record_request))
+        return self.send_request("exportRecord", params_val, self.handle_export_record_result)
 
     def inject_marker_request(self, time, value, label, **kwargs):
         print('inject marker --------------------------------')
@@ -774,15 +1313,7 @@ class Cortex(Dispatcher):
         for key, value in kwargs.items():
             params_val.update({key: value})
 
-        inject_marker_request = {
-            "jsonrpc": "2.0",
-            "id": INJECT_MARKER_REQUEST_ID,
-            "method": "injectMarker", 
-            "params": params_val
-        }
-        if self.debug:
-            print('inject marker request \n', json.dumps(inject_marker_request, indent=4))
-        self.ws.send(json.dumps(inject_marker_request))
+        return self.send_request("injectMarker", params_val, self.handle_inject_marker_result)
 
     def update_marker_request(self, markerId, time, **kwargs):
         print('update marker --------------------------------')
@@ -794,133 +1325,63 @@ class Cortex(Dispatcher):
         for key, value in kwargs.items():
             params_val.update({key: value})
 
-        update_marker_request = {
-            "jsonrpc": "2.0",
-            "id": UPDATE_MARKER_REQUEST_ID,
-            "method": "updateMarker", 
-            "params": params_val
-        }
-        if self.debug:
-            print('update marker request \n', json.dumps(update_marker_request, indent=4))
-        self.ws.send(json.dumps(update_marker_request))
+        return self.send_request("updateMarker", params_val, self.handle_update_marker_result)
 
     def get_mental_command_action_sensitivity(self, profile_name):
         print('get mental command sensitivity ------------------')
-        sensitivity_request = {
-            "id": SENSITIVITY_REQUEST_ID,
-            "jsonrpc": "2.0",
-            "method": "mentalCommandActionSensitivity",
-            "params": {
-                "cortexToken": self.auth,
-                "profile": profile_name,
-                "status": "get"
-            }
-        }
-        if self.debug:
-            print('get mental command sensitivity \n', json.dumps(sensitivity_request, indent=4))
-
-        self.ws.send(json.dumps(sensitivity_request))
+        return self.send_request("mentalCommandActionSensitivity", {
+            "cortexToken": self.auth,
+            "profile": profile_name,
+            "status": "get"
+        }, self.handle_mc_action_sensitivity_result)
 
     def set_mental_command_action_sensitivity(self, profile_name, values):
         print('set mental command sensitivity ------------------')
-        sensitivity_request = {
-                                "id": SENSITIVITY_REQUEST_ID,
-                                "jsonrpc": "2.0",
-                                "method": "mentalCommandActionSensitivity",
-                                "params": {
-                                    "cortexToken": self.auth,
-                                    "profile": profile_name,
-                                    "session": self.session_id,
-                                    "status": "set",
-                                    "values": values
-                                }
-                            }
-        if self.debug:
-            print('set mental command sensitivity \n', json.dumps(sensitivity_request, indent=4))
-            
-        self.ws.send(json.dumps(sensitivity_request))
+        return self.send_request("mentalCommandActionSensitivity", {
+            "cortexToken": self.auth,
+            "profile": profile_name,
+            "session": self.session_id,
+            "status": "set",
+            "values": values
+        }, self.handle_mc_action_sensitivity_result)
 
     def get_mental_command_active_action(self, profile_name):
         print('get mental command active action ------------------')
-        command_active_request = {
-            "id": MENTAL_COMMAND_ACTIVE_ACTION_ID,
-            "jsonrpc": "2.0",
-            "method": "mentalCommandActiveAction",
-            "params": {
-                "cortexToken": self.auth,
-                "profile": profile_name,
-                "status": "get"
-            }
-        }
-        if self.debug:
-            print('get mental command active action \n', json.dumps(command_active_request, indent=4))
-
-        self.ws.send(json.dumps(command_active_request))
+        return self.send_request("mentalCommandActiveAction", {
+            "cortexToken": self.auth,
+            "profile": profile_name,
+            "status": "get"
+        }, self.handle_mc_active_action_result)
 
     def set_mental_command_active_action(self, actions):
         print('set mental command active action ------------------')
-        command_active_request = {
-            "id": SET_MENTAL_COMMAND_ACTIVE_ACTION_ID,
-            "jsonrpc": "2.0",
-            "method": "mentalCommandActiveAction",
-            "params": {
-                "cortexToken": self.auth,
-                "session": self.session_id,
-                "status": "set",
-                "actions": actions
-            }
-        }
-
-        if self.debug:
-            print('set mental command active action \n', json.dumps(command_active_request, indent=4))
-
-        self.ws.send(json.dumps(command_active_request))
+        return self.send_request("mentalCommandActiveAction", {
+            "cortexToken": self.auth,
+            "session": self.session_id,
+            "status": "set",
+            "actions": actions
+        })
 
     def get_mental_command_brain_map(self, profile_name):
         print('get mental command brain map ------------------')
-        brain_map_request = {
-            "id": MENTAL_COMMAND_BRAIN_MAP_ID,
-            "jsonrpc": "2.0",
-            "method": "mentalCommandBrainMap",
-            "params": {
-                "cortexToken": self.auth,
-                "profile": profile_name,
-                "session": self.session_id
-            }
-        }
-        if self.debug:
-            print('get mental command brain map \n', json.dumps(brain_map_request, indent=4))
-        self.ws.send(json.dumps(brain_map_request))
+        return self.send_request("mentalCommandBrainMap", {
+            "cortexToken": self.auth,
+            "profile": profile_name,
+            "session": self.session_id
+        }, self.handle_mc_brain_map_result)
 
     def get_mental_command_training_threshold(self, profile_name):
         print('get mental command training threshold -------------')
-        training_threshold_request = {
-            "id": MENTAL_COMMAND_TRAINING_THRESHOLD,
-            "jsonrpc": "2.0",
-            "method": "mentalCommandTrainingThreshold",
-            "params": {
-                "cortexToken": self.auth,
-                "session": self.session_id
-            }
-        }
-        if self.debug:
-            print('get mental command training threshold \n', json.dumps(training_threshold_request, indent=4))
-        self.ws.send(json.dumps(training_threshold_request))
+        return self.send_request("mentalCommandTrainingThreshold", {
+            "cortexToken": self.auth,
+            "session": self.session_id
+        }, self.handle_mc_training_threshold_result)
 
     def refresh_headset_list(self):
         print('refresh headset list --------------------------------')
-        refresh_request = {
-            "jsonrpc": "2.0", 
-            "id": REFRESH_HEADSET_LIST_ID,
-            "method": "controlDevice",
-            "params": {
-                "command": "refresh"
-            }
-        }
-        if self.debug:
-            print('controlDevice refresh request \n', json.dumps(refresh_request, indent=4))
-
-        self.ws.send(json.dumps(refresh_request, indent=4))
+        return self.send_request("controlDevice", {
+            "command": "refresh"
+        })
 
 # -------------------------------------------------------------------
 # -------------------------------------------------------------------
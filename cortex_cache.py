@@ -0,0 +1,113 @@
+import base64
+import json
+import os
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cortex_cache.json')
+
+# lifetime of a cortexToken which does not tell its expiry
+DEFAULT_TOKEN_TTL_S = 24 * 3600
+
+# a token is not reused when it expires within this margin
+TOKEN_EXPIRY_MARGIN_S = 60
+
+def token_expiry(token):
+    """
+    To read the expiry time of a cortexToken, which is a JSON Web Token
+
+    Returns
+    -------
+    exp: float or None
+        epoch seconds of the 'exp' claim, None if the token has no readable expiry
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+        return float(exp) if exp is not None else None
+    except (IndexError, ValueError, TypeError, AttributeError):
+        return None
+
+class CortexCache():
+    """
+    An on-disk cache of the cortexToken and the last used headset of each application,
+    so that a restarted process can skip the authorization and the headset scan.
+
+    The file holds one entry per client id and license, for example
+        {"<client_id>:<license>": {"cortexToken": "...", "tokenExpiry": 1700000000.0,
+                                   "headsetId": "EPOCX-...", "headsetStatus": "connected"}}
+    It is readable by the owner only, since the token grants access to Cortex.
+
+    A cache which can not be read or written is only logged: Cortex then does the full prepare steps.
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH, token_ttl_s=DEFAULT_TOKEN_TTL_S):
+        self.path = os.path.expanduser(path)
+        self.token_ttl_s = token_ttl_s
+
+    def get_token(self, key):
+        """
+        Returns
+        -------
+        token: str or None
+            the cached cortexToken, None if there is none or it is about to expire
+        """
+        entry = self._load().get(key, {})
+        token = entry.get('cortexToken')
+        if token is None or entry.get('tokenExpiry', 0) - TOKEN_EXPIRY_MARGIN_S < time.time():
+            return None
+        return token
+
+    def save_token(self, key, token):
+        expiry = token_expiry(token)
+        if expiry is None:
+            expiry = time.time() + self.token_ttl_s
+        self._update(key, cortexToken=token, tokenExpiry=expiry)
+
+    def clear_token(self, key):
+        self._update(key, cortexToken=None, tokenExpiry=None)
+
+    def get_headset(self, key):
+        """
+        Returns
+        -------
+        (headset_id, status): tuple
+            the last used headset, ('', '') if there is none
+        """
+        entry = self._load().get(key, {})
+        return entry.get('headsetId') or '', entry.get('headsetStatus') or ''
+
+    def save_headset(self, key, headset_id, status):
+        self._update(key, headsetId=headset_id, headsetStatus=status)
+
+    def clear_headset(self, key):
+        self._update(key, headsetId=None, headsetStatus=None)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print('Cortex cache {0} can not be read: {1}'.format(self.path, e))
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _update(self, key, **values):
+        data = self._load()
+        entry = data.setdefault(key, {})
+        for name, value in values.items():
+            if value is None:
+                entry.pop(name, None)
+            else:
+                entry[name] = value
+
+        # write a new file then rename it, so that a crash never leaves a truncated cache
+        tmp_path = self.path + '.tmp'
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print('Cortex cache {0} can not be written: {1}'.format(self.path, e))
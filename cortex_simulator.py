@@ -0,0 +1,591 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+import uuid
+
+import websockets # 'pip install websockets' for install
+
+# error codes returned by the simulator, as Cortex does
+ERR_INVALID_PARAMS = -32602
+ERR_METHOD_NOT_FOUND = -32601
+ERR_INVALID_TOKEN = -32014
+ERR_HEADSET_UNAVAILABLE = -32004
+ERR_SESSION_NOT_FOUND = -32005
+
+# warning codes sent by the simulator, see cortex.py
+CORTEX_STOP_ALL_STREAMS = 0
+CORTEX_RECORD_POST_PROCESSING_DONE = 30
+HEADSET_CONNECTED = 104
+HEADSET_SCANNING_FINISHED = 142
+
+EEG_CHANNELS = {
+    5: ['AF3', 'T7', 'Pz', 'T8', 'AF4'],
+    14: ['AF3', 'F7', 'F3', 'FC5', 'T7', 'P7', 'O1', 'O2', 'P8', 'T8', 'FC6', 'F4', 'F8', 'AF4'],
+}
+
+POW_BANDS = ['theta', 'alpha', 'betaL', 'betaH', 'gamma']
+
+MET_COLS = ['eng.isActive', 'eng', 'exc.isActive', 'exc', 'lex', 'str.isActive', 'str',
+            'rel.isActive', 'rel', 'int.isActive', 'int', 'foc.isActive', 'foc']
+
+MOT_COLS = ['COUNTER_MEMS', 'INTERPOLATED_MEMS', 'Q0', 'Q1', 'Q2', 'Q3',
+            'ACCX', 'ACCY', 'ACCZ', 'MAGX', 'MAGY', 'MAGZ']
+
+MC_ACTIONS = ['neutral', 'push', 'pull', 'lift', 'drop', 'left', 'right']
+
+def eeg_channel_names(n_channels):
+    return EEG_CHANNELS.get(n_channels, ['CH{}'.format(i + 1) for i in range(n_channels)])
+
+class SimulatorError(Exception):
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+        super().__init__('{0}: {1}'.format(code, message))
+
+class SimulatedSession():
+    def __init__(self, session_id, headset_id, sim_time):
+        self.id = session_id
+        self.headset_id = headset_id
+        self.started_at = sim_time
+        self.streams = {}
+        self.record = None
+        self.markers = {}
+
+class CortexSimulator():
+    """
+    A local stand-in for the Cortex service, speaking the JSON-RPC methods used by cortex.py,
+    so the wrapper and the examples can run on machines without Cortex nor headset.
+    Connect with Cortex(..., url=simulator.url).
+
+    It streams synthetic eeg, mot, dev, pow, met, com, fac and sys data at the configured rates.
+    The 'time' of the frames advances at the nominal sampling rates, while the frames are sent
+    speed times faster than real time, e.g. speed=10 for load tests.
+
+    Attributes
+    ----------
+    port : int
+        port of the websocket server, 0 for a free port
+    eeg_channels : int
+        number of EEG channels of the simulated headsets
+    eeg_rate, mems_rate : int
+        sampling rates of eeg and mot streams
+    pow_rate, met_rate, com_rate, dev_rate, fac_rate : float
+        frame rates of the other streams
+    jitter_ms : float
+        random delay added to the sending of each burst of frames
+    loss_rate : float
+        ratio of eeg and mot samples which are not sent, their COUNTER still advances
+    speed : float
+        ratio of the sending rate to real time
+    headset_ids : list
+        ids of the simulated headsets
+    connect_delay_s : float
+        time from controlDevice connect to the headset being connected
+    """
+    def __init__(self, host='localhost', port=6868, eeg_channels=14, eeg_rate=128, mems_rate=64,
+                 pow_rate=8, met_rate=2, com_rate=8, dev_rate=2, fac_rate=8, jitter_ms=0.0, loss_rate=0.0,
+                 speed=1.0, headset_ids=None, connected=False, connect_delay_s=1.0, seed=None):
+        if speed <= 0:
+            raise ValueError('speed must be positive.')
+
+        self.host = host
+        self.port = port
+        self.eeg_channels = eeg_channels
+        self.eeg_rate = eeg_rate
+        self.mems_rate = mems_rate
+        self.stream_rates = {'eeg': eeg_rate, 'mot': mems_rate, 'pow': pow_rate, 'met': met_rate,
+                             'com': com_rate, 'dev': dev_rate, 'fac': fac_rate}
+        self.jitter_ms = jitter_ms
+        self.loss_rate = loss_rate
+        self.speed = speed
+        self.connect_delay_s = connect_delay_s
+        self.rng = random.Random(seed)
+
+        if headset_ids is None:
+            headset_ids = ['EPOCX-SIM00001']
+        status = 'connected' if connected else 'discovered'
+        self.headsets = {headset_id: status for headset_id in headset_ids}
+        self.tokens = set()
+        self.records = {}
+        self.profiles = {}
+        self.loaded_profiles = {}
+        self.frames_sent = 0
+
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.stopped = None
+        self.clients = set()
+
+    @property
+    def url(self):
+        return 'ws://{0}:{1}'.format(self.host, self.port)
+
+    def start(self):
+        """
+        To run the simulator on a background thread
+
+        Returns
+        -------
+        url: str
+            the url to pass to Cortex
+        """
+        ready = threading.Event()
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.serve(ready)),
+                                       name='CortexSimulator', daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self.url
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set_result, None)
+        if self.thread is not None:
+            self.thread.join()
+
+    async def serve(self, ready=None):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = self.loop.create_future()
+        async with websockets.serve(self.handle_client, self.host, self.port, max_size=None) as server:
+            self.server = server
+            self.port = server.sockets[0].getsockname()[1]
+            print('Cortex simulator listening on ' + self.url)
+            if ready is not None:
+                ready.set()
+            await self.stopped
+
+    def sim_sleep(self, seconds):
+        return asyncio.sleep(seconds / self.speed)
+
+    # ------------------------------------------------------------------
+    # JSON-RPC
+
+    async def handle_client(self, ws):
+        self.clients.add(ws)
+        sessions = {}
+        tasks = set()
+        try:
+            async for message in ws:
+                request = json.loads(message)
+                req_id = request.get('id')
+                method = request.get('method', '')
+                params = request.get('params', {})
+                handler = getattr(self, 'rpc_' + method, None)
+                if handler is None:
+                    await self.send_error(ws, req_id, ERR_METHOD_NOT_FOUND, 'Method not found: ' + method)
+                    continue
+                try:
+                    result = await handler(ws, sessions, tasks, params)
+                except SimulatorError as e:
+                    await self.send_error(ws, req_id, e.code, e.message)
+                    continue
+                await ws.send(json.dumps({'id': req_id, 'jsonrpc': '2.0', 'result': result}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.clients.discard(ws)
+            for task in tasks:
+                task.cancel()
+
+    async def send_error(self, ws, req_id, code, message):
+        await ws.send(json.dumps({'id': req_id, 'jsonrpc': '2.0', 'error': {'code': code, 'message': message}}))
+
+    async def send_warning(self, ws, code, message):
+        try:
+            await ws.send(json.dumps({'jsonrpc': '2.0', 'warning': {'code': code, 'message': message}}))
+        except websockets.ConnectionClosed:
+            pass
+
+    def spawn(self, tasks, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
+    def check_token(self, params):
+        if params.get('cortexToken') not in self.tokens:
+            raise SimulatorError(ERR_INVALID_TOKEN, 'The access token is invalid.')
+
+    def get_session(self, sessions, params):
+        self.check_token(params)
+        session = sessions.get(params.get('session'))
+        if session is None:
+            raise SimulatorError(ERR_SESSION_NOT_FOUND, 'Session does not exist.')
+        return session
+
+    def headset_info(self, headset_id):
+        return {
+            'id': headset_id,
+            'status': self.headsets[headset_id],
+            'connectedBy': 'dongle' if self.headsets[headset_id] == 'connected' else '',
+            'customName': '',
+            'settings': {'eegRate': self.eeg_rate, 'memsRate': self.mems_rate, 'mode': 'EPOC'},
+            'sensors': eeg_channel_names(self.eeg_channels)
+        }
+
+    async def rpc_getCortexInfo(self, ws, sessions, tasks, params):
+        return {'buildNumber': 'simulator', 'version': '3.0.0'}
+
+    async def rpc_hasAccessRight(self, ws, sessions, tasks, params):
+        return {'accessGranted': True, 'message': 'The user has granted access right to this application.'}
+
+    async def rpc_requestAccess(self, ws, sessions, tasks, params):
+        return {'accessGranted': True, 'message': 'The access right to this application has already been granted.'}
+
+    async def rpc_authorize(self, ws, sessions, tasks, params):
+        token = 'sim-' + uuid.uuid4().hex
+        self.tokens.add(token)
+        return {'cortexToken': token, 'message': 'Authorize successfully.'}
+
+    async def rpc_queryHeadsets(self, ws, sessions, tasks, params):
+        headset_id = params.get('id')
+        if headset_id:
+            return [self.headset_info(headset_id)] if headset_id in self.headsets else []
+        return [self.headset_info(headset_id) for headset_id in self.headsets]
+
+    async def rpc_controlDevice(self, ws, sessions, tasks, params):
+        command = params.get('command')
+        if command == 'refresh':
+            self.spawn(tasks, self.finish_scanning(ws))
+            return {'command': 'refresh', 'message': 'Refreshing headset list.'}
+
+        headset_id = params.get('headset')
+        if headset_id not in self.headsets:
+            raise SimulatorError(ERR_HEADSET_UNAVAILABLE, 'The headset ' + str(headset_id) + ' is not available.')
+        if command == 'connect':
+            if self.headsets[headset_id] == 'discovered':
+                self.headsets[headset_id] = 'connecting'
+                self.spawn(tasks, self.connect_headset(ws, headset_id))
+        elif command == 'disconnect':
+            self.headsets[headset_id] = 'discovered'
+            for session in list(sessions.values()):
+                if session.headset_id == headset_id:
+                    await self.stop_all_streams(ws, sessions, session)
+        else:
+            raise SimulatorError(ERR_INVALID_PARAMS, 'Invalid command ' + str(command))
+        return {'command': command, 'message': 'Start ' + command + 'ing headset ' + headset_id}
+
+    async def finish_scanning(self, ws):
+        await self.sim_sleep(2)
+        await self.send_warning(ws, HEADSET_SCANNING_FINISHED, {'behavior': 'Headset scanning finished.'})
+
+    async def connect_headset(self, ws, headset_id):
+        await self.sim_sleep(self.connect_delay_s)
+        self.headsets[headset_id] = 'connected'
+        await self.send_warning(ws, HEADSET_CONNECTED, {'headsetId': headset_id,
+                                                        'behavior': 'Headset connected successfully.'})
+
+    async def rpc_createSession(self, ws, sessions, tasks, params):
+        self.check_token(params)
+        headset_id = params.get('headset') or next(iter(self.headsets), '')
+        if self.headsets.get(headset_id) != 'connected':
+            raise SimulatorError(ERR_HEADSET_UNAVAILABLE, 'The headset ' + headset_id + ' is not connected.')
+        session = SimulatedSession(str(uuid.uuid4()), headset_id, time.time())
+        sessions[session.id] = session
+        return {'id': session.id, 'status': 'activated', 'headset': self.headset_info(headset_id),
+                'started': session.started_at}
+
+    async def rpc_updateSession(self, ws, sessions, tasks, params):
+        session = self.get_session(sessions, params)
+        for task in session.streams.values():
+            task.cancel()
+        del sessions[session.id]
+        return {'id': session.id, 'status': params.get('status', 'close')}
+
+    async def stop_all_streams(self, ws, sessions, session):
+        for task in session.streams.values():
+            task.cancel()
+        sessions.pop(session.id, None)
+        await self.send_warning(ws, CORTEX_STOP_ALL_STREAMS, {'sessionId': session.id,
+                                                              'behavior': 'Session closed, all streams stopped.'})
+
+    async def rpc_subscribe(self, ws, sessions, tasks, params):
+        session = self.get_session(sessions, params)
+        success = []
+        failure = []
+        for stream_name in params.get('streams', []):
+            cols = self.stream_cols(stream_name)
+            if cols is None:
+                failure.append({'streamName': stream_name, 'code': ERR_INVALID_PARAMS,
+                                'message': 'The stream is not supported by the simulator.'})
+                continue
+            if stream_name not in session.streams:
+                session.streams[stream_name] = self.spawn(tasks, self.stream(ws, session, stream_name))
+            success.append({'streamName': stream_name, 'cols': cols, 'sid': session.id})
+        return {'success': success, 'failure': failure}
+
+    async def rpc_unsubscribe(self, ws, sessions, tasks, params):
+        session = self.get_session(sessions, params)
+        success = []
+        for stream_name in params.get('streams', []):
+            task = session.streams.pop(stream_name, None)
+            if task is not None:
+                task.cancel()
+            success.append({'streamName': stream_name, 'message': 'Unsubscribe successfully', 'sid': session.id})
+        return {'success': success, 'failure': []}
+
+    async def rpc_createRecord(self, ws, sessions, tasks, params):
+        session = self.get_session(sessions, params)
+        record = {'uuid': str(uuid.uuid4()), 'title': params.get('title', ''),
+                  'description': params.get('description', ''), 'startDatetime': time.time(),
+                  'licenseId': '', 'tags': params.get('tags', [])}
+        session.record = record
+        self.records[record['uuid']] = record
+        return {'record': record, 'sessionId': session.id}
+
+    async def rpc_stopRecord(self, ws, sessions, tasks, params):
+        session = self.get_session(sessions, params)
+        if session.record is None:
+            raise SimulatorError(ERR_INVALID_PARAMS, 'There is no record in the session.')
+        record = session.record
+        record['endDatetime'] = time.time()
+        session.record = None
+        self.spawn(tasks, self.post_process(ws, record['uuid']))
+        return {'record': record, 'sessionId': session.id}
+
+    async def post_process(self, ws, record_id):
+        await self.sim_sleep(1)
+        await self.send_warning(ws, CORTEX_RECORD_POST_PROCESSING_DONE, {'recordId': record_id,
+                                                                         'behavior': 'Record post processing done.'})
+
+    async def rpc_exportRecord(self, ws, sessions, tasks, params):
+        self.check_token(params)
+        success = []
+        failure = []
+        for record_id in params.get('recordIds', []):
+            if record_id in self.records and 'endDatetime' in self.records[record_id]:
+                success.append({'recordId': record_id})
+            else:
+                failure.append({'recordId': record_id, 'code': ERR_INVALID_PARAMS,
+                                'message': 'The record is not found or not stopped yet.'})
+        return {'success': success, 'failure': failure}
+
+    async def rpc_injectMarker(self, ws, sessions, tasks, params):
+        session = self.get_session(sessions, params)
+        marker = {'uuid': str(uuid.uuid4()), 'type': 'instance', 'value': params.get('value'),
+                  'label': params.get('label'), 'port': params.get('port', 'Software'),
+                  'startDatetime': params.get('time')}
+        session.markers[marker['uuid']] = marker
+        return {'marker': marker}
+
+    async def rpc_updateMarker(self, ws, sessions, tasks, params):
+        session = self.get_session(sessions, params)
+        marker = session.markers.get(params.get('markerId'))
+        if marker is None:
+            raise SimulatorError(ERR_INVALID_PARAMS, 'The marker is not found.')
+        marker['type'] = 'interval'
+        marker['endDatetime'] = params.get('time')
+        return {'marker': marker}
+
+    async def rpc_queryProfile(self, ws, sessions, tasks, params):
+        self.check_token(params)
+        return [{'name': name, 'readOnly': False, 'uuid': name} for name in self.profiles]
+
+    async def rpc_getCurrentProfile(self, ws, sessions, tasks, params):
+        self.check_token(params)
+        return {'name': self.loaded_profiles.get(params.get('headset')), 'loadedByThisApp': True}
+
+    async def rpc_setupProfile(self, ws, sessions, tasks, params):
+        self.check_token(params)
+        name = params.get('profile')
+        status = params.get('status')
+        headset_id = params.get('headset')
+        if status == 'create':
+            self.profiles.setdefault(name, {'sensitivity': [5, 5, 5, 5], 'trained': []})
+        elif status == 'load':
+            if name not in self.profiles:
+                raise SimulatorError(ERR_INVALID_PARAMS, 'The profile ' + str(name) + ' does not exist.')
+            self.loaded_profiles[headset_id] = name
+        elif status == 'unload':
+            self.loaded_profiles.pop(headset_id, None)
+        elif status not in ('save', 'rename', 'delete'):
+            raise SimulatorError(ERR_INVALID_PARAMS, 'Invalid status ' + str(status))
+        return {'action': status, 'name': name, 'message': 'Setup profile successfully.'}
+
+    def profile_of(self, params):
+        name = params.get('profile')
+        if name is None:
+            # the training calls use the profile loaded with the headset
+            name = next(iter(self.loaded_profiles.values()), None)
+        return self.profiles.setdefault(name, {'sensitivity': [5, 5, 5, 5], 'trained': []})
+
+    async def rpc_mentalCommandActiveAction(self, ws, sessions, tasks, params):
+        self.check_token(params)
+        profile = self.profile_of(params)
+        if params.get('status') == 'set':
+            profile['active'] = params.get('actions', [])
+            return {'action': 'set', 'message': 'Set active actions successfully.'}
+        return profile.get('active', ['neutral', 'push', 'pull'])
+
+    async def rpc_mentalCommandActionSensitivity(self, ws, sessions, tasks, params):
+        self.check_token(params)
+        profile = self.profile_of(params)
+        if params.get('status') == 'set':
+            profile['sensitivity'] = params.get('values', profile['sensitivity'])
+            return {'action': 'set', 'message': 'Set action sensitivity successfully.'}
+        return profile['sensitivity']
+
+    async def rpc_mentalCommandBrainMap(self, ws, sessions, tasks, params):
+        self.check_token(params)
+        profile = self.profile_of(params)
+        return [{'action': action, 'coordinates': [self.rng.uniform(-1, 1), self.rng.uniform(-1, 1)]}
+                for action in ['neutral'] + profile['trained']]
+
+    async def rpc_mentalCommandTrainingThreshold(self, ws, sessions, tasks, params):
+        self.check_token(params)
+        return {'currentThreshold': 0.5, 'lastTrainingScore': round(self.rng.random(), 3)}
+
+    async def rpc_training(self, ws, sessions, tasks, params):
+        session = self.get_session(sessions, params)
+        prefix = 'MC_' if params.get('detection') == 'mentalCommand' else 'FE_'
+        status = params.get('status')
+        action = params.get('action')
+        if status == 'start':
+            self.spawn(tasks, self.train(ws, session, prefix))
+        elif status == 'accept':
+            if prefix == 'MC_' and action not in self.profile_of(params)['trained']:
+                self.profile_of(params)['trained'].append(action)
+            self.spawn(tasks, self.send_sys_event(ws, session, prefix + 'Completed'))
+        elif status == 'reject':
+            self.spawn(tasks, self.send_sys_event(ws, session, prefix + 'Rejected'))
+        elif status == 'reset':
+            self.spawn(tasks, self.send_sys_event(ws, session, prefix + 'Reset'))
+        elif status == 'erase':
+            self.spawn(tasks, self.send_sys_event(ws, session, prefix + 'DataErased'))
+        else:
+            raise SimulatorError(ERR_INVALID_PARAMS, 'Invalid status ' + str(status))
+        return {'action': status, 'message': 'Set up training successfully.'}
+
+    async def train(self, ws, session, prefix):
+        await self.send_sys_event(ws, session, prefix + 'Started')
+        # a training lasts 8 seconds
+        await self.sim_sleep(8)
+        await self.send_sys_event(ws, session, prefix + 'Succeeded')
+
+    async def send_sys_event(self, ws, session, event):
+        if 'sys' not in session.streams:
+            return
+        detection = 'mentalCommand' if event.startswith('MC_') else 'facialExpression'
+        await ws.send(json.dumps({'sys': [detection, event], 'sid': session.id, 'time': time.time()}))
+
+    # ------------------------------------------------------------------
+    # data streams
+
+    def stream_cols(self, stream_name):
+        channels = eeg_channel_names(self.eeg_channels)
+        if stream_name == 'eeg':
+            return ['COUNTER', 'INTERPOLATED'] + channels + ['RAW_CQ', 'MARKER_HARDWARE', 'MARKERS']
+        elif stream_name == 'mot':
+            return list(MOT_COLS)
+        elif stream_name == 'dev':
+            return ['Battery', 'Signal', channels + ['OVERALL'], 'BatteryPercent']
+        elif stream_name == 'pow':
+            return ['{0}/{1}'.format(channel, band) for channel in channels for band in POW_BANDS]
+        elif stream_name == 'met':
+            return list(MET_COLS)
+        elif stream_name == 'com':
+            return ['act', 'pow']
+        elif stream_name == 'fac':
+            return ['eyeAct', 'uAct', 'uPow', 'lAct', 'lPow']
+        elif stream_name == 'sys':
+            return []
+        return None
+
+    async def stream(self, ws, session, stream_name):
+        """
+        To send the frames of a stream. The frames due since the last wake-up are sent
+        as a burst, so high rates and speeds do not need one wake-up per frame.
+        """
+        rate = self.stream_rates.get(stream_name)
+        if rate is None:
+            # sys only carries training events
+            return
+        period = 1.0 / rate
+        wall_start = time.monotonic()
+        index = 0
+        try:
+            while True:
+                due = int((time.monotonic() - wall_start) * self.speed * rate) + 1
+                while index < due:
+                    frame = self.make_frame(session, stream_name, index)
+                    if frame is not None:
+                        await ws.send(json.dumps(frame))
+                        self.frames_sent += 1
+                    index += 1
+                delay = min(period / self.speed, 0.01)
+                if self.jitter_ms > 0:
+                    delay += self.rng.uniform(0, self.jitter_ms / 1000.0)
+                await asyncio.sleep(delay)
+        except websockets.ConnectionClosed:
+            pass
+
+    def make_frame(self, session, stream_name, index):
+        rate = self.stream_rates[stream_name]
+        t = session.started_at + index / rate
+        if stream_name == 'eeg':
+            counter = index % self.eeg_rate
+            if self.loss_rate > 0 and self.rng.random() < self.loss_rate:
+                return None
+            values = [counter, 0]
+            for ch in range(self.eeg_channels):
+                # alpha rhythm on a 4200 uV offset, with noise
+                values.append(round(4200 + 20 * math.sin(2 * math.pi * 10 * t + ch) + self.rng.gauss(0, 5), 6))
+            values += [0.0, 0, []]
+            return {'eeg': values, 'sid': session.id, 'time': t}
+        elif stream_name == 'mot':
+            counter = index % self.mems_rate
+            if self.loss_rate > 0 and self.rng.random() < self.loss_rate:
+                return None
+            values = [counter, 0, 1.0, 0.0, 0.0, 0.0]
+            values += [round(self.rng.gauss(0, 0.01), 6) for _ in range(3)]
+            values += [round(self.rng.gauss(0, 1), 6) for _ in range(3)]
+            return {'mot': values, 'sid': session.id, 'time': t}
+        elif stream_name == 'dev':
+            cq = [4] * self.eeg_channels + [100]
+            return {'dev': [4, 2.0, cq, 95], 'sid': session.id, 'time': t}
+        elif stream_name == 'pow':
+            values = [round(self.rng.uniform(0.1, 10), 3) for _ in range(self.eeg_channels * len(POW_BANDS))]
+            return {'pow': values, 'sid': session.id, 'time': t}
+        elif stream_name == 'met':
+            values = [True if col.endswith('isActive') else round(self.rng.random(), 6) for col in MET_COLS]
+            return {'met': values, 'sid': session.id, 'time': t}
+        elif stream_name == 'com':
+            return {'com': [self.rng.choice(MC_ACTIONS[:3]), round(self.rng.random(), 3)], 'sid': session.id, 'time': t}
+        elif stream_name == 'fac':
+            values = [self.rng.choice(['neutral', 'blink', 'winkL', 'winkR']), self.rng.choice(['neutral', 'surprise', 'frown']),
+                      round(self.rng.random(), 3), self.rng.choice(['neutral', 'smile', 'clench']), round(self.rng.random(), 3)]
+            return {'fac': values, 'sid': session.id, 'time': t}
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Local simulator of the Cortex service')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6868)
+    parser.add_argument('--channels', type=int, default=14, help='number of EEG channels')
+    parser.add_argument('--eeg-rate', type=int, default=128)
+    parser.add_argument('--mems-rate', type=int, default=64)
+    parser.add_argument('--pow-rate', type=float, default=8)
+    parser.add_argument('--met-rate', type=float, default=2)
+    parser.add_argument('--com-rate', type=float, default=8)
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='random delay of each burst of frames')
+    parser.add_argument('--loss-rate', type=float, default=0.0, help='ratio of eeg and mot samples not sent')
+    parser.add_argument('--speed', type=float, default=1.0, help='10 sends the data 10 times faster than real time')
+    parser.add_argument('--headset', action='append', help='id of a simulated headset, can be repeated')
+    parser.add_argument('--connected', action='store_true', help='the headsets are connected at start')
+    args = parser.parse_args()
+
+    simulator = CortexSimulator(args.host, args.port, args.channels, args.eeg_rate, args.mems_rate,
+                                args.pow_rate, args.met_rate, args.com_rate, jitter_ms=args.jitter_ms,
+                                loss_rate=args.loss_rate, speed=args.speed, headset_ids=args.headset,
+                                connected=args.connected)
+    try:
+        asyncio.run(simulator.serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import collections
+import threading
+import traceback
+
+# backpressure policies of a QueuedHandler when its queue is full
+BLOCK = 'block'                     # the emitting thread waits for room in the queue
+DROP_OLDEST = 'drop_oldest'         # the oldest queued event is dropped
+COALESCE_LATEST = 'coalesce_latest' # only the latest event is kept, whatever the queue size
+
+POLICIES = (BLOCK, DROP_OLDEST, COALESCE_LATEST)
+
+class QueuedHandler():
+    """
+    Runs a handler on its own worker thread, fed by a bounded queue, so that a slow
+    handler never stalls the thread which emits the events.
+
+    Attributes
+    ----------
+    name : str
+        name of the handler, used for the worker thread and the stats
+    maxsize : int
+        maximum number of queued events
+    policy : str
+        BLOCK, DROP_OLDEST or COALESCE_LATEST
+    handled : int
+        number of events processed by the handler
+    dropped : int
+        number of events dropped or replaced by a newer event
+    max_depth : int
+        highest number of queued events seen
+    """
+    def __init__(self, handler, maxsize=256, policy=BLOCK, name=None):
+        if policy not in POLICIES:
+            raise ValueError('Invalid policy ' + str(policy) + '. It must be one of ' + ', '.join(POLICIES))
+        if maxsize <= 0:
+            raise ValueError('maxsize must be positive.')
+
+        self.handler = handler
+        self.maxsize = maxsize
+        self.policy = policy
+        self.name = name if name is not None else getattr(handler, '__qualname__', repr(handler))
+        self.handled = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='QueuedHandler:-' + self.name, daemon=True)
+        self._thread.start()
+
+    def dispatch(self, *args, **kwargs):
+        """
+        To queue an event for the handler. It is bound to the Dispatcher in place of the handler.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            if self.policy == COALESCE_LATEST:
+                self.dropped += len(self._queue)
+                self._queue.clear()
+            elif len(self._queue) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._queue) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+
+            self._queue.append((args, kwargs))
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        Returns
+        -------
+        stats: dict
+            queue depth and counters of the handler
+        """
+        with self._cond:
+            return {
+                'name': self.name,
+                'policy': self.policy,
+                'depth': len(self._queue),
+                'max_depth': self.max_depth,
+                'handled': self.handled,
+                'dropped': self.dropped
+            }
+
+    def close(self, wait=True):
+        """
+        To stop the worker once the queued events are handled
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while len(self._queue) == 0 and not self._closed:
+                    self._cond.wait()
+                if len(self._queue) == 0:
+                    return
+                args, kwargs = self._queue.popleft()
+                self._cond.notify_all()
+
+            try:
+                self.handler(*args, **kwargs)
+            except Exception:
+                # keep the worker alive for the next events
+                print('QueuedHandler ' + self.name + ' failed:')
+                traceback.print_exc()
+
+            with self._cond:
+                self.handled += 1
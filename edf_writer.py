@@ -0,0 +1,545 @@
+import datetime
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from stream_store import marker_time
+
+# columns of the eeg and mot streams which hold integers: they are stored with a gain of 1
+INTEGER_LABELS = {'COUNTER', 'INTERPOLATED', 'RAW_CQ', 'MARKER_HARDWARE', 'COUNTER_MEMS', 'INTERPOLATED_MEMS'}
+
+# physical minimum, maximum and dimension of the columns which are not integers, by label prefix
+PHYSICAL_RANGES = {
+    'Q': (-1.0, 1.0, ''),
+    'ACC': (-16.0, 16.0, 'g'),
+    'MAG': (-1000.0, 1000.0, 'uT'),
+    'GYRO': (-32768.0, 32767.0, ''),
+}
+
+# EEG channels of Emotiv headsets are in uV on a 4200 uV offset
+EEG_PHYSICAL_RANGE = (0.0, 8400.0, 'uV')
+
+ANNOTATION_LABELS = {False: 'EDF Annotations', True: 'BDF Annotations'}
+
+def edf_field(value, width):
+    """
+    To format a header field: ASCII, left aligned and padded with spaces
+    """
+    text = str(value).encode('ascii', 'replace')[:width]
+    return text + b' ' * (width - len(text))
+
+def edf_number(value, width=8):
+    """
+    To format a number in at most width characters, with the precision which fits
+    """
+    if float(value).is_integer():
+        text = str(int(value))
+    else:
+        text = repr(float(value))
+        if len(text) > width:
+            integer_digits = len(str(int(abs(value)))) + (1 if value < 0 else 0)
+            text = '{0:.{1}f}'.format(value, max(width - integer_digits - 1, 0))
+    if len(text) > width:
+        raise ValueError('The number {} does not fit in an EDF header field.'.format(value))
+    return edf_field(text, width)
+
+def physical_range(stream_name, label, bdf):
+    """
+    Returns
+    -------
+    (physical_min, physical_max, dimension): tuple
+        default range of a column of the eeg or mot stream
+    """
+    if label in INTEGER_LABELS:
+        digital_min, digital_max = digital_range(bdf)
+        return float(digital_min), float(digital_max), ''
+    if stream_name == 'eeg':
+        return EEG_PHYSICAL_RANGE
+    for prefix, value_range in PHYSICAL_RANGES.items():
+        if label.startswith(prefix):
+            return value_range
+    digital_min, digital_max = digital_range(bdf)
+    return float(digital_min), float(digital_max), ''
+
+def digital_range(bdf):
+    return (-(1 << 23), (1 << 23) - 1) if bdf else (-(1 << 15), (1 << 15) - 1)
+
+class EdfSignal():
+    """
+    A signal of an EDF file and its conversion from physical to digital values
+
+    Attributes
+    ----------
+    label : str
+        at most 16 characters
+    samples_per_record : int
+        number of samples in each data record
+    """
+    def __init__(self, label, samples_per_record, physical_min, physical_max, dimension='', bdf=False,
+                 transducer='', prefiltering=''):
+        if physical_max <= physical_min:
+            raise ValueError('The physical maximum of ' + label + ' must be greater than its minimum.')
+        self.label = label
+        self.samples_per_record = samples_per_record
+        self.physical_min = physical_min
+        self.physical_max = physical_max
+        self.dimension = dimension
+        self.transducer = transducer
+        self.prefiltering = prefiltering
+        self.digital_min, self.digital_max = digital_range(bdf)
+        self.gain = (physical_max - physical_min) / (self.digital_max - self.digital_min)
+
+    def to_digital(self, values):
+        digital = np.round((np.asarray(values, dtype=np.float64) - self.physical_min) / self.gain) + self.digital_min
+        # out of range values are clipped and missing values stored as the minimum
+        digital = np.nan_to_num(digital, nan=self.digital_min)
+        return np.clip(digital, self.digital_min, self.digital_max).astype(np.int32)
+
+class EdfWriter():
+    """
+    Writes an EDF+ or BDF+ file one data record at a time.
+
+    Each data record starts with a time-keeping annotation of its onset, so a gap in the data does
+    not shift the following records. The file is continuous (EDF+C) until the onset of a record is
+    not the end of the previous one, then it is marked discontinuous (EDF+D), which some readers
+    refuse. The number of data records in the header is patched after each record, so a file left
+    by an abrupt stop is readable as it is. repair_edf() removes an incomplete last record.
+
+    Attributes
+    ----------
+    path : str
+        path of the file
+    bdf : bool
+        True for 24 bit BDF+, False for 16 bit EDF+
+    signals : list of EdfSignal
+        the data signals, the annotation signal is added after them
+    record_duration : float
+        duration of a data record in seconds
+    annotation_bytes : int
+        size of the annotations in each data record. Annotations which do not fit are written
+        in the next records.
+    discontinuous : bool
+        True once a record did not start at the end of the previous one
+    """
+    def __init__(self, path, signals, record_duration=1.0, bdf=False, annotation_bytes=256,
+                 patient_id='X X X X', recording_id='X X X', fsync_interval_s=5.0):
+        if len(signals) == 0:
+            raise ValueError('An EDF file needs at least one signal.')
+        self.path = path
+        self.signals = list(signals)
+        self.record_duration = record_duration
+        self.bdf = bdf
+        self.sample_bytes = 3 if bdf else 2
+        self.annotation_samples = int(math.ceil(annotation_bytes / self.sample_bytes))
+        self.annotation_bytes = self.annotation_samples * self.sample_bytes
+        self.patient_id = patient_id
+        self.recording_id = recording_id
+        self.fsync_interval_s = fsync_interval_s
+        self.start_time = None
+        self.n_records = 0
+        self.discontinuous = False
+        self.next_onset = None
+        # half the shortest sample period: the onsets are times of samples
+        self.gap_tolerance_s = 0.5 * record_duration / max(signal.samples_per_record for signal in self.signals)
+        self.pending_annotations = []
+        self.file = None
+        self._last_fsync = 0.0
+
+    def open(self, start_time):
+        """
+        To write the header. The start time of the header has a resolution of one second,
+        the fraction goes to the onset of the data records.
+        """
+        self.start_time = float(math.floor(start_time))
+        self.file = open(self.path, 'wb')
+        self.file.write(self.header(-1))
+        self.file.flush()
+
+    def header(self, n_records):
+        signals = self.signals + [EdfSignal(ANNOTATION_LABELS[self.bdf], self.annotation_samples, -1, 1, bdf=self.bdf)]
+        ns = len(signals)
+        start = datetime.datetime.fromtimestamp(self.start_time)
+
+        header = b'\xffBIOSEMI' if self.bdf else edf_field('0', 8)
+        header += edf_field(self.patient_id, 80)
+        header += edf_field('Startdate {0} {1}'.format(start.strftime('%d-%b-%Y').upper(), self.recording_id), 80)
+        header += edf_field(start.strftime('%d.%m.%y'), 8)
+        header += edf_field(start.strftime('%H.%M.%S'), 8)
+        header += edf_number(256 * (ns + 1))
+        header += self.reserved()
+        header += edf_number(n_records)
+        header += edf_number(self.record_duration)
+        header += edf_number(ns, 4)
+
+        header += b''.join(edf_field(s.label, 16) for s in signals)
+        header += b''.join(edf_field(s.transducer, 80) for s in signals)
+        header += b''.join(edf_field(s.dimension, 8) for s in signals)
+        header += b''.join(edf_number(s.physical_min) for s in signals)
+        header += b''.join(edf_number(s.physical_max) for s in signals)
+        header += b''.join(edf_number(s.digital_min) for s in signals)
+        header += b''.join(edf_number(s.digital_max) for s in signals)
+        header += b''.join(edf_field(s.prefiltering, 80) for s in signals)
+        header += b''.join(edf_number(s.samples_per_record) for s in signals)
+        header += b''.join(edf_field('', 32) for s in signals)
+        return header
+
+    def reserved(self):
+        return edf_field(('BDF+' if self.bdf else 'EDF+') + ('D' if self.discontinuous else 'C'), 44)
+
+    def patch_header(self, offset, field):
+        self.file.seek(offset)
+        self.file.write(field)
+        self.file.seek(0, os.SEEK_END)
+
+    def add_annotation(self, t, text, duration=None):
+        """
+        To annotate the recording, e.g. with a marker, at time t in epoch seconds
+        """
+        self.pending_annotations.append((t, duration, text))
+
+    def annotations_block(self, onset):
+        # the first TAL of a data record keeps its onset
+        block = '+{:.6f}'.format(onset).rstrip('0').rstrip('.').encode('ascii') + b'\x14\x14\x00'
+        time_keeping_bytes = len(block)
+        while len(self.pending_annotations) > 0:
+            t, duration, text = self.pending_annotations[0]
+            text = text.replace('\x14', ' ').replace('\x00', ' ')
+            tal = '{0:+.6f}'.format(t - self.start_time).rstrip('0').rstrip('.')
+            if duration is not None:
+                tal += '\x15' + '{:.6f}'.format(duration).rstrip('0').rstrip('.')
+            tal = tal.encode('ascii') + b'\x14' + text.encode('utf-8') + b'\x14\x00'
+            if len(block) + len(tal) > self.annotation_bytes:
+                if time_keeping_bytes + len(tal) > self.annotation_bytes:
+                    print('The annotation {} is too long for the annotation signal, it is dropped'.format(text))
+                    self.pending_annotations.pop(0)
+                    continue
+                break
+            block += tal
+            self.pending_annotations.pop(0)
+        return block + b'\x00' * (self.annotation_bytes - len(block))
+
+    def write_record(self, samples, onset_time):
+        """
+        To append a data record
+
+        Parameters
+        ----------
+        samples : list of arrays
+            physical values of each signal, samples_per_record of them
+        onset_time : float
+            time of the first sample of the record, in epoch seconds
+        """
+        if self.file is None:
+            self.open(onset_time)
+        if self.next_onset is not None and not self.discontinuous:
+            if abs(onset_time - self.next_onset) > self.gap_tolerance_s:
+                self.discontinuous = True
+                self.patch_header(192, self.reserved())
+            else:
+                # readers of EDF+C require exactly contiguous onsets, the jitter of the sample times is dropped
+                onset_time = self.next_onset
+        self.next_onset = onset_time + self.record_duration
+        digital = np.concatenate([signal.to_digital(values) for signal, values in zip(self.signals, samples)])
+        if self.bdf:
+            data = digital.astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+        else:
+            data = digital.astype('<i2').tobytes()
+        # one write per record, so an abrupt stop leaves at most one incomplete record
+        self.file.write(data + self.annotations_block(onset_time - self.start_time))
+        self.n_records += 1
+        self.patch_header(236, edf_number(self.n_records))
+        self.file.flush()
+        if time.monotonic() - self._last_fsync >= self.fsync_interval_s:
+            os.fsync(self.file.fileno())
+            self._last_fsync = time.monotonic()
+
+    def close(self):
+        """
+        To close the file, with the number of data records in the header
+        """
+        if self.file is None:
+            return
+        self.patch_header(236, edf_number(self.n_records))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+def repair_edf(path):
+    """
+    To complete an EDF or BDF file left by an abrupt stop: the incomplete last data record is
+    removed and the number of data records is written in the header
+
+    Returns
+    -------
+    n_records: int
+        number of complete data records
+    """
+    with open(path, 'r+b') as f:
+        header = f.read(256)
+        header_bytes = int(header[184:192])
+        ns = int(header[252:256])
+        f.seek(256 + 216 * ns)
+        samples_per_record = [int(f.read(8)) for _ in range(ns)]
+        sample_bytes = 3 if header[0:1] == b'\xff' else 2
+        record_bytes = sum(samples_per_record) * sample_bytes
+        n_records = (os.path.getsize(path) - header_bytes) // record_bytes
+        f.truncate(header_bytes + n_records * record_bytes)
+        f.seek(236)
+        f.write(edf_number(n_records))
+    return n_records
+
+class StreamBuffer():
+    """
+    Samples of one stream waiting for a complete data record
+    """
+    def __init__(self, stream_name, labels, srate):
+        self.stream_name = stream_name
+        self.labels = list(labels)
+        self.srate = srate
+        self.times = np.empty(0)
+        self.values = np.empty((0, len(labels)))
+        self.count = 0
+        self.padded = 0
+
+    def append(self, times, values):
+        n = len(times)
+        if self.count + n > len(self.times):
+            size = max(2 * len(self.times), self.count + n, 64)
+            times_buffer = np.empty(size)
+            values_buffer = np.empty((size, len(self.labels)))
+            times_buffer[:self.count] = self.times[:self.count]
+            values_buffer[:self.count] = self.values[:self.count]
+            self.times, self.values = times_buffer, values_buffer
+        self.times[self.count:self.count + n] = times
+        self.values[self.count:self.count + n] = values
+        self.count += n
+
+    def take(self, n):
+        """
+        To remove the first n samples, repeating the last one if there are fewer
+
+        Returns
+        -------
+        (times, values): tuple
+        """
+        available = min(n, self.count)
+        times = self.times[:available].copy()
+        values = self.values[:available].copy()
+        if available < n:
+            self.padded += n - available
+            last = self.values[available - 1] if available > 0 else np.full(len(self.labels), np.nan)
+            values = np.vstack([values, np.tile(last, (n - available, 1))])
+        self.times[:self.count - available] = self.times[available:self.count]
+        self.values[:self.count - available] = self.values[available:self.count]
+        self.count -= available
+        return times, values
+
+class EdfStreamWriter():
+    """
+    Writes the live eeg and mot streams to an EDF+ or BDF+ file as the data arrives, without the
+    exporter of Cortex. Injected markers are written as annotations.
+
+    The signals are the columns of the streams, named as in their new_data_labels event, e.g. 'AF3'
+    and 'Q0'. A data record is written once every stream has its samples for it. When a stream
+    is late by max_lag_records records, e.g. it stopped, its samples are padded with its last value.
+    In the block mode of Cortex.set_eeg_block_mode() the eeg samples are float32, e.g. 4200.128 for
+    4200.128205: about 0.0005 uV at 4200 uV, well below the 0.128 uV step of EDF over the default
+    range, but as fine as the step of BDF, so a BDF value may differ by one step from the per-sample one.
+
+    Attributes
+    ----------
+    path : str
+        .edf for 16 bit EDF+, .bdf for 24 bit BDF+
+    streams : list
+        written streams, eeg and/or mot. The file starts with the streams whose labels are known.
+    record_duration : float
+        duration of a data record in seconds
+    physical_ranges : dict
+        (physical_min, physical_max, dimension) by label, instead of the defaults of physical_range()
+    """
+    def __init__(self, source, path, streams=('eeg', 'mot'), record_duration=1.0, physical_ranges=None,
+                 max_lag_records=2, **kwargs):
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in ('.edf', '.bdf'):
+            raise ValueError('Unsupported file format ' + extension + '. It must be EDF or BDF.')
+        for stream_name in streams:
+            if stream_name not in ('eeg', 'mot'):
+                raise ValueError('The stream ' + stream_name + ' can not be written to EDF. It must be eeg or mot.')
+
+        self.source = source
+        self.path = path
+        self.bdf = extension == '.bdf'
+        self.streams = list(streams)
+        self.record_duration = record_duration
+        self.physical_ranges = physical_ranges or {}
+        self.max_lag_records = max_lag_records
+        self.writer_kwargs = kwargs
+        self.buffers = {}
+        self.writer = None
+        self.written_streams = []
+        self.pending_annotations = []
+        self.writing = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        To start writing. The labels of a stream come with its new_data_labels event, so start before subscribing.
+        """
+        self.writing = True
+        self.source.bind(new_data_labels=self.on_new_data_labels)
+        self.source.bind(inject_marker_done=self.on_inject_marker_done)
+        if 'eeg' in self.streams:
+            self.source.bind(new_eeg_data=self.on_new_eeg_data, new_eeg_block=self.on_new_eeg_block)
+        if 'mot' in self.streams:
+            self.source.bind(new_mot_data=self.on_new_mot_data)
+
+    def stop(self):
+        """
+        To write the data records of the buffered samples and close the file. Samples which do not
+        make a complete data record are not written.
+        """
+        self.source.unbind(self.on_new_data_labels, self.on_inject_marker_done, self.on_new_eeg_data,
+                           self.on_new_eeg_block, self.on_new_mot_data)
+        with self._lock:
+            self.writing = False
+            if self.writer is not None:
+                self.write_records()
+                self.writer.close()
+                print('EDF file {0} closed with {1} data records'.format(self.path, self.writer.n_records))
+
+    def on_new_data_labels(self, *args, **kwargs):
+        data = kwargs.get('data')
+        stream_name = data['streamName']
+        if stream_name not in self.streams:
+            return
+        with self._lock:
+            buffer = self.buffers.get(stream_name)
+            if buffer is not None and buffer.labels == list(data['labels']):
+                return
+            if self.writer is not None:
+                print('The labels of stream ' + stream_name + ' changed, they are not written to ' + self.path)
+                return
+            settings = getattr(self.source, 'headset_settings', {})
+            srate = settings.get('eegRate' if stream_name == 'eeg' else 'memsRate')
+            self.buffers[stream_name] = StreamBuffer(stream_name, data['labels'], srate)
+
+    def on_inject_marker_done(self, *args, **kwargs):
+        data = kwargs.get('data')
+        label = data.get('label')
+        text = str(data.get('value')) if not label else '{0}:{1}'.format(label, data.get('value'))
+        self.add_annotation(marker_time(data), text)
+
+    def add_annotation(self, t, text, duration=None):
+        """
+        To annotate the file at time t in epoch seconds, e.g. with an event which is not injected to Cortex
+        """
+        with self._lock:
+            if self.writer is not None:
+                self.writer.add_annotation(t, text, duration)
+            else:
+                self.pending_annotations.append((t, text, duration))
+
+    def on_new_eeg_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        self.append('eeg', [data['time']], [data['eeg']])
+
+    def on_new_eeg_block(self, *args, **kwargs):
+        data = kwargs.get('data')
+        self.append('eeg', data['time'], data['eeg'])
+
+    def on_new_mot_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        self.append('mot', [data['time']], [data['mot']])
+
+    def append(self, stream_name, times, values):
+        with self._lock:
+            buffer = self.buffers.get(stream_name)
+            if buffer is None or not self.writing:
+                return
+            if self.writer is not None and stream_name not in self.written_streams:
+                return
+            values = np.asarray(values, dtype=np.float64)
+            if values.ndim != 2 or values.shape[1] != len(buffer.labels):
+                return
+            buffer.append(np.asarray(times, dtype=np.float64), values)
+            if self.writer is None:
+                self.open_writer()
+            if self.writer is not None:
+                self.write_records()
+
+    def samples_per_record(self, buffer):
+        return int(round(buffer.srate * self.record_duration))
+
+    def open_writer(self):
+        """
+        To create the file once every stream has the samples of a data record, or a stream has
+        max_lag_records of them. Called with the lock held.
+        """
+        for buffer in self.buffers.values():
+            if buffer.srate is None and buffer.count >= 16:
+                # the rate is not in the headset settings, e.g. a replayed recording
+                buffer.srate = float(round(1.0 / np.median(np.diff(buffer.times[:buffer.count]))))
+        ready = [buffer for buffer in self.buffers.values()
+                 if buffer.srate is not None and buffer.count >= self.samples_per_record(buffer)]
+        if len(ready) == 0:
+            return
+        if len(ready) < len(self.streams) and \
+                max(buffer.count / self.samples_per_record(buffer) for buffer in ready) < self.max_lag_records:
+            return
+
+        signals = []
+        for stream_name in self.streams:
+            buffer = self.buffers.get(stream_name)
+            if buffer not in ready:
+                continue
+            self.written_streams.append(stream_name)
+            for label in buffer.labels:
+                physical_min, physical_max, dimension = self.physical_ranges.get(
+                    label, physical_range(stream_name, label, self.bdf))
+                signals.append(EdfSignal(label[:16],
+                                         self.samples_per_record(buffer), physical_min, physical_max,
+                                         dimension, self.bdf))
+        for stream_name in self.streams:
+            if stream_name not in self.written_streams:
+                print('The stream ' + stream_name + ' has no data, it is not written to ' + self.path)
+                self.buffers.pop(stream_name, None)
+
+        self.writer = EdfWriter(self.path, signals, self.record_duration, self.bdf, **self.writer_kwargs)
+        for t, text, duration in self.pending_annotations:
+            self.writer.add_annotation(t, text, duration)
+        self.pending_annotations = []
+
+    def write_records(self):
+        """
+        To write the complete data records. Called with the lock held.
+        """
+        buffers = [self.buffers[stream_name] for stream_name in self.written_streams]
+        # at stop, a stream which is late is padded to complete the last records
+        max_lag_records = self.max_lag_records if self.writing else 1
+        while True:
+            records = [buffer.count / self.samples_per_record(buffer) for buffer in buffers]
+            if min(records) < 1 and max(records) < max_lag_records:
+                return
+            samples = []
+            onset_time = None
+            for buffer in buffers:
+                times, values = buffer.take(self.samples_per_record(buffer))
+                if onset_time is None and len(times) > 0:
+                    onset_time = times[0]
+                samples.extend(values.T)
+            self.writer.write_record(samples, onset_time)
+
+    def stats(self):
+        """
+        Returns
+        -------
+        stats: dict
+            number of data records written and samples padded per stream
+        """
+        with self._lock:
+            return {'records': self.writer.n_records if self.writer is not None else 0,
+                    'padded': {stream_name: buffer.padded for stream_name, buffer in self.buffers.items()}}
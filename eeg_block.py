@@ -0,0 +1,107 @@
+import numpy as np
+
+class EEGBlockBuffer():
+    """
+    Collects EEG samples into blocks so that consumers get one event per block instead of one per sample.
+
+    Samples are written into a preallocated float32 array of shape (block_size, n_channels).
+    A block is emitted when it is full or, if max_latency_ms is set, when the time of its
+    newest sample is max_latency_ms after the time of its first sample. Cortex also flushes
+    a partial block with a timer of max_latency_ms after its first sample, and when the stream stops.
+
+    Attributes
+    ----------
+    block_size : int
+        maximum number of samples of a block
+    max_latency_ms : float
+        maximum time span of a block in milliseconds, None to only emit full blocks
+    labels : list
+        channel names of the columns, as emitted at new_data_labels for the eeg stream
+    blocks : int
+        number of blocks completed so far
+    """
+    def __init__(self, block_size=32, max_latency_ms=None):
+        if block_size <= 0:
+            raise ValueError('block_size must be positive.')
+
+        self.block_size = block_size
+        self.max_latency_ms = max_latency_ms
+        self.labels = None
+        self._data = None
+        self._time = None
+        self._count = 0
+        self.blocks = 0
+
+    def __len__(self):
+        return self._count
+
+    def set_labels(self, labels):
+        """
+        To set the channel names. Samples already collected are discarded if the number of channels changes.
+        """
+        if self.labels is None or len(labels) != len(self.labels):
+            self._data = None
+            self._count = 0
+        self.labels = list(labels)
+
+    def append(self, sample, timestamp):
+        """
+        To add one EEG sample
+
+        Parameters
+        ----------
+        sample : list, required
+            values of the sample as received from Cortex. Values after the labelled channels (the markers) are ignored.
+        timestamp : float, required
+            time of the sample
+
+        Returns
+        -------
+        block: dict or None
+            the completed block, see flush()
+        """
+        if self.labels is None:
+            # no labels yet, the last value is the markers column
+            self.labels = ['ch{}'.format(i) for i in range(len(sample) - 1)]
+
+        if self._data is None:
+            n_channels = len(self.labels)
+            self._data = np.empty((self.block_size, n_channels), dtype=np.float32)
+            self._time = np.empty(self.block_size, dtype=np.float64)
+            self._count = 0
+
+        n_channels = self._data.shape[1]
+        self._data[self._count] = sample[:n_channels]
+        self._time[self._count] = timestamp
+        self._count += 1
+
+        if self._count == self.block_size:
+            return self.flush()
+        if self.max_latency_ms is not None and (timestamp - self._time[0]) * 1000 >= self.max_latency_ms:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """
+        To complete the current block
+
+        Returns
+        -------
+        block: dict or None
+            None if no sample is collected, otherwise
+            {'eeg': float32 array (n_samples, n_channels), 'time': float64 array (n_samples,), 'labels': list}
+            The arrays belong to the consumer, a new buffer is allocated for the next block.
+        """
+        if self._count == 0:
+            return None
+
+        block = {
+            'eeg': self._data[:self._count],
+            'time': self._time[:self._count],
+            'labels': self.labels
+        }
+        self._data = None
+        self._time = None
+        self._count = 0
+        self.blocks += 1
+        return block
@@ -0,0 +1,319 @@
+import argparse
+import lzma
+import struct
+import time
+import zlib
+
+import numpy as np
+
+# general-purpose compressors applied after the varint packing
+COMPRESSORS = {
+    None: (0, lambda data, level: data, lambda data: data),
+    'zlib': (1, lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress),
+    'lzma': (2, lambda data, level: lzma.compress(data, preset=6 if level is None else level), lzma.decompress),
+}
+COMPRESSOR_NAMES = {compressor_id: name for name, (compressor_id, _, _) in COMPRESSORS.items()}
+
+MAGIC = b'EEC1'
+
+# column modes: float64 bytes, integers over a power of ten, integers times a quantum
+MODE_RAW = 0
+MODE_DECIMAL = 1
+MODE_QUANTUM = 2
+
+# decimal digits tried to find the resolution of a column
+MAX_DECIMALS = 9
+
+# integers above this are not exact in float64
+MAX_EXACT = 2 ** 53
+
+def zigzag_encode(values):
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+def zigzag_decode(values):
+    values = values.astype(np.uint64)
+    return ((values >> np.uint64(1)).astype(np.int64)) ^ -((values & np.uint64(1)).astype(np.int64))
+
+def varint_encode(values):
+    """
+    To pack unsigned integers in LEB128 varints, 7 bits per byte, vectorized
+
+    Returns
+    -------
+    data: bytes
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b''
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    for i in range(1, 10):
+        n_bytes += values >= np.uint64(1 << (7 * i))
+    width = int(n_bytes.max())
+    out = np.empty((len(values), width), dtype=np.uint8)
+    for i in range(width):
+        byte = (values >> np.uint64(7 * i)) & np.uint64(0x7f)
+        out[:, i] = byte | np.where(n_bytes > i + 1, 0x80, 0).astype(np.uint64)
+    # the bytes of each value in order, row by row
+    return out[np.arange(width) < n_bytes[:, None]].tobytes()
+
+def varint_decode(data, count=None):
+    """
+    Returns
+    -------
+    values: numpy uint64 array
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    if count is not None and len(ends) != count:
+        raise ValueError('Corrupted varint data: {0} values instead of {1}.'.format(len(ends), count))
+    starts = np.empty(len(ends), dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    positions = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7f).astype(np.uint64) << (7 * positions).astype(np.uint64)
+    # the 7 bit parts of a value do not overlap, so their sum is the value
+    return np.add.reduceat(parts, starts)
+
+def same_bits(a, b):
+    """
+    Returns
+    -------
+    same: bool
+        True if the float64 arrays are equal bit for bit, which tells -0.0 from 0.0 and compares NaN payloads
+    """
+    return np.array_equal(np.ascontiguousarray(a, dtype=np.float64).view(np.uint64),
+                          np.ascontiguousarray(b, dtype=np.float64).view(np.uint64))
+
+def column_resolution(column, quantum=None):
+    """
+    To find how a column is stored without loss: the fewest decimal digits, or the quantum,
+    which give back exactly the same float64 values
+
+    Returns
+    -------
+    (mode, parameter, integers): tuple
+        integers is None for MODE_RAW
+    """
+    if len(column) == 0 or not np.isfinite(column).all():
+        return MODE_RAW, 0, None
+    if quantum is not None:
+        integers = np.round(column / quantum)
+        # decoded as in decode(), from int64, so -0.0 comes back as 0.0 and stays raw
+        if np.abs(integers).max() < MAX_EXACT and same_bits(integers.astype(np.int64) * quantum, column):
+            return MODE_QUANTUM, quantum, integers.astype(np.int64)
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = float(10 ** decimals)
+        integers = np.round(column * scale)
+        if np.abs(integers).max() >= MAX_EXACT:
+            break
+        # as the value parsed from the decimal text sent by Cortex
+        if same_bits(integers.astype(np.int64) / scale, column):
+            return MODE_DECIMAL, decimals, integers.astype(np.int64)
+    return MODE_RAW, 0, None
+
+def delta_encode(integers, order):
+    for _ in range(order):
+        integers = np.diff(integers, prepend=np.int64(0))
+    return integers
+
+def delta_decode(deltas, order):
+    for _ in range(order):
+        deltas = np.cumsum(deltas, axis=-1)
+    return deltas
+
+def encode(values, quantum=None, compressor='zlib', level=None, delta_order=1):
+    """
+    To encode a block of samples without loss. Each column is converted to integers at its
+    resolution, delta-encoded along time, zigzag and varint packed, and the result optionally
+    compressed. A column which has no exact resolution, e.g. with NaN, is kept as float64.
+
+    Parameters
+    ----------
+    values : array (n_rows, n_cols)
+        samples, e.g. the eeg samples of a StreamRecorder buffer, with the time as a column if needed
+    quantum : float or list, optional
+        resolution of the columns, e.g. the LSB of the headset in uV. By default the fewest decimal
+        digits which keep the values, as Cortex sends decimal values.
+    compressor : str, optional
+        None, 'zlib' or 'lzma'
+    delta_order : int, optional
+        1 for the difference between samples, 2 for the difference of the differences,
+        better for timestamps at a constant rate
+
+    Returns
+    -------
+    data: bytes
+    """
+    if compressor not in COMPRESSORS:
+        raise ValueError('Unsupported compressor ' + str(compressor) + '. It must be one of None, zlib or lzma.')
+    if delta_order not in (1, 2):
+        raise ValueError('delta_order must be 1 or 2.')
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    n_rows, n_cols = values.shape
+    quanta = quantum if isinstance(quantum, (list, tuple, np.ndarray)) else [quantum] * n_cols
+
+    header = [MAGIC, struct.pack('<IIBB', n_rows, n_cols, COMPRESSORS[compressor][0], delta_order)]
+    packed = []
+    raw = []
+    for i in range(n_cols):
+        mode, parameter, integers = column_resolution(values[:, i], quanta[i])
+        if mode == MODE_RAW:
+            header.append(struct.pack('<Bd', mode, 0))
+            raw.append(values[:, i].tobytes())
+        else:
+            header.append(struct.pack('<Bd', mode, parameter))
+            packed.append(integers)
+
+    if len(packed) > 0:
+        # column after column, so the deltas of a channel are next to each other
+        deltas = delta_encode(np.stack(packed), delta_order)
+        payload = varint_encode(zigzag_encode(deltas.ravel()))
+    else:
+        payload = b''
+    body = struct.pack('<I', len(payload)) + payload + b''.join(raw)
+    return b''.join(header) + COMPRESSORS[compressor][1](body, level)
+
+def decode(data):
+    """
+    To decode a block encoded by encode()
+
+    Returns
+    -------
+    values: float64 array (n_rows, n_cols)
+    """
+    if data[:4] != MAGIC:
+        raise ValueError('Not an encoded EEG block.')
+    n_rows, n_cols, compressor_id, delta_order = struct.unpack_from('<IIBB', data, 4)
+    offset = 14
+    columns = []
+    for _ in range(n_cols):
+        columns.append(struct.unpack_from('<Bd', data, offset))
+        offset += 9
+    body = COMPRESSORS[COMPRESSOR_NAMES[compressor_id]][2](data[offset:])
+
+    payload_size = struct.unpack_from('<I', body, 0)[0]
+    packed_cols = [i for i, (mode, _) in enumerate(columns) if mode != MODE_RAW]
+    values = np.empty((n_rows, n_cols), dtype=np.float64)
+    if len(packed_cols) > 0:
+        deltas = zigzag_decode(varint_decode(body[4:4 + payload_size], n_rows * len(packed_cols)))
+        integers = delta_decode(deltas.reshape(len(packed_cols), n_rows), delta_order)
+        for integers_col, i in zip(integers, packed_cols):
+            mode, parameter = columns[i]
+            if mode == MODE_DECIMAL:
+                values[:, i] = integers_col / float(10 ** int(parameter))
+            else:
+                values[:, i] = integers_col * parameter
+
+    offset = 4 + payload_size
+    for i, (mode, _) in enumerate(columns):
+        if mode == MODE_RAW:
+            values[:, i] = np.frombuffer(body, dtype=np.float64, count=n_rows, offset=offset)
+            offset += 8 * n_rows
+    return values
+
+def frames_to_block(frames, stream_name):
+    """
+    To stack the samples of stream frames, with the time as the first column
+
+    Returns
+    -------
+    block: float64 array (n_frames, 1 + n_cols)
+    """
+    rows = []
+    for frame in frames:
+        values = frame[stream_name]
+        if stream_name == 'eeg':
+            # remove MARKERS
+            values = values[:-1]
+        rows.append([frame['time']] + [np.nan if value is None else value for value in values])
+    return np.asarray(rows, dtype=np.float64)
+
+def synthetic_blocks(n_channels, seconds):
+    from cortex_simulator import CortexSimulator, SimulatedSession
+
+    simulator = CortexSimulator(eeg_channels=n_channels, seed=0)
+    session = SimulatedSession('codec-session', 'EPOCX-CODEC', 1627457774.5166)
+    blocks = {}
+    for stream_name, rate in [('eeg', simulator.eeg_rate), ('mot', simulator.mems_rate)]:
+        frames = [simulator.make_frame(session, stream_name, i) for i in range(int(seconds * rate))]
+        blocks[stream_name] = frames_to_block(frames, stream_name)
+    return blocks
+
+def replayed_blocks(path, seconds):
+    from replay import open_recording
+
+    recording = open_recording(path)
+    frames = {'eeg': [], 'mot': []}
+    start = None
+    for frame in recording.frames(['eeg', 'mot']):
+        start = frame['time'] if start is None else start
+        if frame['time'] - start >= seconds:
+            break
+        for stream_name in frames:
+            if stream_name in frame:
+                frames[stream_name].append(frame)
+    return {stream_name: frames_to_block(stream_frames, stream_name)
+            for stream_name, stream_frames in frames.items() if len(stream_frames) > 0}
+
+def bench_codec(block, compressor, block_rows, repeat=3):
+    """
+    To measure the codec on a block cut in chunks of block_rows samples, as written by a recorder
+
+    Returns
+    -------
+    (ratio, encode_mb_s, decode_mb_s): tuple
+        float64 size over encoded size, and speeds in MB of float64 per second
+    """
+    chunks = [block[i:i + block_rows] for i in range(0, len(block), block_rows)]
+    best_encode = best_decode = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoded = [encode(chunk, compressor=compressor) for chunk in chunks]
+        encode_s = time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = [decode(data) for data in encoded]
+        decode_s = time.perf_counter() - start
+        best_encode = encode_s if best_encode is None else min(best_encode, encode_s)
+        best_decode = decode_s if best_decode is None else min(best_decode, decode_s)
+
+    for chunk, values in zip(chunks, decoded):
+        if not same_bits(chunk, values):
+            raise AssertionError('The codec is not lossless for this data.')
+    size = block.nbytes / 1e6
+    return block.nbytes / sum(len(data) for data in encoded), size / best_encode, size / best_decode
+
+def main():
+    parser = argparse.ArgumentParser(description='Compression ratio and speed of the EEG codec')
+    parser.add_argument('--channels', type=int, default=14, help='number of EEG channels of the synthetic data')
+    parser.add_argument('--seconds', type=float, default=60, help='seconds of data')
+    parser.add_argument('--block-rows', type=int, default=1024, help='samples per encoded block')
+    parser.add_argument('--replay', help='a record exported in CSV, EDF or BDF, instead of synthetic data')
+    args = parser.parse_args()
+
+    if args.replay:
+        source, blocks = args.replay, replayed_blocks(args.replay, args.seconds)
+    else:
+        source, blocks = 'synthetic', synthetic_blocks(args.channels, args.seconds)
+
+    print('{:<10} {:<6} {:<6} {:>10} {:>8} {:>12} {:>12}'.format(
+        'data', 'stream', 'codec', 'float64 KB', 'ratio', 'encode MB/s', 'decode MB/s'))
+    for stream_name, block in blocks.items():
+        for compressor in [None, 'zlib', 'lzma']:
+            ratio, encode_mb_s, decode_mb_s = bench_codec(block, compressor, args.block_rows)
+            print('{:<10} {:<6} {:<6} {:>10.0f} {:>8.2f} {:>12.1f} {:>12.1f}'.format(
+                source[-10:], stream_name, str(compressor), block.nbytes / 1e3, ratio, encode_mb_s, decode_mb_s))
+        # reference: the general-purpose compressor alone on the float64 bytes
+        start = time.perf_counter()
+        compressed = zlib.compress(block.tobytes(), 6)
+        print('{:<10} {:<6} {:<6} {:>10.0f} {:>8.2f} {:>12.1f} {:>12}'.format(
+            source[-10:], stream_name, 'zlib*', block.nbytes / 1e3, block.nbytes / len(compressed),
+            block.nbytes / 1e6 / (time.perf_counter() - start), '-'))
+    print('zlib*: zlib on the float64 bytes, without the codec')
+
+if __name__ == '__main__':
+    main()
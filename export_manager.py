@@ -0,0 +1,289 @@
+import threading
+from concurrent.futures import Future
+
+from cortex import Backoff, Cortex
+
+class ExportManager():
+    """
+    Exports many records of Cortex with few exportRecord requests.
+
+    Records are exported once Cortex has post-processed them, i.e. at their
+    warn_record_post_processing_done warning. Records which become ready within batch_delay_s
+    are exported together with the many-ids form of exportRecord. A record in the failure list of
+    the response is retried with backoff, up to max_retries times, while the others proceed.
+
+    Attributes
+    ----------
+    folder, stream_types, export_format, version :
+        parameters of Cortex.export_record
+    batch_size : int
+        maximum number of records per exportRecord request
+    batch_delay_s : float
+        time to wait for more ready records before a request
+    max_retries : int
+        number of retries of a failed record
+    exported : list
+        ids of the exported records
+    failed : dict
+        error message of each record which could not be exported
+    """
+    def __init__(self, cortex, folder, stream_types, export_format, version='V2', batch_size=20,
+                 batch_delay_s=0.5, max_retries=3, retry_delay_s=2.0, post_processing_timeout_s=None, **kwargs):
+        if len(folder) == 0:
+            raise ValueError('Invalid folder parameter. Please set a writable destination folder for exporting data.')
+        if batch_size <= 0:
+            raise ValueError('batch_size must be positive.')
+
+        self.c = cortex
+        self.folder = folder
+        self.stream_types = stream_types
+        self.export_format = export_format
+        self.version = version
+        self.export_kwargs = kwargs
+        self.batch_size = batch_size
+        self.batch_delay_s = batch_delay_s
+        self.max_retries = max_retries
+        self.retry_delay_s = retry_delay_s
+        self.post_processing_timeout_s = post_processing_timeout_s
+
+        self.waiting = set()
+        self.ready = []
+        self.in_flight = set()
+        self.batches = []
+        self.attempts = {}
+        self.exported = []
+        self.failed = {}
+        self.done = Future()
+        self.finished = False
+        self.batch_timer = None
+        self.timers = []
+        self._lock = threading.Lock()
+        self.c.bind(warn_record_post_processing_done=self.on_warn_record_post_processing_done)
+
+    def add_records(self, record_ids, post_processed=False):
+        """
+        To export records
+
+        Parameters
+        ----------
+        record_ids : list, required
+            ids of the records
+        post_processed : bool, optional
+            True for records which are already post-processed, e.g. records of a previous session.
+            Otherwise they are exported at their warn_record_post_processing_done warning.
+
+        Returns
+        -------
+        done: concurrent.futures.Future
+            resolved with {'exported': [...], 'failed': {record_id: message}} once every added record
+            is exported or has failed. Records added after it is resolved get a new future.
+        """
+        with self._lock:
+            if self.finished:
+                # a new export after the previous one is resolved
+                self.done = Future()
+                self.finished = False
+                self.exported = []
+                self.failed = {}
+            done = self.done
+            for record_id in record_ids:
+                if record_id in self.exported or record_id in self.waiting or \
+                        record_id in self.ready or record_id in self.in_flight:
+                    continue
+                self.failed.pop(record_id, None)
+                self.attempts[record_id] = 0
+                if post_processed:
+                    self.add_ready(record_id)
+                else:
+                    self.waiting.add(record_id)
+            if not post_processed and self.post_processing_timeout_s is not None:
+                # the warning may have been sent before the records were added
+                self.start_timer(self.post_processing_timeout_s, self.on_post_processing_timeout, list(record_ids))
+            # e.g. no record ids, or only records which are already exported
+            resolved = self.check_done()
+        self.resolve(resolved)
+        self.send_batches()
+        return done
+
+    def on_warn_record_post_processing_done(self, *args, **kwargs):
+        record_id = kwargs.get('data')
+        with self._lock:
+            if record_id in self.waiting:
+                self.waiting.discard(record_id)
+                self.add_ready(record_id)
+        self.send_batches()
+
+    def on_post_processing_timeout(self, record_ids):
+        with self._lock:
+            for record_id in record_ids:
+                if record_id in self.waiting:
+                    print('Record {} post-processing timed out, exporting it anyway'.format(record_id))
+                    self.waiting.discard(record_id)
+                    self.add_ready(record_id)
+        self.send_batches()
+
+    def add_ready(self, record_id):
+        """
+        To queue a record for the next exportRecord request. Called with the lock held.
+        """
+        if record_id in self.ready or record_id in self.in_flight:
+            return
+        self.ready.append(record_id)
+        if len(self.ready) >= self.batch_size:
+            self.export_ready()
+        elif self.batch_timer is None:
+            self.batch_timer = self.start_timer(self.batch_delay_s, self.on_batch_timer)
+
+    def on_batch_timer(self):
+        with self._lock:
+            self.batch_timer = None
+            self.export_ready()
+        self.send_batches()
+
+    def export_ready(self):
+        """
+        To take the ready records in batches for the next exportRecord requests. Called with the lock held,
+        the requests are sent by send_batches() once the lock is released.
+        """
+        while len(self.ready) > 0:
+            batch = self.ready[:self.batch_size]
+            del self.ready[:self.batch_size]
+            self.in_flight.update(batch)
+            self.batches.append(batch)
+
+    def send_batches(self):
+        """
+        To send the exportRecord requests of the taken batches. Called without the lock, because the
+        callback of a request which is already done, e.g. which failed at once, runs on this thread.
+        """
+        while True:
+            with self._lock:
+                if len(self.batches) == 0:
+                    return
+                batch = self.batches.pop(0)
+            print('export {} record(s) --------------------------------'.format(len(batch)))
+            try:
+                future = self.c.export_record(self.folder, self.stream_types, self.export_format, batch,
+                                              self.version, **self.export_kwargs)
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(lambda done, batch=batch: self.on_export_done(batch, done))
+
+    def on_export_done(self, batch, future):
+        failures = {}
+        if future.exception() is not None:
+            # the whole request failed, e.g. the connection dropped
+            failures = {record_id: str(future.exception()) for record_id in batch}
+        else:
+            result = future.result()
+            for record in result['failure']:
+                failures[record['recordId']] = record['message']
+            succeeded = [record['recordId'] for record in result['success']]
+
+        with self._lock:
+            self.in_flight.difference_update(batch)
+            for record_id in batch:
+                if record_id not in failures:
+                    if future.exception() is None and record_id in succeeded:
+                        self.exported.append(record_id)
+                    else:
+                        failures[record_id] = 'missing in the response'
+
+            for record_id, message in failures.items():
+                if record_id not in self.attempts:
+                    continue
+                self.attempts[record_id] += 1
+                if self.attempts[record_id] > self.max_retries:
+                    print('Record {0} export failed: {1}'.format(record_id, message))
+                    self.failed[record_id] = message
+                    continue
+                backoff = Backoff(self.retry_delay_s)
+                backoff.attempts = self.attempts[record_id] - 1
+                delay = backoff.next_delay()
+                print('Record {0} export failed: {1}, retry in {2:.1f} seconds'.format(record_id, message, delay))
+                self.in_flight.add(record_id)
+                self.start_timer(delay, self.on_retry_timer, record_id)
+            resolved = self.check_done()
+        self.resolve(resolved)
+
+    def on_retry_timer(self, record_id):
+        with self._lock:
+            self.in_flight.discard(record_id)
+            self.add_ready(record_id)
+        self.send_batches()
+
+    def check_done(self):
+        """
+        Called with the lock held.
+
+        Returns
+        -------
+        resolved: tuple or None
+            (future, result) to resolve once the lock is released, as its callbacks may add records
+        """
+        if len(self.waiting) == 0 and len(self.ready) == 0 and len(self.in_flight) == 0 and \
+                len(self.batches) == 0 and not self.finished:
+            for timer in self.timers:
+                timer.cancel()
+            self.finished = True
+            return self.done, {'exported': list(self.exported), 'failed': dict(self.failed)}
+        return None
+
+    def resolve(self, resolved):
+        if resolved is not None:
+            future, result = resolved
+            future.set_result(result)
+
+    def start_timer(self, delay, function, *args):
+        timer = threading.Timer(delay, function, args=args)
+        timer.daemon = True
+        self.timers = [t for t in self.timers if t.is_alive()] + [timer]
+        timer.start()
+        return timer
+
+# -----------------------------------------------------------
+#
+# GETTING STARTED
+#   - Please make sure the your_app_client_id and your_app_client_secret are set before starting running.
+#   - Fill record_ids with the ids of post-processed records, e.g. the records of a day
+#   - Set the folder, stream types and format of the export
+# RESULT
+#   - the records are exported with few exportRecord requests and the result is printed
+#
+# -----------------------------------------------------------
+
+class ExportRecords():
+    def __init__(self, app_client_id, app_client_secret, **kwargs):
+        self.c = Cortex(app_client_id, app_client_secret, debug_mode=False, **kwargs)
+        self.c.bind(authorize_done=self.on_authorize_done)
+
+    def start(self, record_ids, folder, stream_types, export_format, version='V2'):
+        self.record_ids = record_ids
+        self.manager = ExportManager(self.c, folder, stream_types, export_format, version)
+        self.c.open()
+
+    def on_authorize_done(self, *args, **kwargs):
+        self.manager.add_records(self.record_ids, post_processed=True).add_done_callback(self.on_export_done)
+
+    def on_export_done(self, future):
+        result = future.result()
+        print('exported: {}'.format(result['exported']))
+        print('failed: {}'.format(result['failed']))
+        self.c.close()
+
+def main():
+
+    # Please fill your application clientId and clientSecret before running script
+    your_app_client_id = ''
+    your_app_client_secret = ''
+
+    e = ExportRecords(your_app_client_id, your_app_client_secret)
+
+    record_ids = []
+    e.start(record_ids, 'C:/Users/jiahu/Desktop/', ['EEG', 'MOTION', 'PM', 'BP'], 'CSV')
+
+if __name__ == '__main__':
+    main()
+
+# -----------------------------------------------------------
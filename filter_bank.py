@@ -0,0 +1,116 @@
+import functools
+
+import numpy as np
+from scipy.signal import butter, sosfilt, sosfilt_zi
+
+# frequency bands in Hz
+DEFAULT_BANDS = {
+    'theta': (4.0, 8.0),
+    'alpha': (8.0, 13.0),
+    'beta': (13.0, 30.0),
+    'gamma': (30.0, 45.0),
+}
+
+# columns of the eeg stream which are not channels
+NON_CHANNEL_LABELS = {'COUNTER', 'INTERPOLATED', 'RAW_CQ', 'MARKER_HARDWARE', 'MARKERS'}
+
+@functools.lru_cache(maxsize=None)
+def design_bandpass(fs, low, high, order):
+    """
+    To design a Butterworth band-pass filter as second-order sections, once per (fs, band, order)
+
+    Returns
+    -------
+    sos: numpy array (n_sections, 6), read-only
+    """
+    nyquist = 0.5 * fs
+    if not 0 < low < high < nyquist:
+        raise ValueError('The band {0}-{1} Hz must be between 0 and the Nyquist frequency {2} Hz.'.format(low, high, nyquist))
+    sos = butter(order, [low / nyquist, high / nyquist], btype='band', output='sos')
+    sos.flags.writeable = False
+    return sos
+
+def channel_indexes(labels):
+    """
+    Returns
+    -------
+    indexes: list
+        columns of the eeg labels which are channels, e.g. without COUNTER and RAW_CQ
+    """
+    return [i for i, label in enumerate(labels) if label not in NON_CHANNEL_LABELS]
+
+class StreamingFilterBank():
+    """
+    Band-pass filters the channels of a stream into several bands, block after block.
+
+    The coefficients of each band are designed once, and the state of each filter and channel is kept
+    between blocks, so filtering a signal in blocks gives the same result as filtering it at once.
+    A block is filtered for all channels in one call per band. The state starts at the steady state
+    of the first sample, so the DC offset of the EEG does not cause a transient.
+
+    Attributes
+    ----------
+    fs : float
+        sampling rate in Hz
+    n_channels : int
+        number of columns of a block
+    bands : dict
+        (low, high) in Hz by band name
+    order : int
+        order of the Butterworth filters
+    """
+    def __init__(self, fs, n_channels, bands=None, order=4):
+        self.fs = float(fs)
+        self.n_channels = n_channels
+        self.bands = dict(bands) if bands is not None else dict(DEFAULT_BANDS)
+        self.order = order
+        # sosfilt needs writable coefficients, the cached design stays read-only
+        self.sos = {band: np.array(design_bandpass(self.fs, float(low), float(high), order))
+                    for band, (low, high) in self.bands.items()}
+        self.zi = None
+
+    def reset(self):
+        """
+        To forget the state, e.g. after a gap in the data
+        """
+        self.zi = None
+
+    def process(self, block):
+        """
+        To filter a block
+
+        Parameters
+        ----------
+        block : array (n_samples, n_channels)
+
+        Returns
+        -------
+        outputs: dict
+            filtered block (n_samples, n_channels) by band name
+        """
+        block = np.asarray(block, dtype=np.float64)
+        if block.ndim == 1:
+            block = block[None, :]
+        if block.shape[1] != self.n_channels:
+            raise ValueError('The block has {0} channels instead of {1}.'.format(block.shape[1], self.n_channels))
+        if len(block) == 0:
+            return {band: block for band in self.bands}
+        if self.zi is None:
+            # (n_sections, 2, n_channels) for filtering along the first axis
+            self.zi = {band: sosfilt_zi(sos)[:, :, None] * block[0][None, None, :] for band, sos in self.sos.items()}
+
+        outputs = {}
+        for band, sos in self.sos.items():
+            outputs[band], self.zi[band] = sosfilt(sos, block, axis=0, zi=self.zi[band])
+        return outputs
+
+    def band_power(self, block):
+        """
+        To filter a block and compute the power of each band
+
+        Returns
+        -------
+        powers: dict
+            mean square of the filtered block per channel, array (n_channels,), by band name
+        """
+        return {band: np.mean(output ** 2, axis=0) for band, output in self.process(block).items()}
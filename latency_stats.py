@@ -0,0 +1,128 @@
+import bisect
+import time
+
+# upper bounds of the histogram buckets in milliseconds: 0.01 ms, 0.02 ms, ... about 84 s
+BUCKET_BOUNDS_MS = [0.01 * 2 ** i for i in range(24)]
+
+class LatencyHistogram():
+    """
+    A histogram of latencies in milliseconds, with buckets doubling in width.
+    Percentiles are read as the upper bound of the bucket which holds them.
+
+    Values of 0 or below, e.g. a receive lag when the local clock is behind the Cortex clock,
+    are counted apart in underflow, and a percentile which falls among them reads as 0, or the maximum
+    if all values are below 0.
+    """
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.underflow = 0
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = None
+
+    def add(self, value_ms):
+        if value_ms <= 0:
+            self.underflow += 1
+        else:
+            self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, value_ms)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        if self.min_ms is None or value_ms < self.min_ms:
+            self.min_ms = value_ms
+        if self.max_ms is None or value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def percentile(self, p):
+        if self.count == 0:
+            return None
+        rank = p / 100.0 * self.count
+        seen = self.underflow
+        if seen >= rank and seen > 0:
+            return min(0.0, self.max_ms)
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n > 0:
+                return BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+    def summary(self):
+        """
+        Returns
+        -------
+        summary: dict
+            count, mean, min, max, p50, p90, p99 in milliseconds, and the number of values of 0 or below
+        """
+        return {
+            'count': self.count,
+            'underflow': self.underflow,
+            'mean_ms': self.total_ms / self.count if self.count > 0 else None,
+            'min_ms': self.min_ms,
+            'max_ms': self.max_ms,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99)
+        }
+
+class LatencyStats():
+    """
+    Latency histograms of each data stream, measured on the websocket thread:
+        receive_lag: from the 'time' of a frame to its receipt in on_message
+        decode: from the receipt to the decoded data, JSON parsing included
+        handler: from the decoded data to the return of the bound handlers
+
+    The receive lag compares the Cortex clock with the local clock, so it also holds their offset.
+    A local clock behind the Cortex clock gives negative lags, counted in the underflow of the summary.
+    """
+    METRICS = ('receive_lag', 'decode', 'handler')
+
+    def __init__(self):
+        self.histograms = {}
+        self.recv_time = None
+        self.recv_perf = None
+        self.decoded_perf = None
+
+    def receive(self):
+        """
+        To mark the receipt of a message, called first in on_message
+        """
+        self.recv_time = time.time()
+        self.recv_perf = time.perf_counter()
+
+    def decoded(self, stream_name, frame_time):
+        self.decoded_perf = time.perf_counter()
+        histograms = self.stream_histograms(stream_name)
+        histograms['receive_lag'].add((self.recv_time - frame_time) * 1000.0)
+        histograms['decode'].add((self.decoded_perf - self.recv_perf) * 1000.0)
+
+    def handled(self, stream_name):
+        self.histograms[stream_name]['handler'].add((time.perf_counter() - self.decoded_perf) * 1000.0)
+
+    def stream_histograms(self, stream_name):
+        histograms = self.histograms.get(stream_name)
+        if histograms is None:
+            histograms = {metric: LatencyHistogram() for metric in self.METRICS}
+            self.histograms[stream_name] = histograms
+        return histograms
+
+    def stats(self):
+        """
+        Returns
+        -------
+        stats: dict
+            summary of each metric of each stream, e.g. stats['eeg']['handler']['p99_ms']
+        """
+        return {stream_name: {metric: histogram.summary() for metric, histogram in list(histograms.items())}
+                for stream_name, histograms in list(self.histograms.items())}
+
+    def format(self):
+        lines = ['{:<6} {:<12} {:>9} {:>10} {:>10} {:>10} {:>10} {:>9}'.format(
+            'stream', 'metric', 'count', 'mean ms', 'p50 ms', 'p99 ms', 'max ms', '<= 0 ms')]
+        for stream_name, metrics in self.stats().items():
+            for metric, summary in metrics.items():
+                if summary['count'] == 0:
+                    continue
+                lines.append('{:<6} {:<12} {:>9} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>9}'.format(
+                    stream_name, metric, summary['count'], summary['mean_ms'],
+                    summary['p50_ms'], summary['p99_ms'], summary['max_ms'], summary['underflow']))
+        return '\n'.join(lines)
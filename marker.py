@@ -1,6 +1,6 @@
 from cortex import Cortex
+from marker_scheduler import MarkerScheduler, periodic_schedule
 import time
-import threading
 
 class Marker():
     def __init__(self, app_client_id, app_client_secret, **kwargs):
@@ -12,6 +12,7 @@ class Marker():
         self.c.bind(inject_marker_done=self.on_inject_marker_done)
         self.c.bind(export_record_done=self.on_export_record_done)
         self.c.bind(inform_error=self.on_inform_error)
+        self.scheduler = MarkerScheduler(self.c, port='python_app')
 
     def start(self, number_markers=10, headsetId=''):
         """
@@ -71,18 +72,10 @@ class Marker():
 
 
     def add_markers(self):
-        print('add_markers: ' + str(self.number_markers) + ' markers will be injected each second automatically.')
-        for m in range(self.number_markers):
-            marker_time = time.time()*1000
-            print('add marker at : ', marker_time)
-            
-            # marker_value = "test marker value"
-            marker_label = self.marker_label +"_" +  str(m)
-
-            self.inject_marker(marker_time, self.marker_value, marker_label, port='python_app')
-
-            # add marker each 3 seconds
-            time.sleep(3)
+        print('add_markers: ' + str(self.number_markers) + ' markers will be injected each 3 seconds automatically.')
+        # add marker each 3 seconds, on time even if an injection is slow
+        schedule = periodic_schedule(3, self.number_markers, self.marker_value, self.marker_label)
+        self.scheduler.start(schedule)
 
     def inject_marker(self, time, value, label, **kwargs):
         """
@@ -124,8 +117,7 @@ class Marker():
         print('on_create_record_done: recordId: {0}, title: {1}, startTime: {2}'.format(self.record_id, title, start_time))
 
         # inject markers
-        th = threading.Thread(target=self.add_markers)
-        th.start()
+        self.add_markers()
 
     def on_stop_record_done(self, *args, **kwargs):
         
@@ -135,6 +127,7 @@ class Marker():
         end_time = data['endDatetime']
         title = data['title']
         print('on_stop_record_done: recordId: {0}, title: {1}, startTime: {2}, endTime: {3}'.format(record_id, title, start_time, end_time))
+        print('marker timing: {}'.format(self.scheduler.stats()))
 
         # disconnect headset to export record
         print('on_stop_record_done: Disconnect the headset to export record')
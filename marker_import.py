@@ -0,0 +1,133 @@
+import csv
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+
+# an event of a stimulus log: time in epoch seconds, duration in seconds or None for an instance marker
+MarkerEvent = namedtuple('MarkerEvent', ['time', 'value', 'label', 'duration'])
+
+def read_event_log(path):
+    """
+    To read a CSV event log with the columns time, value and label, and optionally duration.
+    The time is in epoch seconds, or milliseconds for values above 1e11.
+
+    Returns
+    -------
+    events: list of MarkerEvent
+        sorted by time
+    """
+    events = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            t = float(row['time'])
+            duration = row.get('duration')
+            events.append(MarkerEvent(t / 1000.0 if t > 1e11 else t, row['value'], row['label'],
+                                      float(duration) if duration not in (None, '') else None))
+    events.sort(key=lambda event: event.time)
+    return events
+
+class BulkMarkerImporter():
+    """
+    Injects many markers into the current record of a session, e.g. the events of a stimulus log.
+
+    The injectMarker requests are pipelined: up to max_in_flight events are sent without waiting for
+    their responses. An event with a duration becomes an interval marker with updateMarker, sent as soon
+    as its injectMarker response gives the marker id, and holds its slot until then. A failed event
+    does not stop the others.
+
+    Attributes
+    ----------
+    max_in_flight : int
+        number of events sent and not answered yet at most
+    marker_ids : dict
+        marker id of each injected event, by index in the events
+    failed : dict
+        error message of each failed event, by index in the events
+    """
+    def __init__(self, cortex, max_in_flight=32, **kwargs):
+        if max_in_flight <= 0:
+            raise ValueError('max_in_flight must be positive.')
+        self.c = cortex
+        self.max_in_flight = max_in_flight
+        self.inject_kwargs = kwargs
+        self.marker_ids = {}
+        self.failed = {}
+        self.done = None
+        self._slots = threading.Semaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._thread = None
+
+    def import_events(self, events):
+        """
+        To inject the events from a thread of the importer. Do not wait for the result on the websocket thread.
+
+        Parameters
+        ----------
+        events : list of MarkerEvent or of (time, value, label, duration) tuples
+
+        Returns
+        -------
+        done: concurrent.futures.Future
+            resolved with {'markers': {index: markerId}, 'failed': {index: message}} once every event is answered
+        """
+        events = [MarkerEvent(*event) for event in events]
+        self.marker_ids = {}
+        self.failed = {}
+        self.done = Future()
+        self._remaining = len(events)
+        if len(events) == 0:
+            self.done.set_result({'markers': {}, 'failed': {}})
+            return self.done
+        print('import {} markers --------------------------------'.format(len(events)))
+        self._thread = threading.Thread(target=self.send_events, args=(events,), name='BulkMarkerImporter', daemon=True)
+        self._thread.start()
+        return self.done
+
+    def send_events(self, events):
+        for index, event in enumerate(events):
+            self._slots.acquire()
+            try:
+                future = self.c.inject_marker_request(event.time * 1000, event.value, event.label, **self.inject_kwargs)
+            except Exception as e:
+                self.finish(index, error=e)
+                continue
+            future.add_done_callback(lambda done, index=index, event=event: self.on_inject_done(index, event, done))
+
+    def on_inject_done(self, index, event, future):
+        if future.exception() is not None:
+            self.finish(index, error=future.exception())
+            return
+        marker_id = future.result()['uuid']
+        if event.duration is None:
+            self.finish(index, marker_id)
+            return
+        try:
+            update = self.c.update_marker_request(marker_id, (event.time + event.duration) * 1000)
+        except Exception as e:
+            self.finish(index, marker_id, e)
+            return
+        update.add_done_callback(lambda done: self.finish(index, marker_id, done.exception()))
+
+    def finish(self, index, marker_id=None, error=None):
+        self._slots.release()
+        with self._lock:
+            if marker_id is not None:
+                self.marker_ids[index] = marker_id
+            if error is not None:
+                self.failed[index] = str(error)
+            self._remaining -= 1
+            finished = self._remaining == 0
+        if finished:
+            print('imported {0} markers, {1} failed'.format(len(self.marker_ids), len(self.failed)))
+            self.done.set_result({'markers': dict(self.marker_ids), 'failed': dict(self.failed)})
+
+    def progress(self):
+        """
+        Returns
+        -------
+        progress: dict
+            numbers of injected, failed and remaining events
+        """
+        with self._lock:
+            return {'injected': len(self.marker_ids), 'failed': len(self.failed), 'remaining': self._remaining}
@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+# a marker of a schedule, offset_s seconds after the start of the schedule
+PlannedMarker = namedtuple('PlannedMarker', ['offset_s', 'value', 'label'])
+
+def periodic_schedule(interval_s, count, value, label, start_delay_s=0.0):
+    """
+    Returns
+    -------
+    schedule: list of PlannedMarker
+        count markers every interval_s seconds, labelled label_0, label_1, ...
+    """
+    if interval_s <= 0:
+        raise ValueError('interval_s must be positive.')
+    return [PlannedMarker(start_delay_s + i * interval_s, value, '{0}_{1}'.format(label, i)) for i in range(count)]
+
+def list_schedule(markers):
+    """
+    Parameters
+    ----------
+    markers : list
+        (offset_s, value, label) of each marker, e.g. the onsets of the stimuli of a study
+
+    Returns
+    -------
+    schedule: list of PlannedMarker
+        sorted by offset
+    """
+    return sorted((PlannedMarker(*marker) for marker in markers), key=lambda marker: marker.offset_s)
+
+class MarkerScheduler():
+    """
+    Injects the markers of a schedule at their planned times.
+
+    Each marker fires at an absolute deadline on the monotonic clock, start + offset_s, so the
+    time spent injecting a marker does not delay the next ones, and a change of the wall clock
+    does not move them. The thread sleeps until spin_s before a deadline and waits actively for
+    the rest. The time sent to Cortex is converted to epoch milliseconds from the fire time, with
+    the epoch time read once at start.
+
+    The fire time of each marker is compared with its deadline: stats() reports this jitter,
+    to give the timing accuracy of the stimuli.
+
+    With a clock_sync.ClockSync, the time sent to Cortex is converted to the clock of the
+    stream samples, once the offset is estimated.
+
+    Attributes
+    ----------
+    records : list of dict
+        for each fired marker: label, value, planned and fired times in seconds from the start,
+        jitter_ms, the epoch time in ms sent to Cortex and markerId once injected
+    spin_s : float
+        time waited actively before a deadline
+    clock_sync : ClockSync
+        optional host to Cortex time mapping
+    """
+    def __init__(self, cortex, spin_s=0.002, clock_sync=None, **kwargs):
+        self.c = cortex
+        self.spin_s = spin_s
+        self.clock_sync = clock_sync
+        self.inject_kwargs = kwargs
+        self.records = []
+        self.done = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.start_monotonic = None
+        self.start_epoch = None
+
+    def start(self, schedule):
+        """
+        To inject the markers of a schedule from now on
+
+        Returns
+        -------
+        done: concurrent.futures.Future
+            resolved with the records once the last marker is fired, or at stop()
+        """
+        if self._thread is not None and self._thread.is_alive():
+            raise ValueError('The scheduler is already running.')
+        self.records = []
+        self.done = Future()
+        self._stop.clear()
+        # the only reading of the wall clock, the deadlines are on the monotonic clock
+        self.start_epoch = time.time()
+        self.start_monotonic = time.monotonic()
+        self._thread = threading.Thread(target=self.run, args=(list(schedule),), name='MarkerScheduler', daemon=True)
+        self._thread.start()
+        return self.done
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def to_epoch_ms(self, monotonic_time):
+        if self.clock_sync is not None and self.clock_sync.estimate() is not None:
+            return self.clock_sync.to_cortex_time(self.clock_sync.host_time(monotonic_time)) * 1000
+        return (self.start_epoch + (monotonic_time - self.start_monotonic)) * 1000
+
+    def wait_until(self, deadline):
+        """
+        Returns
+        -------
+        fired: float
+            monotonic time at the end of the wait, None if stopped
+        """
+        remaining = deadline - time.monotonic()
+        if remaining > self.spin_s and self._stop.wait(remaining - self.spin_s):
+            return None
+        now = time.monotonic()
+        while now < deadline:
+            now = time.monotonic()
+        return now
+
+    def run(self, schedule):
+        for planned in schedule:
+            deadline = self.start_monotonic + planned.offset_s
+            fired = self.wait_until(deadline)
+            if fired is None:
+                break
+            epoch_ms = self.to_epoch_ms(fired)
+            record = {'label': planned.label, 'value': planned.value, 'planned_s': planned.offset_s,
+                      'fired_s': fired - self.start_monotonic, 'jitter_ms': (fired - deadline) * 1000,
+                      'time': epoch_ms, 'markerId': None}
+            with self._lock:
+                self.records.append(record)
+            try:
+                future = self.c.inject_marker_request(epoch_ms, planned.value, planned.label, **self.inject_kwargs)
+            except Exception as e:
+                # e.g. the connection is lost, the next markers are still on time if it comes back
+                print('Marker {0} was not injected: {1}'.format(planned.label, e))
+                continue
+            record['inject_ms'] = (time.monotonic() - fired) * 1000
+            future.add_done_callback(lambda done, record=record: self.on_inject_done(record, done))
+        self.done.set_result(self.records)
+
+    def on_inject_done(self, record, future):
+        if future.exception() is None:
+            record['markerId'] = future.result().get('uuid')
+        else:
+            print('Marker {0} was not injected: {1}'.format(record['label'], future.exception()))
+
+    def stats(self):
+        """
+        Returns
+        -------
+        stats: dict
+            number of fired markers, mean, p50, p95 and max of the absolute jitter in ms,
+            and the mean time to send an injectMarker request
+        """
+        with self._lock:
+            jitters = sorted(abs(record['jitter_ms']) for record in self.records)
+            inject = [record['inject_ms'] for record in self.records if 'inject_ms' in record]
+        if len(jitters) == 0:
+            return {'count': 0}
+
+        def percentile(p):
+            return jitters[min(int(p * len(jitters)), len(jitters) - 1)]
+
+        return {'count': len(jitters), 'mean_ms': sum(jitters) / len(jitters), 'p50_ms': percentile(0.5),
+                'p95_ms': percentile(0.95), 'max_ms': jitters[-1],
+                'inject_mean_ms': sum(inject) / len(inject) if len(inject) > 0 else None}
@@ -0,0 +1,112 @@
+from cortex import Cortex
+from session_manager import SessionManager
+
+class MultiHeadset():
+    """
+    A class to subscribe data streams of several headsets on one Cortex connection.
+
+    Attributes
+    ----------
+    c : Cortex
+        Cortex communicate with Emotiv Cortex Service
+    manager : SessionManager
+        opens one session per headset
+
+    Methods
+    -------
+    start(streams, headset_ids):
+        start data subscribing process of the headsets.
+    on_new_eeg_data(*args, **kwargs):
+        To handle eeg data emitted from the session of a headset
+    """
+    def __init__(self, app_client_id, app_client_secret, **kwargs):
+        print("MultiHeadset __init__")
+        self.c = Cortex(app_client_id, app_client_secret, debug_mode=False, **kwargs)
+        self.manager = SessionManager(self.c)
+        self.c.bind(authorize_done=self.on_authorize_done)
+        self.c.bind(inform_error=self.on_inform_error)
+
+    def start(self, streams, headset_ids):
+        """
+        To start data subscribing process as below workflow
+        (1)check access right -> authorize
+        (2)connect each headset -> create a session for it -> subscribe streams data
+
+        Parameters
+        ----------
+        streams : list, required
+            list of streams. For example, ['eeg', 'met']
+        headset_ids : list, required
+            ids of the headsets. For example, ['EPOCX-12345678', 'INSIGHT-87654321']
+
+        Returns
+        -------
+        None
+        """
+        self.streams = streams
+        self.headset_ids = headset_ids
+        self.c.open()
+
+    def on_authorize_done(self, *args, **kwargs):
+        for headset_id in self.headset_ids:
+            self.manager.open_session(headset_id).add_done_callback(self.on_open_session_done)
+
+    def on_open_session_done(self, future):
+        if future.exception() is not None:
+            print('open session failed: ' + str(future.exception()))
+            return
+
+        session = future.result()
+        session.bind(new_data_labels=self.on_new_data_labels)
+        session.bind(new_eeg_data=self.on_new_eeg_data)
+        session.bind(new_met_data=self.on_new_met_data)
+        session.sub_request(self.streams)
+
+    def on_new_data_labels(self, *args, **kwargs):
+        data = kwargs.get('data')
+        print('{} labels are : {}'.format(data['streamName'], data['labels']))
+
+    def on_new_eeg_data(self, *args, **kwargs):
+        """
+        To handle eeg data of the headsets. The same handler is bound to every session,
+        bind a handler per session to tell the headsets apart.
+        """
+        data = kwargs.get('data')
+        print('eeg data: {}'.format(data))
+
+    def on_new_met_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        print('pm data: {}'.format(data))
+
+    def on_inform_error(self, *args, **kwargs):
+        error_data = kwargs.get('error_data')
+        print(error_data)
+
+# -----------------------------------------------------------
+#
+# GETTING STARTED
+#   - Please reference to https://emotiv.gitbook.io/cortex-api/ first.
+#   - Connect your headsets with dongle or bluetooth. You can see the headsets via Emotiv Launcher
+#   - Please make sure the your_app_client_id and your_app_client_secret are set before starting running.
+#   - Please fill the ids of your headsets in headset_ids
+# RESULT
+#   - the data of every headset will be retreived at on_new_[dataStream]_data
+#
+# -----------------------------------------------------------
+
+def main():
+
+    # Please fill your application clientId and clientSecret before running script
+    your_app_client_id = ''
+    your_app_client_secret = ''
+
+    m = MultiHeadset(your_app_client_id, your_app_client_secret)
+
+    headset_ids = ['', '']
+    streams = ['eeg', 'met']
+    m.start(streams, headset_ids)
+
+if __name__ =='__main__':
+    main()
+
+# -----------------------------------------------------------
@@ -0,0 +1,286 @@
+import datetime
+import os
+import queue
+import threading
+
+import numpy as np
+
+try:
+    # columnar files, 'pip install pyarrow' for install
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from cortex import STREAM_EVENTS
+
+# streams with numeric samples
+PARQUET_STREAMS = ('eeg', 'mot', 'pow', 'met')
+
+TIME_COLUMN = 'time'
+
+def check_pyarrow():
+    if pa is None:
+        raise ImportError('Parquet files need pyarrow. Please install it with: pip install pyarrow')
+
+def parquet_path(folder, stream_name):
+    return os.path.join(folder, stream_name + '.parquet')
+
+class ParquetStream():
+    """
+    Rows of one stream waiting for their row group
+    """
+    def __init__(self, stream_name, labels):
+        self.stream_name = stream_name
+        self.labels = list(labels)
+        self.times = []
+        self.rows = []
+        self.total_rows = 0
+
+class ParquetSink():
+    """
+    Writes the subscribed streams to Parquet files, one per stream, as the data arrives.
+
+    A file has a 'time' column, sorted, and one float64 column per label of the new_data_labels
+    event of the stream. The eeg columns are float32 when the source is in block mode as the eeg labels
+    arrive, as the blocks of Cortex.set_eeg_block_mode() are float32. Rows are grouped by time: a row group holds row_group_s seconds of data,
+    so a reader can skip the row groups out of a time range with the statistics of the time column,
+    and the columns which are not requested. Row groups are compressed and written by a
+    background thread. A file is readable once closed by stop().
+
+    Attributes
+    ----------
+    folder : str
+        folder of the files
+    streams : list
+        written streams, among eeg, mot, pow and met
+    row_group_s : float
+        duration of a row group in seconds
+    compression : str
+        compression codec of Parquet, e.g. zstd, snappy or none
+    """
+    def __init__(self, source, folder, streams=None, row_group_s=10.0, compression='zstd'):
+        check_pyarrow()
+        self.source = source
+        self.folder = folder
+        self.streams = list(streams) if streams is not None else list(PARQUET_STREAMS)
+        for stream_name in self.streams:
+            if stream_name not in PARQUET_STREAMS:
+                raise ValueError('The stream ' + stream_name + ' can not be written to Parquet. It must be one of ' +
+                                 ', '.join(PARQUET_STREAMS))
+        if row_group_s <= 0:
+            raise ValueError('row_group_s must be positive.')
+        self.row_group_s = row_group_s
+        self.compression = compression
+
+        self.buffers = {}
+        self.writers = {}
+        self.writing = False
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = None
+
+    def start(self):
+        """
+        To start writing. The labels of a stream come with its new_data_labels event, so start before subscribing.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        self.writing = True
+        self._writer = threading.Thread(target=self.run_writer, name='ParquetSink', daemon=True)
+        self._writer.start()
+        self.source.bind(new_data_labels=self.on_new_data_labels)
+        self.source.bind(new_eeg_block=self.on_new_eeg_block)
+        for stream_name in self.streams:
+            self.source.bind(**{STREAM_EVENTS[stream_name]: getattr(self, 'on_new_' + stream_name + '_data')})
+
+    def stop(self):
+        """
+        To write the buffered rows and close the files
+        """
+        if not self.writing:
+            return
+        self.source.unbind(self.on_new_data_labels, self.on_new_eeg_block)
+        for stream_name in self.streams:
+            self.source.unbind(getattr(self, 'on_new_' + stream_name + '_data'))
+
+        with self._lock:
+            self.writing = False
+            for buffer in self.buffers.values():
+                self.hand_off(buffer)
+        self._queue.put(None)
+        self._writer.join()
+
+    def on_new_data_labels(self, *args, **kwargs):
+        data = kwargs.get('data')
+        stream_name = data['streamName']
+        if stream_name not in self.streams:
+            return
+        with self._lock:
+            buffer = self.buffers.get(stream_name)
+            if buffer is not None and buffer.labels == list(data['labels']):
+                return
+            if buffer is not None:
+                # new columns, e.g. another headset: the rows go to a new file
+                self.hand_off(buffer)
+                self._queue.put(('close', stream_name))
+            self.buffers[stream_name] = ParquetStream(stream_name, data['labels'])
+            # the blocks of the block mode are float32, float64 would only add rounding digits
+            dtype = 'float32' if stream_name == 'eeg' and getattr(self.source, 'eeg_block', None) is not None \
+                else 'float64'
+            self._queue.put(('open', stream_name, list(data['labels']), dtype))
+
+    def on_new_eeg_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        self.append('eeg', data['eeg'], data['time'])
+
+    def on_new_eeg_block(self, *args, **kwargs):
+        data = kwargs.get('data')
+        if 'eeg' not in self.streams:
+            return
+        for row, t in zip(data['eeg'], data['time']):
+            self.append('eeg', row, t)
+
+    def on_new_mot_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        self.append('mot', data['mot'], data['time'])
+
+    def on_new_pow_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        self.append('pow', data['pow'], data['time'])
+
+    def on_new_met_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        # None, e.g. a metric which is not active, is written as NaN
+        self.append('met', [np.nan if value is None else value for value in data['met']], data['time'])
+
+    def append(self, stream_name, values, t):
+        with self._lock:
+            buffer = self.buffers.get(stream_name)
+            if buffer is None or not self.writing or len(values) != len(buffer.labels):
+                return
+            buffer.times.append(t)
+            buffer.rows.append(values)
+            if t - buffer.times[0] >= self.row_group_s:
+                self.hand_off(buffer)
+
+    def hand_off(self, buffer):
+        """
+        To queue the rows of a buffer as a row group. Called with the lock held.
+        """
+        if len(buffer.times) == 0:
+            return
+        self._queue.put(('write', buffer.stream_name, buffer.times, buffer.rows))
+        buffer.total_rows += len(buffer.times)
+        buffer.times = []
+        buffer.rows = []
+
+    def run_writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if item[0] == 'open':
+                self.open_writer(item[1], item[2], item[3])
+            elif item[0] == 'close':
+                self.writers.pop(item[1])[0].close()
+            else:
+                _, stream_name, times, rows = item
+                writer, labels, dtype = self.writers[stream_name]
+                values = np.asarray(rows, dtype=dtype).reshape(len(rows), len(labels))
+                columns = [pa.array(np.asarray(times, dtype=np.float64))]
+                columns += [pa.array(values[:, i]) for i in range(len(labels))]
+                writer.write_table(pa.Table.from_arrays(columns, schema=writer.schema), row_group_size=len(times))
+
+        for writer, _, _ in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+    def open_writer(self, stream_name, labels, dtype='float64'):
+        path = parquet_path(self.folder, stream_name)
+        if os.path.exists(path):
+            # keep the file of a previous recording, or with other labels, under another name
+            os.replace(path, path + '.{:%Y%m%d%H%M%S}'.format(datetime.datetime.now()))
+        value_type = pa.float32() if dtype == 'float32' else pa.float64()
+        schema = pa.schema([pa.field(TIME_COLUMN, pa.float64())] + [pa.field(label, value_type) for label in labels])
+        # the statistics of the time column select the row groups of a time range
+        writer = pq.ParquetWriter(path, schema, compression=self.compression, use_dictionary=False,
+                                  write_statistics=[TIME_COLUMN])
+        self.writers[stream_name] = (writer, list(labels), dtype)
+
+    def stats(self):
+        """
+        Returns
+        -------
+        stats: dict
+            rows written per stream and number of row groups waiting for the writer thread
+        """
+        with self._lock:
+            rows = {stream_name: buffer.total_rows + len(buffer.times) for stream_name, buffer in self.buffers.items()}
+        return {'rows': rows, 'queued': self._queue.qsize()}
+
+class ParquetStreamReader():
+    """
+    Reads a stream written by ParquetSink. Only the row groups which overlap the requested time
+    range and the requested columns are read from the file.
+
+    Attributes
+    ----------
+    labels : list
+        column names, without the time column
+    """
+    def __init__(self, folder, stream_name):
+        check_pyarrow()
+        self.file = pq.ParquetFile(parquet_path(folder, stream_name))
+        self.labels = [name for name in self.file.schema_arrow.names if name != TIME_COLUMN]
+        metadata = self.file.metadata
+        time_index = self.file.schema_arrow.get_field_index(TIME_COLUMN)
+        self.group_ranges = []
+        for i in range(metadata.num_row_groups):
+            statistics = metadata.row_group(i).column(time_index).statistics
+            self.group_ranges.append((statistics.min, statistics.max))
+
+    def __len__(self):
+        return self.file.metadata.num_rows
+
+    def row_groups(self, t0=None, t1=None):
+        return [i for i, (group_min, group_max) in enumerate(self.group_ranges)
+                if (t0 is None or group_max >= t0) and (t1 is None or group_min < t1)]
+
+    def read(self, channels=None, t0=None, t1=None):
+        """
+        To read the samples from time t0 included to t1 excluded
+
+        Parameters
+        ----------
+        channels : list, optional
+            labels of the columns, all of them by default
+
+        Returns
+        -------
+        data: dict
+            'time': float64 array (n,), 'values': float64 array (n, len(channels)), 'labels': list.
+            float32 columns are converted without loss.
+        """
+        labels = self.labels if channels is None else list(channels)
+        for label in labels:
+            if label not in self.labels:
+                raise ValueError('The column ' + label + ' is not in the file.')
+
+        table = self.file.read_row_groups(self.row_groups(t0, t1), columns=[TIME_COLUMN] + labels)
+        times = table.column(TIME_COLUMN).to_numpy()
+        selected = np.ones(len(times), dtype=bool)
+        if t0 is not None:
+            selected &= times >= t0
+        if t1 is not None:
+            selected &= times < t1
+        values = np.empty((int(selected.sum()), len(labels)))
+        for i, label in enumerate(labels):
+            values[:, i] = table.column(label).to_numpy()[selected]
+        return {'time': times[selected], 'values': values, 'labels': labels}
+
+def read_parquet_stream(folder, stream_name, channels=None, t0=None, t1=None):
+    """
+    To load the columns of a stream written by ParquetSink from time t0 to t1, see ParquetStreamReader.read
+    """
+    return ParquetStreamReader(folder, stream_name).read(channels, t0, t1)
@@ -16,7 +16,8 @@ class Record():
         """
         self.c = Cortex(app_client_id, app_client_secret, debug_mode=True, **kwargs)
         self.c.bind(create_session_done=self.on_create_session_done)
-        self.c.bind(create_record_done=self.on_create_record_done)
+        # on_create_record_done waits for the whole recording, run it off the websocket thread
+        self.c.bind_queued(create_record_done=self.on_create_record_done)
         self.c.bind(stop_record_done=self.on_stop_record_done)
         self.c.bind(warn_record_post_processing_done=self.on_warn_record_post_processing_done)
         self.c.bind(export_record_done=self.on_export_record_done)
@@ -0,0 +1,422 @@
+import argparse
+import csv
+import datetime
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from cortex import Cortex
+
+# band power columns of exported CSV, e.g. POW.AF3.BetaL
+POW_BANDS = {'Theta': 'theta', 'Alpha': 'alpha', 'BetaL': 'betaL', 'BetaH': 'betaH', 'Gamma': 'gamma'}
+
+# performance metrics columns of exported CSV, e.g. PM.Engagement.Scaled
+MET_NAMES = {'Engagement': 'eng', 'Excitement': 'exc', 'LongTermExcitement': 'lex', 'Stress': 'str',
+             'Relaxation': 'rel', 'Interest': 'int', 'Focus': 'foc', 'Attention': 'attention'}
+
+# eeg columns of exported CSV which are not channels
+EEG_SPECIAL_COLUMNS = {'Counter': 'COUNTER', 'Interpolated': 'INTERPOLATED', 'RawCq': 'RAW_CQ',
+                       'MarkerHardware': 'MARKER_HARDWARE'}
+EEG_SKIPPED_COLUMNS = {'Battery', 'BatteryPercent'}
+
+MOT_COLUMNS = {'CounterMems': 'COUNTER_MEMS', 'InterpolatedMems': 'INTERPOLATED_MEMS'}
+
+def to_number(text):
+    if text == '':
+        return None
+    try:
+        value = float(text)
+    except ValueError:
+        return text
+    return int(value) if value.is_integer() and '.' not in text else value
+
+class CsvRecording():
+    """
+    A recording exported by Cortex or EmotivPRO in CSV format.
+
+    The columns are grouped by their prefix: EEG., MOT., POW. and PM. Rows where all columns
+    of a stream are empty carry no sample of the stream.
+
+    Attributes
+    ----------
+    path : str
+        path of the CSV file
+    cols : dict
+        cols of each stream, as in the response of subscribe
+    srate : float or None
+        sampling rate of the eeg stream, estimated from its first timestamps
+    """
+    def __init__(self, path):
+        self.path = path
+        self.cols = {}
+        self.srate = None
+        self._indexes = {}
+        self._time_index = None
+        self._header_line = 0
+        self.read_header()
+        self.srate = self.estimate_srate('eeg')
+
+    def read_header(self):
+        with open(self.path, newline='') as f:
+            reader = csv.reader(f)
+            for line_number, row in enumerate(reader):
+                if 'Timestamp' in row:
+                    header = row
+                    self._header_line = line_number
+                    break
+                if line_number > 0:
+                    raise ValueError('No Timestamp column in ' + self.path)
+            else:
+                raise ValueError('Empty recording ' + self.path)
+
+        self._time_index = header.index('Timestamp')
+        eeg_special = {}
+        eeg_channels = []
+        for index, name in enumerate(header):
+            parts = name.split('.')
+            if len(parts) < 2:
+                continue
+            prefix = parts[0]
+            if prefix == 'EEG':
+                if parts[1] in EEG_SPECIAL_COLUMNS:
+                    eeg_special[EEG_SPECIAL_COLUMNS[parts[1]]] = index
+                elif parts[1] not in EEG_SKIPPED_COLUMNS:
+                    eeg_channels.append((parts[1], index))
+            elif prefix == 'MOT':
+                self.add_column('mot', MOT_COLUMNS.get(parts[1], parts[1].upper()), index)
+            elif prefix == 'POW' and len(parts) == 3 and parts[2] in POW_BANDS:
+                self.add_column('pow', parts[1] + '/' + POW_BANDS[parts[2]], index)
+            elif prefix == 'PM' and len(parts) == 3 and parts[1] in MET_NAMES:
+                if parts[2] == 'IsActive':
+                    self.add_column('met', MET_NAMES[parts[1]] + '.isActive', index)
+                elif parts[2] == 'Scaled':
+                    self.add_column('met', MET_NAMES[parts[1]], index)
+
+        if len(eeg_channels) > 0:
+            # the order of a Cortex eeg sample
+            for label in ['COUNTER', 'INTERPOLATED']:
+                if label in eeg_special:
+                    self.add_column('eeg', label, eeg_special[label])
+            for channel, index in eeg_channels:
+                self.add_column('eeg', channel, index)
+            for label in ['RAW_CQ', 'MARKER_HARDWARE']:
+                if label in eeg_special:
+                    self.add_column('eeg', label, eeg_special[label])
+            # Cortex sends MARKERS last, it is removed from the labels
+            self.cols['eeg'].append('MARKERS')
+
+    def add_column(self, stream_name, label, index):
+        self.cols.setdefault(stream_name, []).append(label)
+        self._indexes.setdefault(stream_name, []).append(index)
+
+    def estimate_srate(self, stream_name, n_samples=256):
+        """
+        Returns
+        -------
+        srate: float or None
+            samples per second of the stream, from the median interval of its first samples
+        """
+        if stream_name not in self._indexes:
+            return None
+        times = []
+        for frame in self.frames([stream_name]):
+            times.append(frame['time'])
+            if len(times) >= n_samples:
+                break
+        intervals = sorted(b - a for a, b in zip(times, times[1:]) if b > a)
+        if len(intervals) == 0:
+            return None
+        return float(round(1.0 / intervals[len(intervals) // 2]))
+
+    def frames(self, streams):
+        """
+        To read the frames of the streams in time order
+
+        Returns
+        -------
+        frames: generator of dict
+            frames as sent by Cortex, e.g. {'eeg': [...], 'time': 1627457774.5166}
+        """
+        indexes = [(stream_name, self._indexes[stream_name]) for stream_name in streams if stream_name in self._indexes]
+        with open(self.path, newline='') as f:
+            reader = csv.reader(f)
+            for line_number, row in enumerate(reader):
+                if line_number <= self._header_line or len(row) <= self._time_index:
+                    continue
+                t = float(row[self._time_index])
+                for stream_name, stream_indexes in indexes:
+                    values = [to_number(row[i]) if i < len(row) else None for i in stream_indexes]
+                    if all(value is None for value in values):
+                        continue
+                    if stream_name == 'eeg':
+                        values.append([])
+                    yield {stream_name: values, 'time': t}
+
+class EdfRecording():
+    """
+    A recording exported in EDF or BDF format. Its signals at the highest sampling rate are
+    replayed as the eeg stream, in their order in the file.
+
+    Attributes
+    ----------
+    path : str
+        path of the EDF or BDF file
+    cols : dict
+        cols of the eeg stream, as in the response of subscribe
+    srate : float
+        sampling rate of the eeg stream
+    """
+    # signals of Emotiv EDF files which are not part of the eeg sample
+    SKIPPED_LABELS = {'TIME_STAMP_s', 'TIME_STAMP_ms', 'MARKERS', 'BATTERY', 'BATTERY_PERCENT', 'EDF Annotations',
+                      'BDF Annotations'}
+
+    def __init__(self, path):
+        self.path = path
+        self.read_header()
+
+    def read_header(self):
+        with open(self.path, 'rb') as f:
+            header = f.read(256)
+            self.bdf = header[0:1] == b'\xff'
+            start = header[168:184].decode('ascii').strip()
+            n_records = int(header[236:244])
+            self.record_duration = float(header[244:252])
+            ns = int(header[252:256])
+            signal_header = f.read(256 * ns)
+
+        def fields(offset, width):
+            return [signal_header[offset + i * width: offset + (i + 1) * width].decode('ascii', 'replace').strip()
+                    for i in range(ns)]
+
+        labels = fields(0, 16)
+        offset = 16 * ns + 80 * ns + 8 * ns
+        physical_min = [float(x) for x in fields(offset, 8)]
+        physical_max = [float(x) for x in fields(offset + 8 * ns, 8)]
+        digital_min = [float(x) for x in fields(offset + 16 * ns, 8)]
+        digital_max = [float(x) for x in fields(offset + 24 * ns, 8)]
+        samples_per_record = [int(x) for x in fields(offset + 32 * ns + 80 * ns, 8)]
+
+        self.start_time = datetime.datetime.strptime(start, '%d.%m.%y%H.%M.%S').timestamp()
+        self.labels = labels
+        self.samples_per_record = samples_per_record
+        self.n_records = n_records
+        self.header_bytes = 256 * (ns + 1)
+        self.gain = [(physical_max[i] - physical_min[i]) / ((digital_max[i] - digital_min[i]) or 1) for i in range(ns)]
+        self.offset = [physical_min[i] - digital_min[i] * self.gain[i] for i in range(ns)]
+
+        n_samples = max(samples_per_record)
+        self.srate = n_samples / self.record_duration
+        self.eeg_signals = [i for i in range(ns)
+                            if samples_per_record[i] == n_samples and labels[i] not in self.SKIPPED_LABELS]
+        self.time_signals = [labels.index(label) if label in labels else None for label in ['TIME_STAMP_s', 'TIME_STAMP_ms']]
+        self.cols = {'eeg': [labels[i] for i in self.eeg_signals] + ['MARKERS']}
+
+    def read_records(self):
+        import numpy as np
+
+        sample_bytes = 3 if self.bdf else 2
+        record_samples = sum(self.samples_per_record)
+        with open(self.path, 'rb') as f:
+            f.seek(self.header_bytes)
+            record_index = 0
+            while self.n_records < 0 or record_index < self.n_records:
+                raw = f.read(record_samples * sample_bytes)
+                if len(raw) < record_samples * sample_bytes:
+                    return
+                if self.bdf:
+                    b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+                    digital = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+                    digital = np.where(digital >= 1 << 23, digital - (1 << 24), digital)
+                else:
+                    digital = np.frombuffer(raw, dtype='<i2')
+
+                signals = []
+                position = 0
+                for i, n in enumerate(self.samples_per_record):
+                    signals.append(digital[position:position + n] * self.gain[i] + self.offset[i])
+                    position += n
+                yield record_index, signals
+                record_index += 1
+
+    def frames(self, streams):
+        if 'eeg' not in streams:
+            return
+        n_samples = max(self.samples_per_record)
+        seconds_signal, ms_signal = self.time_signals
+        for record_index, signals in self.read_records():
+            eeg = [signals[i] for i in self.eeg_signals]
+            for j in range(n_samples):
+                if seconds_signal is not None and len(signals[seconds_signal]) == n_samples:
+                    t = float(signals[seconds_signal][j])
+                    if ms_signal is not None and len(signals[ms_signal]) == n_samples:
+                        t += float(signals[ms_signal][j]) / 1000.0
+                else:
+                    t = self.start_time + (record_index * n_samples + j) / self.srate
+                values = [float(signal[j]) for signal in eeg]
+                values.append([])
+                yield {'eeg': values, 'time': t}
+
+def open_recording(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return CsvRecording(path)
+    elif extension in ('.edf', '.bdf'):
+        return EdfRecording(path)
+    raise ValueError('Unsupported recording format ' + extension + '. It must be CSV, EDF or BDF.')
+
+class ReplayCortex(Cortex):
+    """
+    Replays a recording exported in CSV, EDF or BDF through the events of Cortex, so that the
+    consumers of new_data_labels, new_eeg_data, new_mot_data, new_pow_data and new_met_data
+    can run offline. Frames go through the same decoding as live frames, so bind_queued,
+    set_eeg_block_mode and the integrity and latency stats work as with Cortex.
+
+    open() emits create_session_done, then replays the streams subscribed with sub_request,
+    or the streams given to the constructor. The profile requests answer as if the wanted
+    profile were loaded. Other requests are not available.
+
+    Attributes
+    ----------
+    recording : CsvRecording or EdfRecording
+        the replayed recording
+    speed : float or None
+        1 for real time, 100 for 100 times faster, None as fast as possible
+    """
+    def __init__(self, path, speed=1.0, streams=None, debug_mode=False, **kwargs):
+        super().__init__('replay', 'replay', debug_mode, **kwargs)
+        if speed is not None and speed <= 0:
+            raise ValueError('speed must be positive, or None to replay as fast as possible.')
+        self.recording = open_recording(path)
+        self.speed = speed
+        self.replay_streams = list(streams) if streams is not None else []
+        self.frames_replayed = 0
+        self.auth = 'replay'
+        self.headset_id = 'replay'
+        if self.recording.srate is not None:
+            # as in the settings of a headset, e.g. for the filters of the eeg handlers
+            self.headset_settings = {'eegRate': self.recording.srate}
+
+    def open(self):
+        self.closing = False
+        self.started_at = time.monotonic()
+        self.startup_metrics = {}
+        self.waiting_first_sample = True
+        self.websock_thread = threading.Thread(target=self.run_replay, name='ReplayThread')
+        self.websock_thread.start()
+        self.websock_thread.join()
+
+    def close(self):
+        self.closing = True
+        self.cancel_latency_dump()
+
+    def run_replay(self):
+        self.session_id = 'replay'
+        if len(self.replay_streams) > 0:
+            self.sub_request(self.replay_streams)
+        self.emit('create_session_done', data=self.session_id)
+
+        first_time = None
+        start = time.monotonic()
+        for frame in self.recording.frames(list(self.active_streams)):
+            if self.closing:
+                break
+            if self.speed is not None:
+                if first_time is None:
+                    first_time = frame['time']
+                delay = start + (frame['time'] - first_time) / self.speed - time.monotonic()
+                if delay > 0.001:
+                    time.sleep(delay)
+            frame['sid'] = self.session_id
+            if self.latency_stats is not None:
+                self.latency_stats.receive()
+            self.handle_stream_data(frame)
+            self.frames_replayed += 1
+
+        self.flush_eeg_block()
+        print('replay done, {} frames --------------------------------'.format(self.frames_replayed))
+        self.session_id = ''
+        self.active_streams = []
+
+    def done_future(self, result):
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def query_profile(self):
+        profile_list = [self.profile_name] if getattr(self, 'profile_name', '') else []
+        self.emit('query_profile_done', data=profile_list)
+        return self.done_future(profile_list)
+
+    def get_current_profile(self):
+        self.emit('load_unload_profile_done', isLoaded=True)
+        return self.done_future({'name': getattr(self, 'profile_name', None), 'loadedByThisApp': True})
+
+    def setup_profile(self, profile_name, status):
+        if status == 'create' or status == 'load':
+            self.emit('load_unload_profile_done', isLoaded=True)
+        elif status == 'unload':
+            self.emit('load_unload_profile_done', isLoaded=False)
+        elif status == 'save':
+            self.emit('save_profile_done')
+        return self.done_future({'action': status, 'name': profile_name})
+
+    def sub_request(self, stream):
+        print('subscribe request --------------------------------')
+        result = {'success': [], 'failure': []}
+        for stream_name in stream:
+            if stream_name in self.recording.cols:
+                result['success'].append({'streamName': stream_name, 'cols': list(self.recording.cols[stream_name])})
+            else:
+                result['failure'].append({'streamName': stream_name, 'message': 'The recording has no ' + stream_name + ' data.'})
+        return self.done_future(self.handle_sub_request_result(result))
+
+    def unsub_request(self, stream):
+        print('unsubscribe request --------------------------------')
+        result = {'success': [{'streamName': stream_name} for stream_name in stream], 'failure': []}
+        return self.done_future(self.handle_unsub_request_result(result))
+
+# -----------------------------------------------------------
+#
+# GETTING STARTED
+#   - Export a record in CSV or EDF with record.py, then replay it:
+#     python replay.py path/to/record.csv --speed 100 --streams eeg pow met
+#   - To run a consumer offline, give it a ReplayCortex instead of a Cortex, e.g.
+#     LiveEEGMetrics(cortex=ReplayCortex('record.edf', speed=100)).start('profile')
+# RESULT
+#   - the data of the recording is emitted at new_[dataStream]_data as by Cortex
+#
+# -----------------------------------------------------------
+
+class FrameCounter():
+    def __init__(self):
+        self.counts = {}
+
+    def on_new_data_labels(self, *args, **kwargs):
+        data = kwargs.get('data')
+        print('{} labels are : {}'.format(data['streamName'], data['labels']))
+
+    def on_new_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        for key in data:
+            if key != 'time':
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recording exported by Cortex through the Cortex events')
+    parser.add_argument('path', help='CSV, EDF or BDF file')
+    parser.add_argument('--speed', type=float, default=1.0, help='1 for real time, 0 for as fast as possible')
+    parser.add_argument('--streams', nargs='+', default=['eeg', 'mot', 'pow', 'met'])
+    args = parser.parse_args()
+
+    c = ReplayCortex(args.path, args.speed or None, args.streams)
+    counter = FrameCounter()
+    c.bind(new_data_labels=counter.on_new_data_labels)
+    c.bind(new_eeg_data=counter.on_new_data, new_mot_data=counter.on_new_data,
+           new_pow_data=counter.on_new_data, new_met_data=counter.on_new_data)
+    start = time.perf_counter()
+    c.open()
+    print('{0} in {1:.3f} seconds'.format(counter.counts, time.perf_counter() - start))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+import threading
+import warnings
+from concurrent.futures import Future
+
+from pydispatch import Dispatcher
+
+from cortex import Backoff, STREAM_DECODERS, STREAM_EVENTS, get_data_labels, parse_stream_data
+
+class CortexSession(Dispatcher):
+    """
+    A session of one headset, sharing the websocket of a Cortex object with other sessions.
+    Stream frames whose 'sid' is the id of this session are emitted by this object with the
+    same events as Cortex, for example new_eeg_data.
+
+    Attributes
+    ----------
+    headset_id : str
+        id of the headset of the session
+    session_id : str
+        id of the session, empty until the session is created
+    record_id : str
+        id of the last record created in the session
+    active_streams : list
+        subscribed streams
+    data_labels : dict
+        labels of each subscribed stream
+    """
+    _events_ = ['new_data_labels', 'new_com_data', 'new_fe_data', 'new_eeg_data', 'new_mot_data',
+                'new_dev_data', 'new_met_data', 'new_pow_data', 'new_sys_data',
+                'create_record_done', 'stop_record_done', 'inject_marker_done', 'update_marker_done',
+                'warn_cortex_stop_all_sub', 'session_closed']
+
+    def __init__(self, cortex, headset_id):
+        self.c = cortex
+        self.headset_id = headset_id
+        self.session_id = ''
+        self.record_id = ''
+        self.active_streams = []
+        self.data_labels = {}
+        self.stream_decoders = {}
+
+    def handle_stream_data(self, result_dic):
+        for key in result_dic:
+            decoder = self.stream_decoders.get(key)
+            if decoder is not None:
+                event, decode = decoder
+                self.emit(event, data=decode(result_dic))
+                return
+
+        stream_name, data = parse_stream_data(result_dic)
+        if stream_name is None:
+            print(result_dic)
+            return
+        self.emit(STREAM_EVENTS[stream_name], data=data)
+
+    def handle_stop_all_streams(self):
+        print('The session ' + self.session_id + ' of headset ' + self.headset_id + ' is stopped by Cortex.')
+        self.emit('warn_cortex_stop_all_sub', data=self.session_id)
+        self.c.session_routes.pop(self.session_id, None)
+        self.session_id = ''
+        self.active_streams = []
+        self.stream_decoders = {}
+
+    def handle_create_session_result(self, result_dic):
+        self.session_id = result_dic['id']
+        self.c.session_routes[self.session_id] = self
+        print("The session " + self.session_id + " of headset " + self.headset_id + " is created successfully.")
+        return self
+
+    def handle_close_session_result(self, result_dic):
+        self.c.session_routes.pop(self.session_id, None)
+        print("The session " + self.session_id + " of headset " + self.headset_id + " is closed.")
+        self.emit('session_closed', data=self.session_id)
+        self.session_id = ''
+        self.active_streams = []
+        return result_dic
+
+    def handle_sub_request_result(self, result_dic):
+        for stream in result_dic['success']:
+            stream_name = stream['streamName']
+            print('The data stream {0} of headset {1} is subscribed successfully.'.format(stream_name, self.headset_id))
+            if stream_name in STREAM_DECODERS:
+                self.stream_decoders[stream_name] = (STREAM_EVENTS[stream_name], STREAM_DECODERS[stream_name])
+            if stream_name not in self.active_streams:
+                self.active_streams.append(stream_name)
+            # com and fac data carry their own field names
+            if stream_name != 'com' and stream_name != 'fac':
+                self.data_labels[stream_name] = get_data_labels(stream_name, stream['cols'])
+                self.emit('new_data_labels', data={'streamName': stream_name, 'labels': self.data_labels[stream_name]})
+
+        for stream in result_dic['failure']:
+            print('The data stream {0} of headset {1} is subscribed unsuccessfully. Because: {2}'.format(
+                stream['streamName'], self.headset_id, stream['message']))
+        return result_dic
+
+    def handle_unsub_request_result(self, result_dic):
+        for stream in result_dic['success']:
+            stream_name = stream['streamName']
+            self.stream_decoders.pop(stream_name, None)
+            if stream_name in self.active_streams:
+                self.active_streams.remove(stream_name)
+        return result_dic
+
+    def handle_create_record_result(self, result_dic):
+        self.record_id = result_dic['record']['uuid']
+        self.emit('create_record_done', data=result_dic['record'])
+        return result_dic['record']
+
+    def handle_stop_record_result(self, result_dic):
+        self.emit('stop_record_done', data=result_dic['record'])
+        return result_dic['record']
+
+    def handle_inject_marker_result(self, result_dic):
+        self.emit('inject_marker_done', data=result_dic['marker'])
+        return result_dic['marker']
+
+    def handle_update_marker_result(self, result_dic):
+        self.emit('update_marker_done', data=result_dic['marker'])
+        return result_dic['marker']
+
+    def sub_request(self, streams):
+        return self.c.send_request("subscribe", {
+            "cortexToken": self.c.auth,
+            "session": self.session_id,
+            "streams": streams
+        }, self.handle_sub_request_result)
+
+    def unsub_request(self, streams):
+        return self.c.send_request("unsubscribe", {
+            "cortexToken": self.c.auth,
+            "session": self.session_id,
+            "streams": streams
+        }, self.handle_unsub_request_result)
+
+    def close_session(self):
+        return self.c.send_request("updateSession", {
+            "cortexToken": self.c.auth,
+            "session": self.session_id,
+            "status": "close"
+        }, self.handle_close_session_result)
+
+    def create_record(self, title, **kwargs):
+        if len(title) == 0:
+            raise ValueError('Empty record_title. Please fill the record_title before running script.')
+
+        params_val = {"cortexToken": self.c.auth, "session": self.session_id, "title": title}
+        params_val.update(kwargs)
+        return self.c.send_request("createRecord", params_val, self.handle_create_record_result)
+
+    def stop_record(self):
+        return self.c.send_request("stopRecord", {
+            "cortexToken": self.c.auth,
+            "session": self.session_id
+        }, self.handle_stop_record_result)
+
+    def inject_marker_request(self, time, value, label, **kwargs):
+        params_val = {"cortexToken": self.c.auth,
+                      "session": self.session_id,
+                      "time": time,
+                      "value": value,
+                      "label": label}
+        params_val.update(kwargs)
+        return self.c.send_request("injectMarker", params_val, self.handle_inject_marker_result)
+
+    def update_marker_request(self, markerId, time, **kwargs):
+        params_val = {"cortexToken": self.c.auth,
+                      "session": self.session_id,
+                      "markerId": markerId,
+                      "time": time}
+        params_val.update(kwargs)
+        return self.c.send_request("updateMarker", params_val, self.handle_update_marker_result)
+
+class SessionManager():
+    """
+    Drives several headsets on one Cortex connection, with one CortexSession per headset.
+
+    The Cortex object only does access right and authorize steps, its prepare_session is set to False.
+    Bind authorize_done of the Cortex object and call open_session() for each headset from there.
+
+    Attributes
+    ----------
+    sessions : dict
+        CortexSession keyed by headset id
+    opening : dict
+        future of open_session() keyed by headset id, until the session is created or fails
+    max_connect_attempts : int
+        number of headset queries before open_session() fails for a headset which does not connect
+    """
+    def __init__(self, cortex, retry_delay=0.5, max_retry_delay=5, max_connect_attempts=20):
+        self.c = cortex
+        self.c.prepare_session = False
+        self.sessions = {}
+        self.opening = {}
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_connect_attempts = max_connect_attempts
+        self._lock = threading.Lock()
+
+    def open_session(self, headset_id):
+        """
+        To connect a headset if needed and create a session for it
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            resolved with the CortexSession. A second call for a headset whose session is being
+            created gets the same future.
+        """
+        with self._lock:
+            opening = self.opening.get(headset_id)
+            if opening is not None:
+                return opening
+            session = self.sessions.get(headset_id)
+            if session is None:
+                session = CortexSession(self.c, headset_id)
+                self.sessions[headset_id] = session
+
+            future = Future()
+            if session.session_id != '':
+                warnings.warn("There is existed session " + session.session_id + " for headset " + headset_id)
+                future.set_result(session)
+                return future
+            self.opening[headset_id] = future
+
+        # registered first, so the callbacks of the caller already see the session as opened
+        future.add_done_callback(lambda done: self.on_open_session_done(headset_id, done))
+        self.query_headset(session, future, Backoff(self.retry_delay, self.max_retry_delay))
+        return future
+
+    def on_open_session_done(self, headset_id, future):
+        with self._lock:
+            if self.opening.get(headset_id) is future:
+                del self.opening[headset_id]
+
+    def close_session(self, headset_id):
+        """
+        Returns
+        -------
+        future: concurrent.futures.Future or None
+            None if the headset has no session
+        """
+        with self._lock:
+            session = self.sessions.pop(headset_id, None)
+        if session is None or session.session_id == '':
+            return None
+        return session.close_session()
+
+    def get_session(self, session_id):
+        return self.c.session_routes.get(session_id)
+
+    def query_headset(self, session, future, backoff):
+        query_future = self.c.send_request("queryHeadsets", {"id": session.headset_id})
+        query_future.add_done_callback(
+            lambda done: self.on_query_headset_done(session, future, backoff, done))
+
+    def on_query_headset_done(self, session, future, backoff, query_future):
+        if query_future.exception() is not None:
+            future.set_exception(query_future.exception())
+            return
+
+        status = ''
+        for ele in query_future.result():
+            if ele['id'] == session.headset_id:
+                status = ele['status']
+        print('headsetId: {0}, status: {1}'.format(session.headset_id, status))
+
+        if status == 'connected':
+            create_future = self.c.send_request("createSession", {
+                "cortexToken": self.c.auth,
+                "headset": session.headset_id,
+                "status": "active"
+            }, session.handle_create_session_result)
+            create_future.add_done_callback(lambda done: self.on_create_session_done(future, done))
+            return
+
+        if status == 'discovered':
+            self.c.send_request("controlDevice", {"command": "connect", "headset": session.headset_id})
+
+        if backoff.attempts >= self.max_connect_attempts:
+            future.set_exception(TimeoutError('The headset ' + session.headset_id + ' is not connected.'))
+            return
+
+        # '' means the headset is not discovered yet, query again later as for 'connecting'
+        timer = threading.Timer(backoff.next_delay(), self.query_headset, args=(session, future, backoff))
+        timer.daemon = True
+        timer.start()
+
+    def on_create_session_done(self, future, create_future):
+        if create_future.exception() is not None:
+            future.set_exception(create_future.exception())
+        else:
+            future.set_result(create_future.result())
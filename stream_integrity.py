@@ -0,0 +1,183 @@
+def count_lost_samples(prev_counter, counter, gap_s=None, srate=None, counter_modulus=None):
+    """
+    To count the samples missing between two received samples of a stream, from their COUNTER values
+
+    Parameters
+    ----------
+    prev_counter : int, required
+        COUNTER of the last sample received before the gap
+    counter : int, required
+        COUNTER of the first sample received after the gap
+    gap_s : float, optional
+        time between the two samples. With srate it tells how many whole counter cycles the gap hides.
+    srate : float, optional
+        sampling rate of the stream
+    counter_modulus : int, optional
+        the COUNTER wraps to 0 after counter_modulus - 1. None if the counter does not wrap.
+
+    Returns
+    -------
+    lost: int
+        number of missing samples
+    """
+    if counter_modulus is None:
+        return max(int(counter - prev_counter) - 1, 0)
+
+    step = int(counter - prev_counter) % counter_modulus
+    if step == 0:
+        step = counter_modulus
+    lost = step - 1
+
+    if gap_s is not None and srate:
+        # the counter only tells the position in its cycle, the time tells how many cycles passed
+        cycles = round((gap_s * srate - step) / counter_modulus)
+        if cycles > 0:
+            lost += cycles * counter_modulus
+    return lost
+
+# COUNTER and INTERPOLATED columns of the streams which have them
+COUNTER_COLUMNS = {
+    'eeg': ('COUNTER', 'INTERPOLATED'),
+    'mot': ('COUNTER_MEMS', 'INTERPOLATED_MEMS'),
+}
+
+class StreamIntegrityMonitor():
+    """
+    Checks the COUNTER and INTERPOLATED columns of each sample of a stream. It counts the samples
+    lost in counter gaps, including gaps across the counter wraparound, and the samples
+    interpolated by Cortex, and tells when the loss rate over a window crosses a threshold.
+
+    The counter modulus is learned from the highest counter seen before the first wraparound
+    when it is not given, e.g. 128 for a 128 Hz stream whose COUNTER cycles 0..127.
+
+    Attributes
+    ----------
+    stream_name : str
+        name of the stream, 'eeg' or 'mot'
+    received : int
+        number of samples received
+    lost : int
+        number of samples missing in counter gaps
+    interpolated : int
+        number of received samples flagged as interpolated
+    counter_modulus : int or None
+        the COUNTER wraps to 0 after counter_modulus - 1, None until it is known
+    """
+    def __init__(self, stream_name, labels, srate=None, counter_modulus=None,
+                 loss_rate_threshold=0.01, window_s=5.0):
+        counter_label, interpolated_label = COUNTER_COLUMNS[stream_name]
+        if counter_label not in labels:
+            raise ValueError('The labels of ' + stream_name + ' have no ' + counter_label + ' column.')
+
+        self.stream_name = stream_name
+        self.labels = list(labels)
+        self.counter_index = self.labels.index(counter_label)
+        self.interpolated_index = self.labels.index(interpolated_label) if interpolated_label in self.labels else None
+        self.srate = srate
+        self.counter_modulus = counter_modulus
+        self.loss_rate_threshold = loss_rate_threshold
+        self.window_s = window_s
+
+        self.received = 0
+        self.lost = 0
+        self.interpolated = 0
+        self.gaps = 0
+        self.wraparounds = 0
+        self.max_counter = None
+        self.prev_counter = None
+        self.prev_time = None
+
+        self.window_start = None
+        self.window_received = 0
+        self.window_lost = 0
+        self.window_loss_rate = 0.0
+        self.above_threshold = False
+
+    def update(self, values, time):
+        """
+        To account one sample of the stream
+
+        Parameters
+        ----------
+        values : list, required
+            the sample as received, in the order of the labels
+        time : float, required
+            time of the sample
+
+        Returns
+        -------
+        event: dict or None
+            the loss rate of the last window when it crossed the threshold, else None
+        """
+        counter = int(values[self.counter_index])
+        lost = 0
+        if self.prev_counter is not None:
+            if counter <= self.prev_counter:
+                self.wraparounds += 1
+                if self.counter_modulus is None:
+                    # samples before the wraparound may be lost too, so this is a lower bound
+                    # which grows with the highest counter seen
+                    self.counter_modulus = self.max_counter + 1
+            lost = count_lost_samples(self.prev_counter, counter, time - self.prev_time,
+                                      self.srate, self.counter_modulus)
+            if lost > 0:
+                self.gaps += 1
+                self.lost += lost
+
+        if self.max_counter is None or counter > self.max_counter:
+            self.max_counter = counter
+            if self.counter_modulus is not None and counter >= self.counter_modulus:
+                self.counter_modulus = counter + 1
+        self.prev_counter = counter
+        self.prev_time = time
+        self.received += 1
+        if self.interpolated_index is not None and values[self.interpolated_index]:
+            self.interpolated += 1
+
+        if self.window_start is None:
+            self.window_start = time
+        self.window_received += 1
+        self.window_lost += lost
+        if time - self.window_start >= self.window_s:
+            return self.close_window(time)
+        return None
+
+    def close_window(self, time):
+        total = self.window_received + self.window_lost
+        self.window_loss_rate = self.window_lost / total if total > 0 else 0.0
+        event = None
+        above_threshold = self.window_loss_rate > self.loss_rate_threshold
+        if above_threshold != self.above_threshold:
+            self.above_threshold = above_threshold
+            event = {'streamName': self.stream_name,
+                     'loss_rate': self.window_loss_rate,
+                     'threshold': self.loss_rate_threshold,
+                     'above_threshold': above_threshold,
+                     'window_s': time - self.window_start}
+
+        self.window_start = time
+        self.window_received = 0
+        self.window_lost = 0
+        return event
+
+    def stats(self):
+        """
+        Returns
+        -------
+        stats: dict
+            cumulative counters of the stream and the loss rate of the last window
+        """
+        expected = self.received + self.lost
+        return {
+            'streamName': self.stream_name,
+            'received': self.received,
+            'lost': self.lost,
+            'interpolated': self.interpolated,
+            'gaps': self.gaps,
+            'wraparounds': self.wraparounds,
+            'counter_modulus': self.counter_modulus,
+            'loss_rate': self.lost / expected if expected > 0 else 0.0,
+            'interpolated_rate': self.interpolated / self.received if self.received > 0 else 0.0,
+            'window_loss_rate': self.window_loss_rate,
+            'above_threshold': self.above_threshold
+        }
@@ -0,0 +1,391 @@
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from cortex import STREAM_EVENTS
+from stream_store import (MARKERS_FILE, PART_SUFFIX, RecordingReader, StreamReader, StreamWriter, describe_segment,
+                          marker_time, read_manifest, segment_name, write_manifest)
+
+# streams with numeric samples
+RECORDED_STREAMS = ('eeg', 'mot', 'pow', 'met', 'dev')
+
+class StreamBuffer():
+    """
+    Fixed-size buffers of one stream. Full buffers are handed to the writer thread and come
+    back to the pool once written, so the memory of a recording does not grow with its length.
+    """
+    def __init__(self, stream_name, labels, rows, n_buffers):
+        self.stream_name = stream_name
+        self.labels = list(labels)
+        self.n_cols = len(labels)
+        self.rows = rows
+        self.pool = queue.Queue()
+        for _ in range(n_buffers):
+            self.pool.put((np.empty(rows, dtype=np.float64), np.empty((rows, self.n_cols), dtype=np.float64)))
+        self.times, self.values = self.pool.get()
+        self.count = 0
+        self.handed_at = time.monotonic()
+        self.total_rows = 0
+
+class StreamRecorder():
+    """
+    Records the subscribed streams to local files as the data arrives, without waiting for
+    the record of Cortex to be post-processed and exported.
+
+    Each stream is written in the format of stream_store.py: a sample matrix which can be
+    memory-mapped, a sparse time index and the labels, and the markers go to markers.jsonl.
+    Samples are copied into fixed-size buffers on the websocket thread and written by a
+    background thread, which calls fsync at most every fsync_interval_s.
+    The samples are stored as float64, except eeg from a source in block mode: its blocks are float32,
+    e.g. 4200.128 for 4200.128205, so eeg is stored as float32 and the per-sample precision is lost.
+    Use stream_store.RecordingReader or read_stream() to read the recording, also while recording.
+
+    With segment_s or segment_bytes, a long recording is split in segment folders: a segment is
+    written in segment-NNNNN.part, renamed to segment-NNNNN once closed and listed in manifest.json
+    with its streams, time ranges and file checksums. A crash loses at most the open segment, which
+    is renamed and listed as not complete when recording again in the same folder. Recording again
+    always starts a new segment, so the previous ones are never rewritten.
+
+    Attributes
+    ----------
+    folder : str
+        folder of the recording
+    streams : list
+        recorded streams, among eeg, mot, pow, met and dev
+    buffer_rows : int
+        number of samples per buffer and per chunk at most
+    n_buffers : int
+        number of buffers per stream. When the writer is late by all of them, the websocket
+        thread waits for a free buffer.
+    flush_interval_s : float
+        a buffer which is not full is written after this time, so the files stay up to date
+    fsync_interval_s : float
+        minimum time between two fsync of the files
+    segment_s : float
+        duration of a segment in seconds, None for no limit
+    segment_bytes : int
+        size of the samples of a segment, None for no limit. Segments close at a buffer boundary,
+        so they may be longer by up to buffer_rows samples.
+    clock_sync : ClockSync
+        optional host to Cortex time mapping of clock_sync.py. The times given to add_marker are
+        then host times, converted to the time of the samples.
+    """
+    def __init__(self, source, folder, streams=None, buffer_rows=1024, n_buffers=4,
+                 flush_interval_s=1.0, fsync_interval_s=5.0, segment_s=None, segment_bytes=None, clock_sync=None):
+        if buffer_rows <= 0 or n_buffers <= 0:
+            raise ValueError('buffer_rows and n_buffers must be positive.')
+
+        self.source = source
+        self.folder = folder
+        self.streams = list(streams) if streams is not None else list(RECORDED_STREAMS)
+        for stream_name in self.streams:
+            if stream_name not in RECORDED_STREAMS:
+                raise ValueError('The stream ' + stream_name + ' can not be recorded. It must be one of ' +
+                                 ', '.join(RECORDED_STREAMS))
+        self.buffer_rows = buffer_rows
+        self.n_buffers = n_buffers
+        self.flush_interval_s = flush_interval_s
+        self.fsync_interval_s = fsync_interval_s
+        self.segment_s = segment_s
+        self.segment_bytes = segment_bytes
+        self.segmented = segment_s is not None or segment_bytes is not None
+        self.clock_sync = clock_sync
+
+        self.buffers = {}
+        self.writers = {}
+        self.markers_file = None
+        self.stalls = 0
+        self.recording = False
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = None
+        self._last_fsync = 0.0
+        # state of the writer thread
+        self.segment_folder = folder
+        self.segment_index = 0
+        self.segment_start = None
+        self.manifest = None
+        self.writer_labels = {}
+        self.writer_dtypes = {}
+
+    def start(self):
+        """
+        To start recording. The labels of a stream come with its new_data_labels event, so start
+        before subscribing, or pass the labels already known with set_labels().
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        if self.segmented:
+            self.resume_segments()
+            self.open_segment()
+        self.recording = True
+        self._writer = threading.Thread(target=self.run_writer, name='StreamRecorder', daemon=True)
+        self._writer.start()
+        self.source.bind(new_data_labels=self.on_new_data_labels)
+        self.source.bind(new_eeg_block=self.on_new_eeg_block)
+        self.source.bind(inject_marker_done=self.on_inject_marker_done)
+        for stream_name in self.streams:
+            self.source.bind(**{STREAM_EVENTS[stream_name]: getattr(self, 'on_new_' + stream_name + '_data')})
+
+    def stop(self):
+        """
+        To write the buffered samples, close the files and stop the writer thread
+        """
+        if not self.recording:
+            return
+        self.source.unbind(self.on_new_data_labels, self.on_new_eeg_block, self.on_inject_marker_done)
+        for stream_name in self.streams:
+            self.source.unbind(getattr(self, 'on_new_' + stream_name + '_data'))
+
+        with self._lock:
+            self.recording = False
+            for buffer in self.buffers.values():
+                self.hand_off(buffer)
+        self._queue.put(None)
+        self._writer.join()
+
+    def set_labels(self, stream_name, labels):
+        with self._lock:
+            buffer = self.buffers.get(stream_name)
+            if buffer is not None and buffer.labels == list(labels):
+                return
+            if buffer is not None:
+                # new columns, e.g. another headset: the samples go to a new file
+                self.hand_off(buffer)
+                self._queue.put(('close', stream_name))
+            self.buffers[stream_name] = StreamBuffer(stream_name, labels, self.buffer_rows, self.n_buffers)
+            self._queue.put(('open', stream_name, list(labels), self.stream_dtype(stream_name)))
+
+    def stream_dtype(self, stream_name):
+        """
+        The blocks of Cortex.set_eeg_block_mode() are float32, so eeg is stored as float32 when the
+        source is in block mode as its labels arrive: float64 would only add rounding digits.
+        """
+        if stream_name == 'eeg' and getattr(self.source, 'eeg_block', None) is not None:
+            return 'float32'
+        return 'float64'
+
+    def on_new_data_labels(self, *args, **kwargs):
+        data = kwargs.get('data')
+        if data['streamName'] in self.streams:
+            self.set_labels(data['streamName'], data['labels'])
+
+    def add_marker(self, t, value, label, **kwargs):
+        """
+        To add a marker at time t in epoch seconds, e.g. for an event which is not injected to Cortex
+        """
+        if self.clock_sync is not None and self.clock_sync.estimate() is not None:
+            kwargs['hostTime'] = t
+            t = self.clock_sync.to_cortex_time(t)
+        self.queue_marker(t, value, label, **kwargs)
+
+    def queue_marker(self, t, value, label, **kwargs):
+        marker = {'time': t, 'value': value, 'label': label}
+        marker.update(kwargs)
+        if self.recording:
+            self._queue.put(('marker', marker))
+
+    def on_inject_marker_done(self, *args, **kwargs):
+        data = kwargs.get('data')
+        # an injected marker keeps the time sent to Cortex
+        self.queue_marker(marker_time(data), data.get('value'), data.get('label'), markerId=data.get('uuid'))
+
+    def on_new_eeg_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        self.append('eeg', data['eeg'], data['time'])
+
+    def on_new_eeg_block(self, *args, **kwargs):
+        data = kwargs.get('data')
+        if 'eeg' not in self.streams:
+            return
+        for row, t in zip(data['eeg'], data['time']):
+            self.append('eeg', row, t)
+
+    def on_new_mot_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        self.append('mot', data['mot'], data['time'])
+
+    def on_new_pow_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        self.append('pow', data['pow'], data['time'])
+
+    def on_new_met_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        # None, e.g. a metric which is not active, is recorded as NaN
+        self.append('met', [np.nan if value is None else value for value in data['met']], data['time'])
+
+    def on_new_dev_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        self.append('dev', data['dev'], data['time'])
+
+    def append(self, stream_name, values, t):
+        with self._lock:
+            buffer = self.buffers.get(stream_name)
+            if buffer is None or not self.recording:
+                # no labels yet
+                return
+            if len(values) != buffer.n_cols:
+                return
+            buffer.times[buffer.count] = t
+            buffer.values[buffer.count] = values
+            buffer.count += 1
+            if buffer.count == buffer.rows or time.monotonic() - buffer.handed_at >= self.flush_interval_s:
+                self.hand_off(buffer)
+
+    def hand_off(self, buffer):
+        """
+        To queue the samples of a buffer for the writer and take a free buffer. Called with the lock held.
+        """
+        buffer.handed_at = time.monotonic()
+        if buffer.count == 0:
+            return
+        self._queue.put(('write', buffer.stream_name, buffer.times, buffer.values, buffer.count, buffer.pool))
+        buffer.total_rows += buffer.count
+        buffer.count = 0
+        try:
+            buffer.times, buffer.values = buffer.pool.get_nowait()
+        except queue.Empty:
+            self.stalls += 1
+            buffer.times, buffer.values = buffer.pool.get()
+
+    def run_writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if item[0] == 'open':
+                self.open_writer(item[1], item[2], item[3])
+            elif item[0] == 'close':
+                self.writers.pop(item[1]).close()
+                self.writer_labels.pop(item[1])
+                self.writer_dtypes.pop(item[1])
+            elif item[0] == 'marker':
+                self.write_marker(item[1])
+            else:
+                _, stream_name, times, values, count, pool = item
+                if self.segmented and self.segment_due(times[0]):
+                    self.close_segment()
+                    self.open_segment()
+                    for name, labels in self.writer_labels.items():
+                        self.open_writer(name, labels, self.writer_dtypes[name])
+                if self.segment_start is None:
+                    self.segment_start = times[0]
+                self.writers[stream_name].write(times[:count], values[:count])
+                pool.put((times, values))
+                if time.monotonic() - self._last_fsync >= self.fsync_interval_s:
+                    self.fsync()
+
+        if self.segmented:
+            self.close_segment()
+        else:
+            self.close_writers()
+
+    def close_writers(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+        if self.markers_file is not None:
+            self.markers_file.close()
+            self.markers_file = None
+
+    def resume_segments(self):
+        """
+        To read the manifest of the folder and list the segment left open by a crash, if any
+        """
+        self.manifest = read_manifest(self.folder) or {'segments': []}
+        names = [segment['name'] for segment in self.manifest['segments']]
+        for file_name in sorted(os.listdir(self.folder)):
+            if file_name.startswith('segment-') and file_name.endswith(PART_SUFFIX):
+                name = file_name[:-len(PART_SUFFIX)]
+                print('Recover the segment ' + name + ' of an interrupted recording')
+                os.replace(os.path.join(self.folder, file_name), os.path.join(self.folder, name))
+                self.manifest['segments'].append(describe_segment(self.folder, name, complete=False))
+                names.append(name)
+        self.manifest['segments'].sort(key=lambda segment: segment['name'])
+        write_manifest(self.folder, self.manifest)
+        self.segment_index = max([int(name.split('-')[1]) for name in names] + [0])
+
+    def open_segment(self):
+        self.segment_index += 1
+        self.segment_folder = os.path.join(self.folder, segment_name(self.segment_index) + PART_SUFFIX)
+        os.makedirs(self.segment_folder)
+        self.segment_start = None
+
+    def segment_due(self, t):
+        if self.segment_start is None:
+            return False
+        if self.segment_s is not None and t - self.segment_start >= self.segment_s:
+            return True
+        return self.segment_bytes is not None and sum(writer.size() for writer in self.writers.values()) >= self.segment_bytes
+
+    def close_segment(self):
+        """
+        To close the files of the segment, rename its folder and add it to the manifest
+        """
+        self.close_writers()
+        if self.segment_start is None and not os.path.exists(os.path.join(self.segment_folder, MARKERS_FILE)):
+            # no data
+            shutil.rmtree(self.segment_folder)
+            return
+        name = segment_name(self.segment_index)
+        os.replace(self.segment_folder, os.path.join(self.folder, name))
+        self.manifest['segments'].append(describe_segment(self.folder, name))
+        write_manifest(self.folder, self.manifest)
+        print('segment {0} closed --------------------------------'.format(name))
+
+    def open_writer(self, stream_name, labels, dtype='float64'):
+        # the nominal rate of eeg and mot is known from the headset, the others are measured
+        settings = getattr(self.source, 'headset_settings', {})
+        srate = settings.get('eegRate' if stream_name == 'eeg' else 'memsRate') if stream_name in ('eeg', 'mot') else None
+        self.writers[stream_name] = StreamWriter(self.segment_folder, stream_name, labels, srate, dtype=dtype)
+        self.writer_labels[stream_name] = list(labels)
+        self.writer_dtypes[stream_name] = dtype
+
+    def write_marker(self, marker):
+        if self.markers_file is None:
+            self.markers_file = open(os.path.join(self.segment_folder, MARKERS_FILE), 'a')
+        self.markers_file.write(json.dumps(marker) + '\n')
+        self.markers_file.flush()
+
+    def fsync(self):
+        for writer in self.writers.values():
+            writer.fsync()
+        self._last_fsync = time.monotonic()
+
+    def stats(self):
+        """
+        Returns
+        -------
+        stats: dict
+            samples recorded per stream, number of times the websocket thread waited for the writer
+            and number of the current segment
+        """
+        with self._lock:
+            rows = {stream_name: buffer.total_rows + buffer.count for stream_name, buffer in self.buffers.items()}
+        return {'rows': rows, 'stalls': self.stalls, 'queued': self._queue.qsize(), 'segment': self.segment_index}
+
+def read_stream(folder, stream_name):
+    """
+    To load a recorded stream. A sample which is not completely written yet is ignored.
+
+    Returns
+    -------
+    data: dict
+        'time': float64 array (n,), 'values': memory-mapped array (n, n_cols), 'labels': list.
+        The values are float64, or float32 for eeg recorded from the float32 blocks of the block mode.
+        The values of a segmented recording are a copy of the segments.
+    """
+    if read_manifest(folder) is None:
+        reader = StreamReader(folder, stream_name)
+        return {'time': reader.times(0, len(reader)), 'values': reader.data, 'labels': reader.labels}
+
+    readers = [reader.stream(stream_name) for segment, reader in RecordingReader(folder).segments
+               if stream_name in segment['streams']]
+    if len(readers) == 0:
+        raise ValueError('The stream ' + stream_name + ' is not recorded in ' + folder)
+    return {'time': np.concatenate([reader.times(0, len(reader)) for reader in readers]),
+            'values': np.concatenate([reader.data for reader in readers]), 'labels': readers[-1].labels}
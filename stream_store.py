@@ -0,0 +1,382 @@
+import datetime
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# one entry of the sparse time index: time of a sample and its row in the sample matrix
+INDEX_DTYPE = np.dtype([('time', '<f8'), ('row', '<i8')])
+
+# a sample further than this many sample periods from the previous one starts a new index entry
+GAP_PERIODS = 1.5
+
+SAMPLES_SUFFIX = '.samples'
+INDEX_SUFFIX = '.tindex'
+META_SUFFIX = '.json'
+MARKERS_FILE = 'markers.jsonl'
+MANIFEST_FILE = 'manifest.json'
+
+# a segment folder while it is written, renamed without the suffix once complete
+PART_SUFFIX = '.part'
+
+def stream_path(folder, stream_name, suffix):
+    return os.path.join(folder, stream_name + suffix)
+
+def marker_time(marker):
+    """
+    To read the time of a marker in epoch seconds, from epoch milliseconds as sent in
+    injectMarker or an ISO datetime as returned by Cortex
+    """
+    value = marker.get('startDatetime', marker.get('time'))
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value).timestamp()
+    value = float(value)
+    return value / 1000.0 if value > 1e11 else value
+
+def segment_name(index):
+    return 'segment-{:05d}'.format(index)
+
+def file_checksum(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return 'sha256:' + sha256.hexdigest()
+
+def read_manifest(folder):
+    """
+    Returns
+    -------
+    manifest: dict or None
+        {'segments': [...]} of a segmented recording, None for a recording in one folder
+    """
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_manifest(folder, manifest):
+    # written next to the manifest and renamed, so the manifest is never incomplete
+    path = os.path.join(folder, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+def describe_segment(folder, name, complete=True):
+    """
+    To list the streams, time ranges and file checksums of a segment folder
+
+    Returns
+    -------
+    segment: dict
+        manifest entry of the segment
+    """
+    segment_folder = os.path.join(folder, name)
+    streams = {}
+    for file_name in sorted(os.listdir(segment_folder)):
+        if file_name.endswith(META_SUFFIX):
+            stream_name = file_name[:-len(META_SUFFIX)]
+            reader = StreamReader(segment_folder, stream_name)
+            times = reader.times(0, len(reader)) if len(reader) > 0 else []
+            streams[stream_name] = {'rows': len(reader), 'start': float(times[0]) if len(times) > 0 else None,
+                                    'end': float(times[-1]) if len(times) > 0 else None}
+    starts = [stream['start'] for stream in streams.values() if stream['start'] is not None]
+    ends = [stream['end'] for stream in streams.values() if stream['end'] is not None]
+    checksums = {file_name: file_checksum(os.path.join(segment_folder, file_name))
+                 for file_name in sorted(os.listdir(segment_folder))}
+    return {'name': name, 'complete': complete, 'start': min(starts) if starts else None,
+            'end': max(ends) if ends else None, 'streams': streams, 'files': checksums}
+
+def verify_manifest(folder):
+    """
+    To check the files of a segmented recording against the checksums of its manifest
+
+    Returns
+    -------
+    errors: list of str
+        the missing and modified files, empty if the recording is intact
+    """
+    errors = []
+    for segment in read_manifest(folder)['segments']:
+        for file_name, checksum in segment['files'].items():
+            path = os.path.join(folder, segment['name'], file_name)
+            if not os.path.exists(path):
+                errors.append(path + ' is missing')
+            elif file_checksum(path) != checksum:
+                errors.append(path + ' is modified')
+    return errors
+
+class StreamWriter():
+    """
+    Writes one stream in the store format of a recording folder:
+        <stream>.samples  the samples as a dtype matrix (rows, len(labels)), row-major, no header;
+                          float64, or float32 for samples which are float32 at the source
+        <stream>.tindex   sparse time index, INDEX_DTYPE entries: one every index_interval rows
+                          and one at each gap, so rows between two entries are srate apart
+        <stream>.json     labels, srate and number of rows
+    """
+    def __init__(self, folder, stream_name, labels, srate=None, index_interval=128, dtype='float64'):
+        self.folder = folder
+        self.stream_name = stream_name
+        self.labels = list(labels)
+        self.dtype = np.dtype(dtype)
+        self.srate = srate
+        self.index_interval = index_interval
+        self.rows = 0
+        self.first_time = None
+        self.last_time = None
+
+        paths = [stream_path(folder, stream_name, suffix) for suffix in (SAMPLES_SUFFIX, INDEX_SUFFIX, META_SUFFIX)]
+        if any(os.path.exists(path) for path in paths):
+            # keep the samples of a previous recording, or with other labels, under another name
+            suffix = '.{:%Y%m%d%H%M%S}'.format(datetime.datetime.now())
+            for path in paths:
+                if os.path.exists(path):
+                    os.replace(path, path + suffix)
+        self.samples_file = open(paths[0], 'wb')
+        # not buffered and written before the samples, so the samples on disk always have their time
+        self.index_file = open(paths[1], 'wb', buffering=0)
+        self.write_meta()
+
+    def write(self, times, values):
+        """
+        To append samples
+
+        Parameters
+        ----------
+        times : numpy array (n,)
+        values : numpy array (n, len(labels)), cast to the dtype of the stream
+        """
+        n = len(times)
+        if n == 0:
+            return
+        if self.srate is None and n > 1:
+            # nominal rate of the stream, e.g. for met whose rate depends on the license
+            self.srate = float(1.0 / np.median(np.diff(times)))
+            self.write_meta()
+
+        if self.srate is None:
+            index_rows = np.arange(n)
+        else:
+            previous = np.empty(n)
+            previous[0] = self.last_time if self.last_time is not None else -np.inf
+            previous[1:] = times[:-1]
+            gaps = (times - previous) > GAP_PERIODS / self.srate
+            rows = np.arange(self.rows, self.rows + n)
+            index_rows = np.flatnonzero(gaps | (rows % self.index_interval == 0))
+
+        if len(index_rows) > 0:
+            entries = np.empty(len(index_rows), dtype=INDEX_DTYPE)
+            entries['time'] = times[index_rows]
+            entries['row'] = self.rows + index_rows
+            self.index_file.write(entries.tobytes())
+
+        self.samples_file.write(np.ascontiguousarray(values, dtype=self.dtype).tobytes())
+        self.rows += n
+        if self.first_time is None:
+            self.first_time = float(times[0])
+        self.last_time = float(times[-1])
+
+    def size(self):
+        return self.rows * len(self.labels) * self.dtype.itemsize
+
+    def flush(self):
+        self.samples_file.flush()
+        self.index_file.flush()
+
+    def fsync(self):
+        self.flush()
+        os.fsync(self.samples_file.fileno())
+        os.fsync(self.index_file.fileno())
+
+    def close(self):
+        self.fsync()
+        self.samples_file.close()
+        self.index_file.close()
+        self.write_meta()
+
+    def write_meta(self):
+        with open(stream_path(self.folder, self.stream_name, META_SUFFIX), 'w') as f:
+            json.dump({'streamName': self.stream_name, 'labels': self.labels, 'dtype': self.dtype.name,
+                       'srate': self.srate, 'rows': self.rows, 'indexInterval': self.index_interval}, f, indent=4)
+
+class StreamReader():
+    """
+    Reads a stream of a recording folder. The samples are memory-mapped and a time window is
+    found with a binary search of the sparse time index, so reading a window does not depend
+    on the length of the recording.
+
+    Attributes
+    ----------
+    labels : list
+        column names
+    srate : float
+        nominal sampling rate
+    data : numpy.memmap (rows, len(labels))
+        all samples, read-only, with the dtype of the stream
+    """
+    def __init__(self, folder, stream_name):
+        with open(stream_path(folder, stream_name, META_SUFFIX)) as f:
+            meta = json.load(f)
+        self.stream_name = stream_name
+        self.labels = meta['labels']
+        self.srate = meta['srate']
+        n_cols = len(self.labels)
+        # float32 for eeg recorded from float32 blocks
+        dtype = np.dtype(meta.get('dtype', 'float64'))
+
+        samples_path = stream_path(folder, stream_name, SAMPLES_SUFFIX)
+        # a row which is not completely written yet is ignored
+        rows = os.path.getsize(samples_path) // (dtype.itemsize * n_cols)
+        if rows > 0:
+            self.data = np.memmap(samples_path, dtype=dtype, mode='r', shape=(rows, n_cols))
+        else:
+            self.data = np.empty((0, n_cols), dtype=dtype)
+
+        index = np.fromfile(stream_path(folder, stream_name, INDEX_SUFFIX), dtype=INDEX_DTYPE)
+        index = index[index['row'] < rows]
+        if len(index) == 0 and rows > 0:
+            # samples of an interrupted recording without their time
+            rows = 0
+            self.data = np.empty((0, n_cols), dtype=dtype)
+        self.index_times = index['time']
+        self.index_rows = index['row']
+
+    def __len__(self):
+        return len(self.data)
+
+    def row_at(self, t):
+        """
+        Returns
+        -------
+        row: int
+            row of the first sample at or after time t
+        """
+        k = int(np.searchsorted(self.index_times, t, side='right')) - 1
+        if k < 0:
+            return 0
+        end_row = self.index_rows[k + 1] if k + 1 < len(self.index_rows) else len(self.data)
+        if self.srate is None:
+            return int(end_row if t > self.index_times[k] else self.index_rows[k])
+        # rows between two index entries are evenly spaced by 1 / srate
+        offset = int(np.ceil((t - self.index_times[k]) * self.srate - 1e-6))
+        return int(min(self.index_rows[k] + offset, end_row))
+
+    def times(self, start_row, end_row):
+        """
+        Returns
+        -------
+        times: numpy array
+            times of the samples of rows start_row to end_row, from the time index
+        """
+        rows = np.arange(start_row, end_row)
+        k = np.searchsorted(self.index_rows, rows, side='right') - 1
+        if self.srate is None:
+            return self.index_times[k]
+        return self.index_times[k] + (rows - self.index_rows[k]) / self.srate
+
+    def channel_selector(self, channels):
+        if channels is None:
+            return slice(None)
+        if isinstance(channels, (slice, int)):
+            return channels
+        columns = [self.labels.index(channel) if isinstance(channel, str) else channel for channel in channels]
+        if columns == list(range(columns[0], columns[-1] + 1)):
+            # contiguous columns keep the result a view
+            return slice(columns[0], columns[-1] + 1)
+        return columns
+
+    def window(self, t0, t1, channels=None):
+        """
+        To read the samples from time t0 included to t1 excluded
+
+        Parameters
+        ----------
+        channels : optional
+            None for all columns, a slice, or a list of labels or column numbers.
+            The result is a view of the file unless the columns are not contiguous.
+
+        Returns
+        -------
+        data: numpy array (n, n_channels)
+        """
+        return self.data[self.row_at(t0):self.row_at(t1), self.channel_selector(channels)]
+
+class RecordingReader():
+    """
+    Reads a recording folder: its streams and its markers.
+
+    For example the windows of 2 seconds after each marker:
+        reader = RecordingReader(folder)
+        for marker, window in reader.marker_windows('eeg', 0, 2, ['AF3', 'AF4']):
+            ...
+
+    A segmented recording is read through its manifest: a window which spans two segments
+    is a copy of their samples instead of a view.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.streams = {}
+        self.markers = []
+        self.segments = []
+        manifest = read_manifest(folder)
+        if manifest is not None:
+            for segment in manifest['segments']:
+                reader = RecordingReader(os.path.join(folder, segment['name']))
+                self.segments.append((segment, reader))
+                self.markers.extend(reader.markers)
+
+        markers_path = os.path.join(folder, MARKERS_FILE)
+        if os.path.exists(markers_path):
+            with open(markers_path) as f:
+                for line in f:
+                    try:
+                        self.markers.append(json.loads(line))
+                    except ValueError:
+                        # the last line may be incomplete
+                        break
+        self.markers.sort(key=lambda marker: marker['time'])
+
+    def stream(self, stream_name):
+        reader = self.streams.get(stream_name)
+        if reader is None:
+            reader = StreamReader(self.folder, stream_name)
+            self.streams[stream_name] = reader
+        return reader
+
+    def window(self, stream_name, t0, t1, channels=None):
+        if len(self.segments) == 0:
+            return self.stream(stream_name).window(t0, t1, channels)
+        parts = []
+        empty = None
+        for segment, reader in self.segments:
+            stream = segment['streams'].get(stream_name)
+            if stream is None or stream['start'] is None:
+                continue
+            if stream['end'] < t0 or stream['start'] >= t1:
+                if empty is None:
+                    # no samples, with the columns of the stream
+                    empty = reader.window(stream_name, t0, t0, channels)
+                continue
+            parts.append(reader.window(stream_name, t0, t1, channels))
+        if len(parts) == 0:
+            if empty is None:
+                raise ValueError('The stream ' + stream_name + ' is not recorded in ' + self.folder)
+            return empty
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def marker_windows(self, stream_name, before_s, after_s, channels=None, label=None):
+        """
+        Returns
+        -------
+        windows: generator of (marker, data)
+            data from before_s seconds before to after_s seconds after each marker, optionally of one label
+        """
+        for marker in self.markers:
+            if label is not None and marker.get('label') != label:
+                continue
+            yield marker, self.window(stream_name, marker['time'] - before_s, marker['time'] + after_s, channels)
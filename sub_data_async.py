@@ -0,0 +1,56 @@
+import asyncio
+
+from async_cortex import AsyncCortex
+
+async def subscribe(app_client_id, app_client_secret, streams, headsetId='', **kwargs):
+    """
+    To subscribe data streams with AsyncCortex as below workflow
+    (1) check access right -> authorize -> connect headset->create session
+    (2) subscribe streams data and print them as they arrive
+
+    Parameters
+    ----------
+    streams : list, required
+        list of streams. For example, ['eeg', 'mot']
+    headsetId: string , optional
+         id of wanted headet which you want to work with it.
+         If the headsetId is empty, the first headset in list will be set as wanted headset
+    """
+    async with AsyncCortex(app_client_id, app_client_secret, debug_mode=True, headset_id=headsetId, **kwargs) as c:
+        await c.do_prepare_steps()
+
+        # start consuming before subscribing so that no frame is missed
+        data_stream = c.stream(*streams)
+        await c.sub_request(streams)
+        for stream_name, labels in c.data_labels.items():
+            print('{} labels are : {}'.format(stream_name, labels))
+
+        async for stream_name, data in data_stream:
+            print('{} data: {}'.format(stream_name, data))
+
+# -----------------------------------------------------------
+#
+# GETTING STARTED
+#   - Please reference to https://emotiv.gitbook.io/cortex-api/ first.
+#   - Connect your headset with dongle or bluetooth. You can see the headset via Emotiv Launcher
+#   - Please make sure the your_app_client_id and your_app_client_secret are set before starting running.
+#   - In the case you borrow license from others, you need to add license = "xxx-yyy-zzz" as init parameter
+# RESULT
+#   - the same data as sub_data.py, consumed on one asyncio event loop
+#
+# -----------------------------------------------------------
+
+def main():
+
+    # Please fill your application clientId and clientSecret before running script
+    your_app_client_id = ''
+    your_app_client_secret = ''
+
+    # list data streams
+    streams = ['eeg','mot','met','pow']
+    asyncio.run(subscribe(your_app_client_id, your_app_client_secret, streams))
+
+if __name__ =='__main__':
+    main()
+
+# -----------------------------------------------------------
@@ -0,0 +1,61 @@
+import unittest
+from concurrent.futures import Future
+
+from export_manager import ExportManager
+
+class FakeCortex():
+    """
+    Records the exportRecord requests, and fails them at once or answers them from a list of results.
+    """
+    def __init__(self, error=None, results=None):
+        self.error = error
+        self.results = list(results or [])
+        self.requests = []
+
+    def bind(self, **kwargs):
+        pass
+
+    def export_record(self, folder, stream_types, export_format, record_ids, version, **kwargs):
+        self.requests.append(list(record_ids))
+        if self.error is not None:
+            raise self.error
+        future = Future()
+        future.set_result(self.results.pop(0))
+        return future
+
+class TestExportManager(unittest.TestCase):
+    def test_export_record_raises(self):
+        cortex = FakeCortex(error=ConnectionError('connection lost'))
+        manager = ExportManager(cortex, '/tmp', ['EEG'], 'CSV', batch_size=2, max_retries=1, retry_delay_s=0.01)
+        result = manager.add_records(['r1', 'r2', 'r3'], post_processed=True).result(timeout=5)
+        self.assertEqual(result['exported'], [])
+        self.assertEqual(sorted(result['failed']), ['r1', 'r2', 'r3'])
+        # every record is sent once, then retried once
+        self.assertEqual(sum(len(batch) for batch in cortex.requests), 6)
+
+    def test_response_already_done(self):
+        cortex = FakeCortex(results=[{'success': [{'recordId': 'r1'}], 'failure': [{'recordId': 'r2', 'message': 'busy'}]},
+                                     {'success': [{'recordId': 'r2'}], 'failure': []}])
+        manager = ExportManager(cortex, '/tmp', ['EEG'], 'CSV', batch_size=2, retry_delay_s=0.01)
+        result = manager.add_records(['r1', 'r2'], post_processed=True).result(timeout=5)
+        self.assertEqual(sorted(result['exported']), ['r1', 'r2'])
+        self.assertEqual(result['failed'], {})
+        self.assertEqual(cortex.requests, [['r1', 'r2'], ['r2']])
+
+    def test_no_records(self):
+        manager = ExportManager(FakeCortex(), '/tmp', ['EEG'], 'CSV')
+        result = manager.add_records([], post_processed=True).result(timeout=1)
+        self.assertEqual(result, {'exported': [], 'failed': {}})
+
+    def test_records_added_after_done(self):
+        cortex = FakeCortex(results=[{'success': [{'recordId': 'r1'}], 'failure': []},
+                                     {'success': [{'recordId': 'r2'}], 'failure': []}])
+        manager = ExportManager(cortex, '/tmp', ['EEG'], 'CSV', batch_delay_s=0.01)
+        first = manager.add_records(['r1'], post_processed=True)
+        self.assertEqual(first.result(timeout=5)['exported'], ['r1'])
+        second = manager.add_records(['r2'], post_processed=True)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.result(timeout=5)['exported'], ['r2'])
+
+if __name__ == '__main__':
+    unittest.main()